@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import sys
+
+from calvin.utilities import trace_recorder
+
+
+def parse_arguments():
+    long_description = """
+Convert calvin runtime trace dumps (POST /trace/dump) to Chrome trace event JSON,
+viewable in chrome://tracing.
+  """
+
+    argparser = argparse.ArgumentParser(description=long_description)
+
+    argparser.add_argument('files', metavar='<filenames>', type=str, nargs='+',
+                           default=[], help='trace dumps, one per runtime')
+
+    argparser.add_argument('-o', '--output', dest='output', type=str, default=None,
+                           help='Output file, default stdout')
+
+    return argparser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    dumps = [trace_recorder.load(name) for name in args.files]
+    trace = trace_recorder.chrome_trace(dumps)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(trace, f)
+    else:
+        json.dump(trace, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
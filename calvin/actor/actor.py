@@ -21,6 +21,7 @@ from calvin.utilities import calvinuuid
 from calvin.utilities.security import Security
 from calvin.actor import actorport
 from calvin.utilities.calvinlogger import get_logger
+from calvin.utilities import trace_recorder
 from calvin.utilities.utils import enum
 from calvin.runtime.north.calvin_token import Token, ExceptionToken
 # from calvin.runtime.north import calvincontrol
@@ -33,6 +34,7 @@ from calvin.utilities.calvin_callback import CalvinCB
 from calvin.csparser.port_property_syntax import get_port_property_capabilities, get_port_property_runtime
 
 _log = get_logger(__name__)
+_trace = trace_recorder.get()
 
 
 # Tests in test_manage_decorator.py
@@ -146,6 +148,8 @@ def condition(action_input=[], action_output=[]):
 
             return (True, True, exhausted_ports)
 
+        condition_wrapper.action_input = tuple(action_input)
+        condition_wrapper.action_output = tuple(action_output)
         return condition_wrapper
     return wrap
 
@@ -304,6 +308,11 @@ class Actor(object):
         self.authorization_checks = None
         self._replication_data = ReplicationData(initialize=False)
         self._exhaust_cb = None
+        # Total number of NACKs on the inport endpoints, changes only on NACKs
+        self.pressure_count = 0
+        # Firings and seconds spent per action in action_priority order, collected by metering
+        self.fire_counts = [0] * len(self.__class__.action_priority)
+        self.fire_times = [0.0] * len(self.__class__.action_priority)
 
         self.inports = {p: actorport.InPort(p, self, pp) for p, pp in self.inport_properties.items()}
         self.outports = {p: actorport.OutPort(p, self, pp) for p, pp in self.outport_properties.items()}
@@ -437,15 +446,37 @@ class Actor(object):
         self._exhaust_cb = callback
 
     def get_pressure(self):
+        """ Returns {(port_id, peer_id): (NACK count, sequence number of last NACK)} for the inport endpoints,
+            use pressure_count to check for changes.
+        """
         pressure = {}
         for port in self.inports.values():
             for e in port.endpoints:
-                PRESSURE_LENGTH = len(e.pressure)
-                pressure[(port.id, e.peer_id)] = (
-                    e.pressure_last, e.pressure_count, [e.pressure[t % PRESSURE_LENGTH] for t in range(
-                                        max(0, e.pressure_count - PRESSURE_LENGTH), e.pressure_count)])
+                pressure[(port.id, e.peer_id)] = (e.pressure_count, e.pressure_last)
         return pressure
 
+    def get_queue_load(self):
+        """ Returns {port_id: (tokens written, tokens read, capacity)} for the inport queues,
+            the positions are monotonically increasing.
+        """
+        load = {}
+        for port in self.inports.values():
+            q = port.queue
+            try:
+                if isinstance(q.write_pos, dict):
+                    # Collect queues have a FIFO per writer
+                    written = sum(q.write_pos.values())
+                    read = sum(q.read_pos.values())
+                    capacity = (q.N - 1) * len(q.write_pos)
+                else:
+                    written = q.write_pos
+                    read = min(q.read_pos.values()) if q.read_pos else written
+                    capacity = q.N - 1
+            except AttributeError:
+                continue
+            load[port.id] = (written, read, capacity)
+        return load
+
     #
     # FIXME: The following methods (_authorized, _warn_slow_actor, _handle_exhaustion) were
     #        extracted from fire() to make the logic easier to follow
@@ -500,21 +531,21 @@ class Actor(object):
             return False
 
         start_time = time.time()
+        last_time = start_time
         actor_did_fire = False
         #
         # Repeatedly go over the action priority list
         #
         done = False
         while not done:
-            for action_method in self.__class__.action_priority:
+            for index, action_method in enumerate(self.__class__.action_priority):
                 did_fire, output_ok, exhausted = action_method(self)
                 actor_did_fire |= did_fire
                 # Action firing should fire the first action that can fire,
                 # hence when fired start from the beginning priority list
                 if did_fire:
-                    # # FIXME: Add hooks for metering and probing
-                    # self.metering.fired(self._id, action_method.__name__)
-                    # self.control.log_actor_firing( ... )
+                    # Only count here, metering collects the counts periodically
+                    self.fire_counts[index] += 1
                     break
 
             #
@@ -525,8 +556,12 @@ class Actor(object):
                 # Limit time given to actors even if it could continue a new round of firing
                 #
                 # FIXME: IMHO this decision should be made in the scheduler. No timing here.
-                time_spent = time.time() - start_time
-                done = time_spent > 0.020
+                now = time.time()
+                self.fire_times[index] += now - last_time
+                if _trace.enabled:
+                    _trace.record(trace_recorder.FIRING, self._id, action_method.__name__, last_time, now - last_time)
+                last_time = now
+                done = now - start_time > 0.020
             else:
                 #
                 # We reached the end of the list without ANY firing during this round
@@ -15,21 +15,26 @@
 # limitations under the License.
 
 import json
+import threading
 import requests
 import inspect
 
 from functools import partial
 from requests import Response
+from requests.adapters import HTTPAdapter
 
 try:
-    from requests_futures.sessions import FuturesSession
-    session = FuturesSession(max_workers=10)
+    from concurrent.futures import ThreadPoolExecutor, as_completed
 except:
-    session = None
+    ThreadPoolExecutor = None
 
 from calvin.utilities.calvinlogger import get_logger
 
 DEFAULT_TIMEOUT = 5
+# Keep-alive connections kept per runtime
+POOL_SIZE = 10
+# Requests in flight for async requests and pipeline
+MAX_CONCURRENT = 10
 
 _log = get_logger(__name__)
 
@@ -49,6 +54,7 @@ APPLICATION_PATH = '/application/{}'
 APPLICATION_MIGRATE = '/application/{}/migrate'
 ACTOR_PORT = '/actor/{}/port/{}'
 ACTOR_REPORT = '/actor/{}/report'
+ACTOR_PRESSURE = '/actor/{}/pressure'
 SET_PORT_PROPERTY = '/set_port_property'
 APPLICATIONS = '/applications'
 DEPLOY = '/deploy'
@@ -61,6 +67,13 @@ METER_PATH = '/meter/{}'
 METER_PATH_TIMED = '/meter/{}/timed'
 METER_PATH_AGGREGATED = '/meter/{}/aggregated'
 METER_PATH_METAINFO = '/meter/{}/metainfo'
+METRICS = '/metrics'
+METRICS_SUMMARY = '/metrics/summary'
+TRACE_DUMP = '/trace/dump'
+QUERY = '/query/{}'
+RUNTIME_SNAPSHOT = '/runtime/snapshot'
+PROFILER = '/profiler'
+PROFILER_TOP = '/profiler/{}'
 CSR_REQUEST = '/certificate_authority/certificate_signing_request'
 AUTHENTICATION = '/authentication'
 AUTHENTICATION_USERS_DB = '/authentication/users_db'
@@ -80,10 +93,46 @@ class RT(object):
 
 class RequestHandler(object):
 
-    def __init__(self,verify=None):
+    def __init__(self, verify=None, pool_size=POOL_SIZE, max_concurrent=MAX_CONCURRENT):
         self.future_responses = []
         self.verify=verify
         self.credentials = None
+        self.pool_size = pool_size
+        self.max_concurrent = max_concurrent
+        # control uri: session, connections are kept alive and reused between requests to a runtime
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self._executor = None
+
+    def _session(self, control_uri):
+        session = self._sessions.get(control_uri)
+        if session is None:
+            with self._sessions_lock:
+                session = self._sessions.get(control_uri)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[control_uri] = session
+        return session
+
+    def _submit(self, func, *args, **kwargs):
+        if self._executor is None:
+            if ThreadPoolExecutor is None:
+                raise Exception("Async requests need the futures package")
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent)
+        return self._executor.submit(func, *args, **kwargs)
+
+    def close(self):
+        """ Close the kept connections and stop the async workers """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
 
     def set_credentials(self, credentials):
         if ('user' in credentials) and ('password' in credentials):
@@ -117,33 +166,30 @@ class RequestHandler(object):
             self.future_responses.append(response)
             return response
 
-    def _send(self, rt, timeout, send_func, path, data=None):
+    def _send(self, rt, timeout, async, method, path, data=None):
         rt = get_runtime(rt)
-        _log.debug("Sending request %s, %s, %s", send_func, rt.control_uri + path, json.dumps(data))
-        if self.verify and data is not None:
-            return send_func(rt.control_uri + path, timeout=timeout, data=json.dumps(data), auth=self.credentials, verify=self.verify)
-        elif self.verify and data is None:
-            return send_func(rt.control_uri + path, timeout=timeout, auth=self.credentials, verify=self.verify)
-        elif data is not None:
-            return send_func(rt.control_uri + path, timeout=timeout, data=json.dumps(data), auth=self.credentials)
-        else:
-            return send_func(rt.control_uri + path, timeout=timeout, auth=self.credentials)
+        _log.debug("Sending request %s, %s, %s", method, rt.control_uri + path, json.dumps(data))
+        send_func = getattr(self._session(rt.control_uri), method)
+        kwargs = {'timeout': timeout, 'auth': self.credentials}
+        if data is not None:
+            kwargs['data'] = json.dumps(data)
+        if self.verify:
+            kwargs['verify'] = self.verify
+        if async:
+            return self._submit(send_func, rt.control_uri + path, **kwargs)
+        return send_func(rt.control_uri + path, **kwargs)
 
     def _get(self, rt, timeout, async, path, headers="", data=None):
-        req = session if async else requests
-        return self._send(rt, timeout, req.get, path, data)
+        return self._send(rt, timeout, async, "get", path, data)
 
     def _post(self, rt, timeout, async, path, data=None):
-        req = session if async else requests
-        return self._send(rt, timeout, req.post, path, data)
+        return self._send(rt, timeout, async, "post", path, data)
 
     def _put(self, rt, timeout, async, path, data=None):
-        req = session if async else requests
-        return self._send(rt, timeout, req.put, path, data)
+        return self._send(rt, timeout, async, "put", path, data)
 
     def _delete(self, rt, timeout, async, path, data=None):
-        req = session if async else requests
-        return self._send(rt, timeout, req.delete, path, data)
+        return self._send(rt, timeout, async, "delete", path, data)
 
     def get_node_id(self, rt, timeout=DEFAULT_TIMEOUT, async=False):
         r = self._get(rt, timeout, async, NODE_ID)
@@ -198,6 +244,39 @@ class RequestHandler(object):
         r = self._post(rt, timeout, async, ACTOR, data)
         return self.check_response(r, key='actor_id')
 
+    def query(self, rt, kind, ids=None, fields=None, limit=None, cursor=None, timeout=DEFAULT_TIMEOUT, async=False):
+        """ One page of information on actors, ports, applications or nodes (kind),
+            returns dict with items and cursor for next page
+        """
+        data = {}
+        if ids is not None:
+            data['ids'] = ids
+        if fields is not None:
+            data['fields'] = fields
+        if limit is not None:
+            data['limit'] = limit
+        if cursor is not None:
+            data['cursor'] = cursor
+        r = self._post(rt, timeout, async, QUERY.format(kind), data=data)
+        return self.check_response(r)
+
+    def query_all(self, rt, kind, ids=None, fields=None, timeout=DEFAULT_TIMEOUT):
+        """ Information on all actors, ports, applications or nodes (kind) as dict of id: info,
+            fetched page by page
+        """
+        items = {}
+        cursor = None
+        while True:
+            r = self.query(rt, kind, ids=ids, fields=fields, cursor=cursor, timeout=timeout)
+            items.update(r['items'])
+            cursor = r['cursor']
+            if cursor is None:
+                return items
+
+    def get_runtime_snapshot(self, rt, timeout=DEFAULT_TIMEOUT, async=False):
+        r = self._get(rt, timeout, async, RUNTIME_SNAPSHOT)
+        return self.check_response(r)
+
     def get_actor(self, rt, actor_id, timeout=DEFAULT_TIMEOUT, async=False):
         r = self._get(rt, timeout, async, ACTOR_PATH.format(actor_id))
         return self.check_response(r)
@@ -241,8 +320,10 @@ class RequestHandler(object):
         r = self._post(rt, timeout, async, path)
         return self.check_response(r)
 
-    def migrate(self, rt, actor_id, dst_id, timeout=DEFAULT_TIMEOUT, async=False):
+    def migrate(self, rt, actor_id, dst_id, precopy=None, timeout=DEFAULT_TIMEOUT, async=False):
         data = {'peer_node_id': dst_id}
+        if precopy is not None:
+            data['precopy'] = precopy
         path = ACTOR_MIGRATE.format(actor_id)
         r = self._post(rt, timeout, async, path, data)
         return self.check_response(r)
@@ -306,6 +387,10 @@ class RequestHandler(object):
             r = self._get(rt, timeout, async, path)
         return self.check_response(r)
 
+    def get_actor_pressure(self, rt, actor_id, timeout=DEFAULT_TIMEOUT, async=False):
+        r = self._get(rt, timeout, async, ACTOR_PRESSURE.format(actor_id))
+        return self.check_response(r)
+
     def get_applications(self, rt, timeout=DEFAULT_TIMEOUT, async=False):
         r = self._get(rt, timeout, async, APPLICATIONS)
         return self.check_response(r)
@@ -367,6 +452,30 @@ class RequestHandler(object):
         r = self._get(rt, timeout, async, METER_PATH_METAINFO.format(user_id))
         return self.check_response(r)
 
+    def get_metrics(self, rt, timeout=DEFAULT_TIMEOUT, async=False):
+        r = self._get(rt, timeout, async, METRICS)
+        return self.check_response(r)
+
+    def get_metrics_summary(self, rt, timeout=DEFAULT_TIMEOUT, async=False):
+        r = self._get(rt, timeout, async, METRICS_SUMMARY)
+        return self.check_response(r)
+
+    def start_profiler(self, rt, window=0.0, timeout=DEFAULT_TIMEOUT, async=False):
+        r = self._post(rt, timeout, async, PROFILER, data={'window': window})
+        return self.check_response(r)
+
+    def stop_profiler(self, rt, timeout=DEFAULT_TIMEOUT, async=False):
+        r = self._delete(rt, timeout, async, PROFILER)
+        return self.check_response(r)
+
+    def get_profile(self, rt, top=10, timeout=DEFAULT_TIMEOUT, async=False):
+        r = self._get(rt, timeout, async, PROFILER_TOP.format(top))
+        return self.check_response(r)
+
+    def dump_trace(self, rt, timeout=DEFAULT_TIMEOUT, async=False):
+        r = self._post(rt, timeout, async, TRACE_DUMP)
+        return self.check_response(r)
+
     def add_index(self, rt, index, value, timeout=DEFAULT_TIMEOUT, async=False):
         data = {'value': value}
         path = INDEX_PATH.format(index)
@@ -418,6 +527,34 @@ class RequestHandler(object):
         if exceptions:
             raise Exception(max(exceptions))
 
+    def pipeline(self, operations, max_concurrent=None):
+        """
+        Run operations, callables doing requests e.g. partial(request_handler.get_actor, rt, actor_id),
+        with at most max_concurrent (default the handler's max_concurrent) in flight.
+        Yields (index of operation, result, exception) as they complete, exception is None on success.
+        """
+        if ThreadPoolExecutor is None:
+            raise Exception("Pipelined requests need the futures package")
+        executor = ThreadPoolExecutor(max_workers=max_concurrent or self.max_concurrent)
+        try:
+            futures = {executor.submit(operation): index for index, operation in enumerate(operations)}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+        finally:
+            executor.shutdown(wait=False)
+
+    def pipeline_results(self, operations, max_concurrent=None):
+        """ Results of operations run as in pipeline, in order of operations, raises the first failure """
+        results = {}
+        for index, result, exception in self.pipeline(operations, max_concurrent):
+            if exception is not None:
+                raise exception
+            results[index] = result
+        return [results[i] for i in range(len(results))]
+
     def __getattr__(self, name):
         if name.startswith("async_"):
             func = name[6:]
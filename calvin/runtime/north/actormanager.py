@@ -14,20 +14,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import random
 from calvin.actorstore.store import ActorStore
 from calvin.utilities import dynops
 from calvin.utilities.requirement_matching import ReqMatch
 from calvin.runtime.south.plugins.async import async
 from calvin.utilities.calvinlogger import get_logger
+from calvin.utilities import calvinconfig
+from calvin.utilities import trace_recorder
 from calvin.utilities.calvin_callback import CalvinCB
 import calvin.requests.calvinresponse as response
 from calvin.utilities.security import Security, security_enabled
 from calvin.actor.actor import ShadowActor
 from calvin.runtime.north.plugins.port import DISCONNECT
+from calvin.runtime.north.plugins.port.queue.common import QueueNone
 
 
 _log = get_logger(__name__)
+_conf = calvinconfig.get()
+_trace = trace_recorder.get()
 
 
 def log_callback(reply, **kwargs):
@@ -43,6 +49,13 @@ class ActorManager(object):
         super(ActorManager, self).__init__()
         self.actors = {}
         self.node = node
+        # Pre-copied migration sends the state to the peer, which validates it, while the actor keeps running
+        self.migration_precopy = _conf.get(None, 'migration_precopy') or False
+        self.precopy_timeout = _conf.get(None, 'migration_precopy_timeout') or 5.0
+        # Outgoing pre-copies, actor_id: timeout
+        self._precopies = {}
+        # Incoming pre-copies, actor_id: {'state': state, 'kwargs': kwargs to new, 'timeout': timeout}
+        self._prepared = {}
 
     def _actor_not_found(self, actor_id):
         _log.exception("Actor '{}' not found".format(actor_id))
@@ -79,6 +92,7 @@ class ActorManager(object):
         a.signature_set(signature)
 
         self.actors[a.id] = a
+        self.node.metering.add_actor_info(a)
 
         self.node.storage.add_actor(a, self.node.id)
 
@@ -141,16 +155,60 @@ class ActorManager(object):
         return a
 
     def new_from_migration(self, actor_type, state, prev_connections=None, callback=None):
-        """Instantiate an actor of type 'actor_type' and apply the 'state' to the actor."""
-        try:
-            _log.analyze(self.node.id, "+", state)
-            subject_attributes = state.pop('_subject_attributes', None)
-            migration_info = state.pop('_migration_info', None)
+        """Instantiate an actor of type 'actor_type' and apply the 'state' to the actor.
+           A state with '_precopy' set only contains the changes to the state given to prepare_migration.
+        """
+        if state.pop('_precopy', False):
+            prepared = self._prepared.pop(state['_id'], None)
+            if prepared is None:
+                # Expired, the peer will send the full state
+                if callback:
+                    callback(status=response.CalvinResponse(response.NOT_FOUND), actor_id=state['_id'])
+                return
+            prepared['timeout'].cancel()
+            prepared['state'].update(state)
+            self._pop_migration_attributes(prepared['state'])
+            self.new(actor_type, None, prepared['state'], prev_connections, callback=callback, **prepared['kwargs'])
+            return
+        self._verify_migration(actor_type, state, CalvinCB(self.new, actor_type, None,
+                                                           state, prev_connections,
+                                                           callback=callback))
+
+    def prepare_migration(self, actor_type, state, callback=None):
+        """ Prepare a pre-copied migration with a copy of the actor's state, while the actor is still running
+            on the peer the actor type is looked up and the requirements and security policy checked.
+        """
+        actor_id = state['_id']
+        self._drop_prepared(actor_id)
+        self._verify_migration(actor_type, state, CalvinCB(self._migration_prepared, actor_id, state,
+                                                           callback=callback))
+
+    def _migration_prepared(self, actor_id, state, callback=None, **kwargs):
+        timeout = async.DelayedCall(self.precopy_timeout * 2, self._drop_prepared, actor_id)
+        self._prepared[actor_id] = {'state': state, 'kwargs': kwargs, 'timeout': timeout}
+        if callback:
+            callback(status=response.CalvinResponse(True))
+
+    def _drop_prepared(self, actor_id):
+        prepared = self._prepared.pop(actor_id, None)
+        if prepared:
+            prepared['timeout'].cancel()
+
+    def _pop_migration_attributes(self, state):
+        subject_attributes = state.pop('_subject_attributes', None)
+        migration_info = state.pop('_migration_info', None)
+        for attr in ('_subject_attributes', '_migration_info'):
             try:
-                state['_managed'].remove('_subject_attributes')
-                state['_managed'].remove('_migration_info')
+                state['_managed'].remove(attr)
             except:
                 pass
+        return subject_attributes, migration_info
+
+    def _verify_migration(self, actor_type, state, callback):
+        """ Verify a migrating actor, callback with the keyword arguments for new """
+        try:
+            _log.analyze(self.node.id, "+", state)
+            subject_attributes, migration_info = self._pop_migration_attributes(state)
             if security_enabled():
                 security = Security(self.node)
                 security.set_subject_attributes(subject_attributes)
@@ -160,14 +218,61 @@ class ActorManager(object):
             requirements = actor_def.requires if hasattr(actor_def, "requires") else []
             self.check_requirements_and_sec_policy(requirements, security, state['_id'],
                                                    signer, migration_info,
-                                                   CalvinCB(self.new, actor_type, None,
-                                                            state, prev_connections,
-                                                            callback=callback,
+                                                   CalvinCB(callback,
                                                             actor_def=actor_def,
                                                             security=security))
         except Exception:
             # Still want to create shadow actor.
-            self.new(actor_type, None, state, prev_connections, callback=callback, shadow_actor=True)
+            callback(shadow_actor=True)
+
+    def new_group_from_migration(self, actors, callback=None):
+        """ Instantiate a group of migrated actors, all are created before any is connected
+            so that the connections between them are made locally.
+            actors: list of dicts with actor_type, actor_state and prev_connections
+            callback is called once with status, data lists the ids of the actors not created
+        """
+        group = {'pending': len(actors), 'connections': [], 'failed': [],
+                 'status': response.CalvinResponse(True), 'callback': callback}
+        if not actors:
+            self._group_connected(group, status=response.CalvinResponse(True))
+            return
+        for a in actors:
+            self._verify_migration(a['actor_type'], a['actor_state'],
+                                   CalvinCB(self._group_member_verified, group, a['actor_type'],
+                                            a['actor_state'], a['prev_connections']))
+
+    def _group_member_verified(self, group, actor_type, state, prev_connections, **kwargs):
+        try:
+            actor_id = self.new(actor_type, None, state, **kwargs)
+            connection_list = self._prev_connections_to_connection_list(prev_connections)
+            if connection_list:
+                group['connections'].append((actor_id, connection_list))
+        except Exception:
+            _log.exception("Group migration of %s failed" % state['_id'])
+            group['failed'].append(state['_id'])
+        group['pending'] -= 1
+        if group['pending'] > 0:
+            return
+        # All created, now connect
+        if not group['connections']:
+            self._group_connected(group, status=response.CalvinResponse(True))
+            return
+        group['pending'] = len(group['connections'])
+        for actor_id, connection_list in group['connections']:
+            self.connect(actor_id, connection_list, callback=CalvinCB(self._group_connected, group))
+
+    def _group_connected(self, group, status, **kwargs):
+        if not status:
+            group['status'] = status
+        group['pending'] -= 1
+        if group['pending'] > 0 or group['callback'] is None:
+            return
+        callback = group['callback']
+        group['callback'] = None
+        if group['failed']:
+            callback(status=response.CalvinResponse(response.INTERNAL_ERROR, data={'failed': group['failed']}))
+        else:
+            callback(status=group['status'])
 
     def _new_from_state(self, actor_type, state, actor_def, security,
                              access_decision=None, shadow_actor=False):
@@ -201,8 +306,10 @@ class ActorManager(object):
             self._actor_not_found(actor_id)
 
         # @TOOD - check order here
-        self.node.metering.remove_actor_info(actor_id)
         a = self.actors[actor_id]
+        # Don't miss the firings since last collected
+        self.node.metering.collect_actor(actor_id, a)
+        self.node.metering.remove_actor_info(actor_id)
         a.will_end()
         port_ids = self.node.pm.remove_ports_of_actor(a)
         # @TOOD - insert callback here
@@ -372,8 +479,11 @@ class ActorManager(object):
         kwargs['status'] = status
         self.robust_migrate(actor_id, node_ids, callback, **kwargs)
 
-    def migrate(self, actor_id, node_id, callback=None):
-        """ Migrate an actor actor_id to peer node node_id """
+    def migrate(self, actor_id, node_id, callback=None, precopy=None):
+        """ Migrate an actor actor_id to peer node node_id,
+            precopy (default from config) lets the peer validate a copy of the state while the actor
+            keeps running, the actor is still stopped while disconnecting, moving and reconnecting
+        """
         if actor_id not in self.actors:
             # Can only migrate actors from our node
             if callback:
@@ -387,10 +497,47 @@ class ActorManager(object):
             if callback:
                 callback(status=response.CalvinResponse(True))
             return
+        if actor_id in self._precopies:
+            # Already pre-copying
+            if callback:
+                callback(status=response.CalvinResponse(response.SERVICE_UNAVAILABLE))
+            return
+        if self.migration_precopy if precopy is None else precopy:
+            self._migrate_precopy(actor, node_id, callback)
+        else:
+            self._migrate(actor, node_id, callback)
+
+    def _migrate_precopy(self, actor, node_id, callback):
+        """ Let the peer prepare the actor from a copy of the state, continue when done or timeout """
+        actor._migrating_to = node_id
+        precopy = copy.deepcopy(actor.state())
+        # The peer's reply is given as a positional argument
+        cb = CalvinCB(self._migrate_precopied, actor, node_id, precopy, callback)
+        self._precopies[actor.id] = async.DelayedCall(self.precopy_timeout, cb,
+                                                      response.CalvinResponse(response.GATEWAY_TIMEOUT))
+        self.node.proto.actor_prepare(node_id, cb, actor._type, copy.deepcopy(precopy))
+
+    def _migrate_precopied(self, actor, node_id, precopy, callback, status):
+        timeout = self._precopies.pop(actor.id, None)
+        if timeout is None:
+            # Already continued
+            return
+        timeout.cancel()
+        if actor.id not in self.actors:
+            if callback:
+                callback(status=response.CalvinResponse(False))
+            return
+        # Without a prepared peer continue with normal migration
+        _log.debug("Pre-copy of %s to %s: %s" % (actor.id, node_id, status))
+        self._migrate(actor, node_id, callback, precopy=precopy if status else None)
+
+    def _migrate(self, actor, node_id, callback, precopy=None):
+        actor_id = actor.id
         actor._migrating_to = node_id
         actor.will_migrate()
         actor_type = actor._type
         ports = actor.connections(self.node.id)
+        # TODO live migration without disconnect, see TODO
         # Disconnect ports and continue in _migrate_disconnect
         _log.analyze(self.node.id, "+ PRE DISCONNECT", {'actor_name': actor.name, 'actor_id': actor.id})
         self.node.pm.disconnect(callback=CalvinCB(self._migrate_disconnected,
@@ -398,23 +545,116 @@ class ActorManager(object):
                                                   actor_type=actor_type,
                                                   ports=ports,
                                                   node_id=node_id,
+                                                  precopy=precopy,
                                                   callback=callback),
                                 actor_id=actor_id)
         _log.analyze(self.node.id, "+ POST DISCONNECT", {'actor_name': actor.name, 'actor_id': actor.id})
         self.node.control.log_actor_migrate(actor_id, node_id)
+        if _trace.enabled:
+            _trace.record(trace_recorder.MIGRATE, actor_id, node_id)
 
-    def _migrate_disconnected(self, actor, actor_type, ports, node_id, status, callback = None, **state):
+    def _migrate_disconnected(self, actor, actor_type, ports, node_id, status, callback = None, precopy=None, **state):
         """ Actor disconnected, continue migration """
         _log.analyze(self.node.id, "+ DISCONNECTED", {'actor_name': actor.name, 'actor_id': actor.id, 'status': status})
         state = actor.state()
         self.destroy(actor.id, temporary=True)
         if status:
+            if precopy is not None:
+                # Only send what changed since the pre-copy
+                delta = {k: v for k, v in state.iteritems() if precopy.get(k, None) != v}
+                delta['_id'] = actor.id
+                delta['_precopy'] = True
+                callback = CalvinCB(self._migrate_delta_cb, node_id=node_id, state=state, ports=ports,
+                                    actor_type=actor_type, callback=callback)
+                self.node.proto.actor_new(node_id, callback, actor_type, delta, ports)
+                return
             callback = CalvinCB(callback, state=state, ports=ports, actor_type=actor_type)
             self.node.proto.actor_new(node_id, callback, actor_type, state, ports)
         else:
             if callback:
                 callback(status=status, state=state, ports=ports, actor_type=actor_type)
 
+    def _migrate_delta_cb(self, status, node_id, state, ports, actor_type, callback, **kwargs):
+        if status or status.status != response.NOT_FOUND:
+            if callback:
+                callback(status=status, state=state, ports=ports, actor_type=actor_type)
+            return
+        # The peer dropped the pre-copy, send full state
+        callback = CalvinCB(callback, state=state, ports=ports, actor_type=actor_type)
+        self.node.proto.actor_new(node_id, callback, actor_type, state, ports)
+
+    def migrate_group(self, actor_ids, node_id, callback=None):
+        """ Migrate the local actors actor_ids together to peer node node_id with one state transfer,
+            connections between the actors are made locally on the peer.
+            callback is called with status, migrated (list of actor ids) and failed a dict with
+            actor_id: (actor_type, state, ports) for actors not created on the peer, which could
+            be used to try another node.
+        """
+        actors = [self.actors[actor_id] for actor_id in actor_ids if actor_id in self.actors]
+        group = {'actors': actors, 'pending': len(actors), 'ports': {}, 'node_id': node_id,
+                 'status': response.CalvinResponse(True), 'callback': callback}
+        if not actors:
+            if callback:
+                callback(status=response.CalvinResponse(False), migrated=[], failed={})
+            return
+        # Get all connections before any is disconnected
+        for actor in actors:
+            actor._replication_data.inhibate(actor.id, False)
+            actor._migrating_to = node_id
+            actor.will_migrate()
+            group['ports'][actor.id] = actor.connections(self.node.id)
+        for actor in actors:
+            self.node.pm.disconnect(callback=CalvinCB(self._group_disconnected, group=group), actor_id=actor.id)
+            self.node.control.log_actor_migrate(actor.id, node_id)
+            if _trace.enabled:
+                _trace.record(trace_recorder.MIGRATE, actor.id, node_id)
+
+    def _group_disconnected(self, group, status, **kwargs):
+        if not status:
+            group['status'] = status
+        group['pending'] -= 1
+        if group['pending'] > 0:
+            return
+        node_id = group['node_id']
+        group_port_ids = set([])
+        for ports in group['ports'].values():
+            group_port_ids.update(ports['inports'].keys())
+            group_port_ids.update(ports['outports'].keys())
+        actors = {}
+        payload = []
+        for actor in group['actors']:
+            state = actor.state()
+            ports = group['ports'][actor.id]
+            self.destroy(actor.id, temporary=True)
+            actors[actor.id] = (actor._type, state, ports)
+            payload.append({'actor_type': actor._type, 'actor_state': state,
+                            'prev_connections': self._group_connections(ports, group_port_ids, node_id)})
+        if group['status']:
+            self.node.proto.actor_new_group(node_id, CalvinCB(self._group_migrated, actors=actors,
+                                                              callback=group['callback']), payload)
+        elif group['callback']:
+            group['callback'](status=group['status'], migrated=[], failed=actors)
+
+    def _group_connections(self, ports, group_port_ids, node_id):
+        """ Connections between actors in the group are local on the new node and made from the inport """
+        connections = dict(ports)
+        connections['inports'] = {port_id: [(node_id, peer[1]) if peer[1] in group_port_ids else peer
+                                            for peer in peers]
+                                  for port_id, peers in ports['inports'].iteritems()}
+        connections['outports'] = {port_id: [peer for peer in peers if peer[1] not in group_port_ids]
+                                   for port_id, peers in ports['outports'].iteritems()}
+        return connections
+
+    def _group_migrated(self, status, actors, callback=None, **kwargs):
+        if status:
+            failed = {}
+        elif status.data and 'failed' in status.data:
+            failed = {actor_id: actors[actor_id] for actor_id in status.data['failed'] if actor_id in actors}
+        else:
+            failed = actors
+        if callback:
+            callback(status=status, migrated=[a for a in actors if a not in failed], failed=failed)
+
     def peernew_to_local_cb(self, reply, **kwargs):
         if kwargs['actor_id'] == reply:
             # Managed to setup since new returned same actor id
@@ -523,3 +763,23 @@ class ActorManager(object):
 
     def list_actors(self):
         return self.actors.keys()
+
+    def snapshot(self):
+        """ Details of the local actors with their ports' queue load and peers, for monitoring """
+        actors = {}
+        for actor_id, actor in self.actors.iteritems():
+            load = actor.get_queue_load()
+            info = {'name': actor.name, 'type': actor._type,
+                    'status': actor.STATUS.reverse_mapping[actor.fsm.state()],
+                    'inports': {}, 'outports': {}}
+            for direction, ports in (('inports', actor.inports), ('outports', actor.outports)):
+                for port in ports.values():
+                    port_info = {'name': port.name, 'queue_type': getattr(port.queue, 'queue_type', None),
+                                 'peers': [] if isinstance(port.queue, QueueNone) else port.get_peers()}
+                    if port.id in load:
+                        written, read, capacity = load[port.id]
+                        port_info.update({'tokens': written - read, 'written': written, 'read': read,
+                                          'capacity': capacity})
+                    info[direction][port.id] = port_info
+            actors[actor_id] = info
+        return actors
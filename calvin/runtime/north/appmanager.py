@@ -19,6 +19,8 @@ import copy
 from calvin.utilities.calvin_callback import CalvinCB
 from calvin.utilities import dynops
 from calvin.utilities import calvinlogger
+from calvin.utilities import calvinconfig
+from calvin.utilities import placement
 from calvin.runtime.north.plugins.requirements import req_operations
 import calvin.requests.calvinresponse as response
 from calvin.utilities import calvinuuid
@@ -28,6 +30,7 @@ from calvin.utilities.security import Security
 from calvin.utilities.requirement_matching import ReqMatch
 
 _log = calvinlogger.get_logger(__name__)
+_conf = calvinconfig.get()
 
 
 class Application(object):
@@ -430,73 +433,129 @@ class AppManager(object):
             status = response.CalvinResponse(response.CREATED)
             _log.analyze(self._node.id, "+ MISS PLACEMENT", {'app_id': app.id, 'placement': app.actor_placement}, tb=True)
 
-        # Collect an actor by actor matrix stipulating a weighting 0.0 - 1.0 for their connectivity
-        actor_ids, actor_matrix = self._actor_connectivity(app)
+        weighted_actor_placement = self._plan_placement(app, app.actor_placement)
+        # Move actors grouped by node
+        self._migrate_in_groups(weighted_actor_placement)
+
+        app._org_cb(status=status, placement=weighted_actor_placement)
+        del app._org_cb
+        _log.analyze(self._node.id, "+ DONE", {'app_id': app.id}, tb=True)
+
+    def _plan_placement(self, app, actor_placement):
+        """ Select node for all actors in actor_placement (actor_id: set of possible node ids),
+            keeping connected actors together.
+            Returns actor_id: list of possible node ids in preference order
+        """
+        # Sparse connectivity between actors, and to nodes of peer actors not in this app
+        edges, anchors = self._actor_connectivity(app)
 
         # Get list of all possible nodes
         node_ids = set([])
-        for possible_nodes in app.actor_placement.values():
+        for possible_nodes in actor_placement.values():
             node_ids |= possible_nodes
-        node_ids = list(node_ids)
         node_ids = [n for n in node_ids if not isinstance(n, dynops.InfiniteElement)]
-        for actor_id, possible_nodes in app.actor_placement.iteritems():
+        for actor_id, possible_nodes in actor_placement.iteritems():
             if any([isinstance(n, dynops.InfiniteElement) for n in possible_nodes]):
-                app.actor_placement[actor_id] = node_ids
-        _log.analyze(self._node.id, "+ ACTOR MATRIX", {'actor_ids': actor_ids, 'actor_matrix': actor_matrix,
-                                            'node_ids': node_ids, 'placement': app.actor_placement}, tb=True)
-
-        # Weight the actors possible placement with their connectivity matrix
-        weighted_actor_placement = {}
-        for actor_id in actor_ids:
-            # actor matrix is symmetric, so independent if read horizontal or vertical
-            actor_weights = actor_matrix[actor_ids.index(actor_id)]
-            # Sum the actor weights for each actors possible nodes, matrix mult AA * AN,
-            # AA actor weights, AN actor * node with 1 when possible
-            weights = [sum([actor_weights[actor_ids.index(_id)] if node_id in app.actor_placement[actor_id] else 0
-                             for _id in actor_ids])
-                             for node_id in node_ids]
-            # Get first node with highest weight
-            # FIXME should verify that the node actually exist also
-            # TODO should select from a resource sharing perspective also, instead of picking first max
-            # TODO: should also ask authorization server before selecting node to migrate to.
-            _log.analyze(self._node.id, "+ WEIGHTS", {'actor_id': actor_id, 'weights': weights})
-            #weighted_actor_placement[actor_id] = node_ids[weights.index(max(weights))]
-            # Get a list of nodes in sorted weighted order
-            weighted_actor_placement[actor_id] = [n for (w, n) in sorted(zip(weights, node_ids), reverse=True)]
+                actor_placement[actor_id] = node_ids
+        _log.analyze(self._node.id, "+ ACTOR EDGES", {'edges': edges, 'anchors': anchors,
+                                            'node_ids': node_ids, 'placement': actor_placement}, tb=True)
+
+        # Place connected actors together, each actor gets a list of its possible nodes in preference order
+        # FIXME should verify that the node actually exist also
+        # TODO: should also ask authorization server before selecting node to migrate to.
+        max_actors = _conf.get(None, 'placement_max_actors_per_node')
+        capacity = {node_id: max_actors for node_id in node_ids} if max_actors else None
+        weighted_actor_placement = placement.greedy_placement(actor_placement.keys(), actor_placement, edges,
+                                                              anchors=anchors, capacity=capacity)
         for actor_id, node_id in weighted_actor_placement.iteritems():
             _log.debug("Actor deployment %s \t-> %s" % (app.actors[actor_id], node_id))
-            # FIXME add callback that recreate the actor locally
-            self._node.am.robust_migrate(actor_id, node_id[:], None)
+        return weighted_actor_placement
 
-        app._org_cb(status=status, placement=weighted_actor_placement)
-        del app._org_cb
-        _log.analyze(self._node.id, "+ DONE", {'app_id': app.id}, tb=True)
+    def _migrate_in_groups(self, preferences, cb=None):
+        """ Move local actors grouped by their most preferred node, with one state transfer per node.
+            When a group fails its actors try their other nodes one by one.
+            preferences: actor_id: list of node ids in preference order
+            cb: called with status and actor_id for each actor
+        """
+        groups = {}
+        for actor_id, node_ids in preferences.iteritems():
+            if not node_ids or node_ids[0] == self._node.id or actor_id not in self._node.am.actors:
+                # Stays
+                if cb:
+                    cb(status=response.CalvinResponse(bool(node_ids)), actor_id=actor_id)
+                continue
+            groups.setdefault(node_ids[0], []).append(actor_id)
+        for node_id, actor_ids in groups.iteritems():
+            _log.debug("Migrate group %s -> %s" % (actor_ids, node_id))
+            self._node.am.migrate_group(actor_ids, node_id,
+                                        callback=CalvinCB(self._group_migrated, preferences=preferences, cb=cb))
+
+    def _group_migrated(self, status, migrated, failed, preferences, cb=None):
+        for actor_id in migrated:
+            if cb:
+                cb(status=response.CalvinResponse(True), actor_id=actor_id)
+        for actor_id, (actor_type, state, ports) in failed.iteritems():
+            # FIXME add callback that recreate the actor locally
+            self._node.am.robust_migrate(actor_id, preferences[actor_id][1:],
+                                         CalvinCB(cb, actor_id=actor_id) if cb else None,
+                                         state=state, actor_type=actor_type, ports=ports)
 
     def _actor_connectivity(self, app):
-        """ Matrix of weights between actors how close they want to be
-            0 = don't care
-            1 = same node
-
-            Currently any nodes that are connected gets 0.5, and
-            diagonal is 1:s
+        """ Sparse weights between actors how close they want to be, as dict of dicts.
+            Connected actors get 0.5 up to 1.0 for the highest measured token rate.
+            Connections to actors not local are returned as weights to their node.
         """
-        list_actors = app.get_actors()
-        l= len(list_actors)
-        actor_matrix = [[0 for x in range(l)] for x in range(l)]
-        for actor_id in list_actors:
-            connections = self._node.am.connections(actor_id)
-            for p in connections['inports'].values():
-                try:
-                    peer_actor_id = self._node.pm._get_local_port(port_id=p[1]).owner.id
-                except:
-                    # Only work while the peer still is local
-                    # TODO get it from storage
-                    continue
-                actor_matrix[list_actors.index(actor_id)][list_actors.index(peer_actor_id)] = 0.5
-                actor_matrix[list_actors.index(peer_actor_id)][list_actors.index(actor_id)] = 0.5
-        for i in range(l):
-            actor_matrix[i][i] = 1
-        return (list_actors, actor_matrix)
+        actors = {actor_id: self._node.am.actors[actor_id] for actor_id in app.get_actors()
+                    if actor_id in self._node.am.actors}
+        port_owner = {}
+        for actor_id, actor in actors.iteritems():
+            for port in actor.inports.values() + actor.outports.values():
+                port_owner[port.id] = actor_id
+        rates = self._port_rates(actors)
+        edges = {}
+        anchors = {}
+        for actor_id, actor in actors.iteritems():
+            connections = actor.connections(self._node.id)
+            for direction in ('outports', 'inports'):
+                for port_id, peers in connections[direction].iteritems():
+                    weight = 0.5 + 0.5 * rates.get(port_id, 0.0)
+                    for peer_node_id, peer_port_id in peers:
+                        if peer_port_id in port_owner:
+                            # Local connections are seen from both ends, count from the outport only
+                            if direction == 'outports':
+                                placement.add_edge(edges, actor_id, port_owner[peer_port_id], weight)
+                        elif peer_node_id is not None:
+                            node_weights = anchors.setdefault(actor_id, {})
+                            node_weights[peer_node_id] = node_weights.get(peer_node_id, 0.0) + weight
+        return edges, anchors
+
+    def _port_rates(self, actors):
+        """ Token rate per port id from the aggregated metering, normalized to 0.0 - 1.0 """
+        metering = self._node.metering
+        rates = {}
+        for actor_id, actor in actors.iteritems():
+            activity = metering.actors_aggregated.get(actor_id)
+            if not activity:
+                continue
+            start, modified = metering.actors_aggregated_time[actor_id]
+            duration = max(modified - start, 1.0)
+            for action_name, count in activity.iteritems():
+                meta = metering.actors_meta.get(actor_id, {}).get(action_name)
+                if meta:
+                    port_tokens = [(actor.inports, meta['inports']), (actor.outports, meta['outports'])]
+                else:
+                    # Without action info assume a token on every port
+                    port_tokens = [(ports, {port_name: 1 for port_name in ports})
+                                   for ports in (actor.inports, actor.outports)]
+                for ports, tokens_per_port in port_tokens:
+                    for port_name, tokens in tokens_per_port.iteritems():
+                        if port_name in ports:
+                            port_id = ports[port_name].id
+                            rates[port_id] = rates.get(port_id, 0.0) + count * tokens / duration
+        if rates:
+            highest = max(rates.values()) or 1.0
+            rates = {port_id: rate / highest for port_id, rate in rates.iteritems()}
+        return rates
 
     # Remigration
 
@@ -517,6 +576,7 @@ class AppManager(object):
                                               self._node.am, actors=value['actors_name_map'], deploy_info=deploy_info)
         app.group_components()
         app._migrated_actors = {a: None for a in app.actors}
+        local_reqs = {}
         for actor_id, actor_name in app.actors.iteritems():
             req = app.get_req(actor_name)
             if req is None:
@@ -526,14 +586,48 @@ class AppManager(object):
                 continue
             if actor_id in self._node.am.actors:
                 _log.analyze(self._node.id, "+ OWN ACTOR", {'actor_id': actor_id, 'actor_name': actor_name})
-                self._node.am.update_requirements(actor_id, req, False, move,
-                                                 callback=CalvinCB(self._migrated_cb, app=app,
-                                                                   actor_id=actor_id, cb=cb))
+                local_reqs[actor_id] = req
             else:
                 _log.analyze(self._node.id, "+ OTHER NODE", {'actor_id': actor_id, 'actor_name': actor_name})
                 self.storage.get_actor(actor_id, cb=CalvinCB(self._migrate_from_rt, app=app,
                                                                   actor_id=actor_id, req=req,
                                                                   move=move, cb=cb))
+        if local_reqs:
+            self._migrate_local(app, local_reqs, move, cb)
+
+    def _migrate_local(self, app, local_reqs, move, cb):
+        """ Collect possible placements for all local actors, then plan their placement together
+            and move them in groups
+        """
+        app._local_placement = {}
+        app._local_placement_nbr = len(local_reqs)
+        for actor_id, req in local_reqs.iteritems():
+            actor = self._node.am.actors[actor_id]
+            actor._replication_data.inhibate(actor_id, True)
+            actor.requirements_add(req, False)
+            r = ReqMatch(self._node,
+                         callback=CalvinCB(self._migrate_local_placement, app=app, actor_id=actor_id,
+                                           move=move, cb=cb))
+            r.match_for_actor(actor_id)
+
+    def _migrate_local_placement(self, app, actor_id, possible_placements, move, cb, status=None):
+        if move and len(possible_placements) > 1:
+            possible_placements.discard(self._node.id)
+        app._local_placement[actor_id] = possible_placements
+        if len(app._local_placement) < app._local_placement_nbr:
+            return
+        actor_placement = {}
+        for actor_id, possible_placements in app._local_placement.iteritems():
+            if not possible_placements or self._node.id in possible_placements:
+                # Actor could stay (or can't go anywhere), then do that
+                if actor_id in self._node.am.actors:
+                    self._node.am.actors[actor_id]._replication_data.inhibate(actor_id, False)
+                self._migrated_cb(response.CalvinResponse(bool(possible_placements)), app, actor_id, cb)
+            else:
+                actor_placement[actor_id] = possible_placements
+        if actor_placement:
+            preferences = self._plan_placement(app, actor_placement)
+            self._migrate_in_groups(preferences, cb=CalvinCB(self._migrated_cb, app=app, cb=cb))
 
     def _migrate_from_rt(self, key, value, app, actor_id, req, move, cb):
         if not value:
@@ -571,8 +665,14 @@ class Deployer(object):
         self.node = node
         self.cb = cb
         self._verified_actors = {}
-        self._deploy_counter = 0
+        # Actor type -> (actor_def, signer) or None when not found, looked up once per type
+        self._actor_types = {}
         self._instantiate_counter = 0
+        self._connections = []
+        self._connecting = 0
+        self._connect_loop = False
+        self._finalized = False
+        self.connect_window = _conf.get(None, 'deploy_connect_window') or 32
         if name:
             self.name = name
             self.app_id = self.node.app_manager.new(self.name)
@@ -617,45 +717,65 @@ class Deployer(object):
 
     def lookup_and_verify(self, actor_name, info, cb=None):
         """
-        Lookup and verify actor in actor store.
+        Lookup and verify actor in actor store, each actor type is only looked up once.
           - 'actor_name' is <namespace>:<identifier>, e.g. app:src, or app:component:src
           - 'info' is information about the actor
         """
         actor_type = info['actor_type']
-        try:
-            actor_def, signer = self.node.am.lookup_and_verify(actor_type, self.sec)
-            info['signer'] = signer
-            info['requires'] = actor_def.requires if hasattr(actor_def, "requires") else []
-        except Exception:
+        if actor_type not in self._actor_types:
+            try:
+                self._actor_types[actor_type] = self.node.am.lookup_and_verify(actor_type, self.sec)
+            except Exception:
+                self._actor_types[actor_type] = None
+        if self._actor_types[actor_type] is None:
             # Not found locally, must be made shadow actor
             info = self.deployable['actors'][actor_name]
             info['shadow_actor'] = True
             actor_def = None
+        else:
+            actor_def, signer = self._actor_types[actor_type]
+            info['signer'] = signer
+            info['requires'] = actor_def.requires if hasattr(actor_def, "requires") else []
         self._verified_actors[actor_name] = (info, actor_def)
         if cb:
             cb()
 
-    def check_requirements_and_sec_policy(self, actor_name, info, actor_def=None, cb=None):
+    def check_requirements_and_sec_policy(self, actor_names, info, actor_def=None, cb=None):
         """
-        Check requirements and security policy for actor.
-          - 'actor_name' is <namespace>:<identifier>, e.g. app:src, or app:component:src
-          - 'info' is information about the actor
+        Check requirements and security policy for actors of the same type,
+        i.e. with the same requirements and signer, and instantiate them.
+          - 'actor_names' is list of <namespace>:<identifier>, e.g. app:src, or app:component:src
+          - 'info' is information about (any of) the actors
           - 'actor_def' is the actor definition returned from the actor store
         """
         try:
             if not 'shadow_actor' in info:
-                self.node.am.check_requirements_and_sec_policy(info['requires'], 
-                                                               security=self.sec, 
+                self.node.am.check_requirements_and_sec_policy(info['requires'],
+                                                               security=self.sec,
                                                                signer=info['signer'],
-                                                               callback=CalvinCB(self.instantiate, 
-                                                                                 actor_name, info, 
+                                                               callback=CalvinCB(self._instantiate_all,
+                                                                                 actor_names,
                                                                                  actor_def, cb=cb))
                 return
-            self.instantiate(actor_name, info, cb=cb)
+            self._instantiate_all(actor_names, cb=cb)
         except Exception:
-            # Still want to create shadow actor.
-            info['shadow_actor'] = True
-            self.instantiate(actor_name, info, cb=cb)
+            # Still want to create shadow actors.
+            for actor_name in actor_names:
+                self._verified_actors[actor_name][0]['shadow_actor'] = True
+            self._instantiate_all(actor_names, cb=cb)
+
+    def _instantiate_all(self, actor_names, actor_def=None, access_decision=None, cb=None):
+        for actor_name in actor_names:
+            info = self._verified_actors[actor_name][0]
+            if 'shadow_actor' in info:
+                self.instantiate(actor_name, info, cb=cb)
+                continue
+            try:
+                self.instantiate(actor_name, info, actor_def, access_decision=access_decision, cb=cb)
+            except Exception:
+                # Still want to create shadow actor.
+                info['shadow_actor'] = True
+                self.instantiate(actor_name, info, cb=cb)
 
     def _requirement_type(self, req):
         try:
@@ -706,7 +826,7 @@ class Deployer(object):
             if cb:
                 cb()
 
-    def connectid(self, connection):
+    def connectid(self, connection, cb=None):
         src_actor, src_port, dst_actor, dst_port = connection
         # connect from dst to src
         # use node info if exists, otherwise assume local node
@@ -721,24 +841,29 @@ class Deployer(object):
             peer_node_id=src_node,
             peer_actor_id=src_actor_id,
             peer_port_name=src_port,
-            peer_port_dir='out')
+            peer_port_dir='out',
+            cb=cb)
         return result
 
     def deploy(self):
         """Verify actors, instantiate and link them together.
+           Actor types are looked up and authorized once per type, when all actors are
+           instantiated the connections are made with at most connect_window ongoing.
         """
         if not self.deployable['valid']:
             raise Exception("Deploy information is not valid")
 
         for actor_name, info in self.deployable['actors'].iteritems():
-            self.lookup_and_verify(actor_name, info, cb=CalvinCB(self._deploy_instantiate))
+            self.lookup_and_verify(actor_name, info)
+        self._deploy_instantiate()
 
     def _deploy_instantiate(self):
-        self._deploy_counter += 1
-        if self._deploy_counter < len(self.deployable['actors']):
-            return
-        for actor_name, info in self._verified_actors.iteritems():
-            self.check_requirements_and_sec_policy(actor_name, info[0], info[1], cb=CalvinCB(self._deploy_finalize))
+        actor_types = {}
+        for actor_name, (info, actor_def) in self._verified_actors.iteritems():
+            actor_types.setdefault(info['actor_type'], []).append(actor_name)
+        for actor_names in actor_types.values():
+            info, actor_def = self._verified_actors[actor_names[0]]
+            self.check_requirements_and_sec_policy(actor_names, info, actor_def, cb=CalvinCB(self._deploy_finalize))
 
     def _deploy_finalize(self):
         self._instantiate_counter += 1
@@ -768,9 +893,34 @@ class Deployer(object):
             src_actor, src_port = src.split('.')
             for dst in dst_list:
                 dst_actor, dst_port = dst.split('.')
-                c = (src_actor, src_port, dst_actor, dst_port)
-                self.connectid(c)
+                self._connections.append((src_actor, src_port, dst_actor, dst_port))
+        self._deploy_connect()
+
+    def _deploy_connect(self):
+        if self._connect_loop:
+            # Connection done while connecting, the loop below continues
+            return
+        self._connect_loop = True
+        while self._connections and self._connecting < self.connect_window:
+            c = self._connections.pop(0)
+            self._connecting += 1
+            try:
+                self.connectid(c, cb=CalvinCB(self._deploy_connected, connection=c))
+            except Exception:
+                _log.exception("Deploy connect %s failed" % (c,))
+                self._connecting -= 1
+        self._connect_loop = False
+        if not self._connections and not self._connecting and not self._finalized:
+            self._finalized = True
+            self._deploy_done()
+
+    def _deploy_connected(self, connection, status=None, **kwargs):
+        self._connecting -= 1
+        if not status:
+            _log.error("Deploy connect %s failed: %s" % (connection, status))
+        self._deploy_connect()
 
+    def _deploy_done(self):
         self.node.app_manager.finalize(self.app_id, migrate=True if self.deploy_info else False,
                                        cb=CalvinCB(self.cb, deployer=self))
 
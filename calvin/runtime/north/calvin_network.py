@@ -25,6 +25,7 @@ import calvin.requests.calvinresponse as response
 from calvin.runtime.south.plugins.async import async
 from calvin.utilities import calvinlogger
 from calvin.utilities import calvinconfig
+from calvin.utilities import metrics
 _log = calvinlogger.get_logger(__name__)
 _conf = calvinconfig.get()
 
@@ -79,7 +80,8 @@ class CalvinLink(CalvinBaseLink):
         if old_link:
             # close old link after a period, since might still receive messages on the transport layer
             # TODO chose the delay based on RTT instead of arbitrary 3 seconds
-            _log.analyze(self.rt_id, "+ DELAYED LINK CLOSE", {})
+            if _log.analyzing:
+                _log.analyze(self.rt_id, "+ DELAYED LINK CLOSE", {})
             async.DelayedCall(3.0, old_link.close)
 
     def reply_handler(self, payload):
@@ -97,7 +99,9 @@ class CalvinLink(CalvinBaseLink):
             reply = self.replies.pop(payload['msg_uuid'])
 
             # RTT here also inlcudes delay(actors running...) times in remote runtime
-            self._rtt = (self._rtt*2 + (time.time() - reply['send_time']))/3
+            rtt = time.time() - reply['send_time']
+            self._rtt = (self._rtt*2 + rtt)/3
+            metrics.get().record('link_rtt_seconds', rtt * 1000000, peer_node_id=self.peer_id)
 
             reply['callback'](response.CalvinResponse(encoded=payload['value']))
         except KeyError:
@@ -144,12 +148,14 @@ class CalvinLink(CalvinBaseLink):
         """
         msg['from_rt_uuid'] = self.rt_id
         msg['to_rt_uuid'] = self.peer_id if dest_peer_id is None else dest_peer_id
-        _log.analyze(self.rt_id, "SEND", msg)
+        if _log.analyzing:
+            _log.analyze(self.rt_id, "SEND", msg)
         self.transport.send(msg)
 
     def close(self, dest_peer_id=None):
         """ Disconnect the transport and hence the link object won't work anymore """
-        _log.analyze(self.rt_id, "+ LINK", {})
+        if _log.analyzing:
+            _log.analyze(self.rt_id, "+ LINK", {})
         if dest_peer_id is None:
             self.transport.disconnect()
 
@@ -305,11 +311,12 @@ class CalvinNetwork(object):
             when a simultaneous join happens due to that it is not possible to detect by URI only.
             Should add a timeout that cleans out callbacks with failed status replies and let client retry.
         """
-        _log.analyze(self.node.id, "+ BEGIN", {'uris': uris,
-                                               'peer_ids': corresponding_peer_ids,
-                                               'server_node_names': corresponding_server_node_names,
-                                               'pending_joins': self.pending_joins,
-                                               'pending_joins_by_id': self.pending_joins_by_id}, tb=True)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ BEGIN", {'uris': uris,
+                                                   'peer_ids': corresponding_peer_ids,
+                                                   'server_node_names': corresponding_server_node_names,
+                                                   'pending_joins': self.pending_joins,
+                                                   'pending_joins_by_id': self.pending_joins_by_id}, tb=True)
         # For each URI and when available a peer id
         if not (corresponding_peer_ids and len(uris) == len(corresponding_peer_ids)):
             corresponding_peer_ids = [None] * len(uris)
@@ -321,7 +328,8 @@ class CalvinNetwork(object):
             if not (uri in self.pending_joins or peer_id in self.pending_joins_by_id or peer_id in self._links):
                 # No simultaneous join detected
                 schema = uri.split(":", 1)[0]
-                _log.analyze(self.node.id, "+", {'uri': uri, 'peer_id': peer_id, 'schema': schema, 'transports': self.transports.keys()}, peer_node_id=peer_id)
+                if _log.analyzing:
+                    _log.analyze(self.node.id, "+", {'uri': uri, 'peer_id': peer_id, 'schema': schema, 'transports': self.transports.keys()}, peer_node_id=peer_id)
                 if schema in self.transports.keys():
                     # store we have a pending join and its callback
                     if peer_id:
@@ -329,13 +337,15 @@ class CalvinNetwork(object):
                     if callback:
                         self.pending_joins[uri] = [callback]
                     # Ask the transport plugin to do the join
-                    _log.analyze(self.node.id, "+ TRANSPORT", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
+                    if _log.analyzing:
+                        _log.analyze(self.node.id, "+ TRANSPORT", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
                     self.transports[schema].join(uri, server_node_name)
                 else:
                     _log.warning("Trying to join non existing transport %s", schema)
             else:
                 # We have simultaneous joins
-                _log.analyze(self.node.id, "+ SIMULTANEOUS", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
+                if _log.analyzing:
+                    _log.analyze(self.node.id, "+ SIMULTANEOUS", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
                 if callback:
                     if peer_id in self._links:
                         # Link was already established, then need to call the callback now
@@ -360,10 +370,11 @@ class CalvinNetwork(object):
         """
         # while a link is pending it is the responsibility of the transport layer, since
         # higher layers don't have any use for it anyway
-        _log.analyze(self.node.id, "+", {'uri': uri, 'peer_id': peer_id,
-                                         'pending_joins': self.pending_joins,
-                                         'pending_joins_by_id': self.pending_joins_by_id},
-                                         peer_node_id=peer_id, tb=True)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'uri': uri, 'peer_id': peer_id,
+                                             'pending_joins': self.pending_joins,
+                                             'pending_joins_by_id': self.pending_joins_by_id},
+                                             peer_node_id=peer_id, tb=True)
         if tp_link is None:
             # This is a failed join lets send it upwards
             if uri in self.pending_joins:
@@ -377,23 +388,28 @@ class CalvinNetwork(object):
             # Likely simultaneous join requests, use the one requested by the node with highest id
             if is_orginator and self.node.id > peer_id:
                 # We requested it and we have highest node id, hence the one in links is the peer's and we replace it
-                _log.analyze(self.node.id, "+ REPLACE ORGINATOR", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
+                if _log.analyzing:
+                    _log.analyze(self.node.id, "+ REPLACE ORGINATOR", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
                 self._links[peer_id] = CalvinLink(self.node.id, peer_id, tp_link, self._links[peer_id])
             elif is_orginator and self.node.id < peer_id:
                 # We requested it and peer have highest node id, hence the one in links is peer's and we close this new
-                _log.analyze(self.node.id, "+ DROP ORGINATOR", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
+                if _log.analyzing:
+                    _log.analyze(self.node.id, "+ DROP ORGINATOR", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
                 tp_link.disconnect()
             elif not is_orginator and self.node.id > peer_id:
                 # Peer requested it and we have highest node id, hence the one in links is ours and we close this new
-                _log.analyze(self.node.id, "+ DROP", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
+                if _log.analyzing:
+                    _log.analyze(self.node.id, "+ DROP", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
                 tp_link.disconnect()
             elif not is_orginator and self.node.id < peer_id:
                 # Peer requested it and peer have highest node id, hence the one in links is ours and we replace it
-                _log.analyze(self.node.id, "+ REPLACE", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
+                if _log.analyzing:
+                    _log.analyze(self.node.id, "+ REPLACE", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id)
                 self._links[peer_id] = CalvinLink(self.node.id, peer_id, tp_link, old_link=self._links[peer_id])
         else:
             # No simultaneous join detected, just add the link
-            _log.analyze(self.node.id, "+ INSERT", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id, tb=True)
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ INSERT", {'uri': uri, 'peer_id': peer_id}, peer_node_id=peer_id, tb=True)
             self._links[peer_id] = CalvinLink(self.node.id, peer_id, tp_link)
 
         # Find and call any callbacks registered for the uri or peer id
@@ -416,6 +432,7 @@ class CalvinNetwork(object):
                     cb(status=response.CalvinResponse(True), uri=uri, peer_node_id=peer_id)
 
         self.control.log_link_connected(peer_id, uri)
+        self.node.placement_cache.invalidate()
         return
 
     def _join_failed(self, tp_link, peer_id, uri, is_orginator, reason):
@@ -455,12 +472,14 @@ class CalvinNetwork(object):
             self._callback_link(peer_id, callback)
             return self._links[peer_id]
         elif peer_id in self._peer_cache: # Cache will be invalidated on failures
-            _log.analyze(self.node.id, "+ USE CACHE", {}, peer_node_id=peer_id, tb=True)
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ USE CACHE", {}, peer_node_id=peer_id, tb=True)
             self._link_request(peer_id, callback=callback)
             return None
 
         # We don't have the peer, let's ask for it in storage
-        _log.analyze(self.node.id, "+ CHECK STORAGE", {}, peer_node_id=peer_id, tb=True)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CHECK STORAGE", {}, peer_node_id=peer_id, tb=True)
         self._peer_cache[peer_id] = {'uris': [], 'timestamp': 0, 'callbacks': [callback]}
         self.node.storage.get_node(peer_id, CalvinCB(self._update_cache_request_finished, callback=None))
         return None
@@ -547,7 +566,8 @@ class CalvinNetwork(object):
     def _update_cache_request_finished(self, key, value, callback, force=False):
         """ Called by storage when the node is (not) found """
         _log.debug("Got response from storage key = %s, value = %s, callback = %s, force = %s", key, value, callback, force)
-        _log.analyze(self.node.id, "+", {'value': value}, peer_node_id=key, tb=True)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'value': value}, peer_node_id=key, tb=True)
 
         # Test if value is None or False indicating node does not currently exist in storage
         if not value:
@@ -614,19 +634,22 @@ class CalvinNetwork(object):
     def _peer_disconnected(self, link, rt_id, reason):
         if reason == "ERROR": _log.warning("Peer disconnected %s with reason %s", rt_id, reason)
         else: _log.debug("Peer disconnected %s with reason %s", rt_id, reason)
-        _log.analyze(self.node.id, "+", {'reason': reason,
-                                         'links_equal': link == self._links[rt_id].transport if rt_id in self._links else "Gone"},
-                                         peer_node_id=rt_id)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'reason': reason,
+                                             'links_equal': link == self._links[rt_id].transport if rt_id in self._links else "Gone"},
+                                             peer_node_id=rt_id)
         if rt_id in self._links and link == self._links[rt_id].transport:
             for route in self._links[rt_id].routes[:]:
                 self.link_remove(route)
                 self.control.log_link_disconnected(route)
             self.link_remove(rt_id)
         self.control.log_link_disconnected(rt_id)
+        self.node.placement_cache.invalidate()
 
     def link_remove(self, peer_id):
         """ Removes a link to peer id """
-        _log.analyze(self.node.id, "+", {}, peer_node_id=peer_id)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {}, peer_node_id=peer_id)
         try:
             link = self._links[peer_id]
             if isinstance(link, CalvinRoutingLink):
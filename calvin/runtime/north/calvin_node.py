@@ -42,7 +42,9 @@ from calvin.utilities.attribute_resolver import AttributeResolver
 from calvin.utilities.calvin_callback import CalvinCB
 from calvin.utilities.security import security_modules_check
 from calvin.utilities.runtime_credentials import RuntimeCredentials
+from calvin.utilities.requirement_matching import PlacementCache
 from calvin.utilities import calvinuuid
+from calvin.utilities import trace_recorder
 from calvin.utilities import certificate
 from calvin.utilities.calvinlogger import get_logger, set_file
 from calvin.utilities import calvinconfig
@@ -119,6 +121,8 @@ class Node(object):
         # TODO: be able to specify the interfaces
         # @TODO: Store capabilities
         self.storage = storage.Storage(self)
+        self.placement_cache = PlacementCache()
+        self.storage.add_index_listener(self.placement_cache.invalidate)
 
         self.network = CalvinNetwork(self)
         self.proto = CalvinProto(self, self.network)
@@ -221,6 +225,9 @@ class Node(object):
         # Start storage after network, proto etc since storage proxy expects them
         self.storage.start(cb=CalvinCB(self._storage_started_cb))
         self.storage.add_node(self)
+        self.rm.start()
+        self.metering.start()
+        trace_recorder.get().start(self.id)
 
         # Start control API
         proxy_control_uri = _conf.get(None, 'control_proxy')
@@ -20,6 +20,7 @@ from calvin.utilities.calvin_callback import CalvinCB, CalvinCBClass
 from calvin.utilities import calvinlogger
 from calvin.utilities import calvinconfig
 from calvin.utilities import proxyconfig
+from calvin.runtime.north.state_codec import StateCodec, MissingState, is_encoded
 import calvin.requests.calvinresponse as response
 
 _log = calvinlogger.get_logger(__name__)
@@ -141,7 +142,8 @@ class CalvinTunnel(object):
             dict, list, tuple, string, numbers, booleans, etc
         """
         def _failed_to_send(payload, status):
-            _log.analyze(self.rt_id, "+ TUNNEL FAILED", payload, peer_node_id=self.peer_node_id)
+            if _log.analyzing:
+                _log.analyze(self.rt_id, "+ TUNNEL FAILED", payload, peer_node_id=self.peer_node_id)
 
         msg = {'cmd': 'TUNNEL_DATA', 'value': payload, 'tunnel_id': self.id}
         self.network.link_request(self.peer_node_id, callback=CalvinCB(send_message, msg=msg, callback=CalvinCB(_failed_to_send, payload)))
@@ -186,6 +188,8 @@ class CalvinProto(CalvinCBClass):
             # or using the callback_register method.
             'PROXY_CONFIG': [CalvinCB(self.proxy_config_handler)],
             'ACTOR_NEW': [CalvinCB(self.actor_new_handler)],
+            'ACTOR_PREPARE': [CalvinCB(self.actor_prepare_handler)],
+            'ACTOR_NEW_GROUP': [CalvinCB(self.actor_new_group_handler)],
             'ACTOR_MIGRATE': [CalvinCB(self.actor_migrate_handler)],
             'APP_DESTROY': [CalvinCB(self.app_destroy_handler)],
             'PORT_CONNECT': [CalvinCB(self.port_connect_handler)],
@@ -208,6 +212,9 @@ class CalvinProto(CalvinCBClass):
         # tunnel_handlers is a dict with key: tunnel_type string e.g. 'token', value: function that get request
         self.tunnel_handlers = tunnel_handlers if isinstance(tunnel_handlers, dict) else {}
         self.tunnels = {}  # key: peer node id, value: dict with key: tunnel_id, value: tunnel obj
+        # Actor states are sent compact unless configured not to, but always accepted
+        self.compact_state = _conf.get(None, 'compact_state') is not False
+        self.state_codec = StateCodec()
 
     #
     # Reception of incoming payload
@@ -235,6 +242,8 @@ class CalvinProto(CalvinCBClass):
         resp = {
             'PROXY_CONFIG': response.INTERNAL_ERROR,
             'ACTOR_NEW': response.INTERNAL_ERROR,
+            'ACTOR_PREPARE': response.INTERNAL_ERROR,
+            'ACTOR_NEW_GROUP': response.INTERNAL_ERROR,
             'ACTOR_MIGRATE': response.NOT_FOUND,
             'APP_DESTROY': response.NOT_FOUND,
             'PORT_CONNECT': response.NOT_FOUND,
@@ -254,7 +263,8 @@ class CalvinProto(CalvinCBClass):
     def recv_handler(self, tp_link, payload):
         """ Called by transport when a full payload has been received
         """
-        _log.analyze(self.rt_id, "RECV", payload)
+        if _log.analyzing:
+            _log.analyze(self.rt_id, "RECV", payload)
         link = self.network.link_get(payload['from_rt_uuid'])
         if link is None:
             # TODO: Create own exception here
@@ -290,6 +300,31 @@ class CalvinProto(CalvinCBClass):
 
     #### ACTORS ####
 
+    def _send_states(self, to_rt_uuid, callback, build_msg, refs=True):
+        """ Send the message build_msg(encode) where encode(state) is used on the actor states in it,
+            when the peer lacks values that were only referenced all of it is sent again
+        """
+        if self.compact_state:
+            peer_id = to_rt_uuid if refs else None
+            encode = lambda state: self.state_codec.encode(state, peer_id)
+            callback = CalvinCB(self._states_reply, to_rt_uuid, callback, build_msg, refs)
+        else:
+            encode = lambda state: state
+        self.node.network.link_request(to_rt_uuid, CalvinCB(send_message, msg=build_msg(encode), callback=callback))
+
+    def _states_reply(self, to_rt_uuid, callback, build_msg, refs, status):
+        if refs and status.status == response.NOT_FOUND and status.data and 'missing_state' in status.data:
+            _log.debug("Peer %s missing state values, resend" % to_rt_uuid)
+            self.state_codec.forget(to_rt_uuid)
+            self._send_states(to_rt_uuid, callback, build_msg, refs=False)
+            return
+        if callback:
+            callback(status)
+
+    def _decode_state(self, state):
+        """ Returns the actor state, raises MissingState when the peer needs to send it again """
+        return self.state_codec.decode(state) if is_encoded(state) else state
+
     def actor_new(self, to_rt_uuid, callback, actor_type, state, prev_connections):
         """ Creates a new actor on to_rt_uuid node, but is only intended for migrating actors
             callback: called when finished with the peers respons as argument
@@ -297,19 +332,68 @@ class CalvinProto(CalvinCBClass):
             state: see actor manager
             prev_connections: see actor manager
         """
-        self.node.network.link_request(to_rt_uuid, CalvinCB(send_message,
-                                                            msg = {'cmd': 'ACTOR_NEW',
-                                                                   'state': {'actor_type': actor_type, 'actor_state': state, 'prev_connections': prev_connections}},
-                                                            callback=callback))
+        self._send_states(to_rt_uuid, callback,
+                          lambda encode: {'cmd': 'ACTOR_NEW',
+                                          'state': {'actor_type': actor_type, 'actor_state': encode(state),
+                                                    'prev_connections': prev_connections}})
 
     def actor_new_handler(self, payload):
         """ Peer request new actor with state and connections """
-        _log.analyze(self.rt_id, "+", payload, tb=True)
+        if _log.analyzing:
+            _log.analyze(self.rt_id, "+", payload, tb=True)
+        reply = CalvinCB(self.node.network.link_request, payload['from_rt_uuid'], callback=CalvinCB(send_message,
+                             msg = {'cmd': 'REPLY', 'msg_uuid': payload['msg_uuid']}))
+        try:
+            state = self._decode_state(payload['state']['actor_state'])
+        except MissingState as e:
+            reply(status=response.CalvinResponse(response.NOT_FOUND, data={'missing_state': e.refs}))
+            return
         self.node.am.new_from_migration(payload['state']['actor_type'],
-                                        payload['state']['actor_state'],
+                                        state,
                                         payload['state']['prev_connections'],
-                                        callback=CalvinCB(self.node.network.link_request, payload['from_rt_uuid'], callback=CalvinCB(send_message,
-                                            msg = {'cmd': 'REPLY', 'msg_uuid': payload['msg_uuid']})))
+                                        callback=reply)
+
+    def actor_new_group(self, to_rt_uuid, callback, actors):
+        """ Creates a group of migrating actors on to_rt_uuid node
+            callback: called when finished with the peers respons as argument
+            actors: list of dicts with actor_type, actor_state and prev_connections, see actor manager
+        """
+        self._send_states(to_rt_uuid, callback,
+                          lambda encode: {'cmd': 'ACTOR_NEW_GROUP',
+                                          'actors': [dict(a, actor_state=encode(a['actor_state'])) for a in actors]})
+
+    def actor_new_group_handler(self, payload):
+        """ Peer request new actors with state and connections """
+        reply = CalvinCB(self.node.network.link_request, payload['from_rt_uuid'], callback=CalvinCB(send_message,
+                             msg = {'cmd': 'REPLY', 'msg_uuid': payload['msg_uuid']}))
+        try:
+            actors = [dict(a, actor_state=self._decode_state(a['actor_state'])) for a in payload['actors']]
+        except MissingState as e:
+            reply(status=response.CalvinResponse(response.NOT_FOUND, data={'missing_state': e.refs}))
+            return
+        self.node.am.new_group_from_migration(actors, callback=reply)
+
+    def actor_prepare(self, to_rt_uuid, callback, actor_type, state):
+        """ Prepares a pre-copied migration of an actor to to_rt_uuid node with a copy of its state,
+            a later actor_new with only the changed state completes it
+            callback: called when finished with the peers respons as argument
+            actor_type: see actor manager
+            state: see actor manager
+        """
+        self._send_states(to_rt_uuid, callback,
+                          lambda encode: {'cmd': 'ACTOR_PREPARE',
+                                          'state': {'actor_type': actor_type, 'actor_state': encode(state)}})
+
+    def actor_prepare_handler(self, payload):
+        """ Peer request to prepare a pre-copied migration of an actor """
+        reply = CalvinCB(self.node.network.link_request, payload['from_rt_uuid'], callback=CalvinCB(send_message,
+                             msg = {'cmd': 'REPLY', 'msg_uuid': payload['msg_uuid']}))
+        try:
+            state = self._decode_state(payload['state']['actor_state'])
+        except MissingState as e:
+            reply(status=response.CalvinResponse(response.NOT_FOUND, data={'missing_state': e.refs}))
+            return
+        self.node.am.prepare_migration(payload['state']['actor_type'], state, callback=reply)
 
     def actor_migrate(self, to_rt_uuid, callback, actor_id, requirements, extend=False, move=False):
         """ Request actor on to_rt_uuid node to migrate accoring to new deployment requirements
@@ -413,7 +497,8 @@ class CalvinProto(CalvinCBClass):
 
     def _tunnel_link_request_finished(self, peer_id, link, status, tunnel, to_rt_uuid, tunnel_type, policy):
         """ Got a link, now continue with tunnel setup """
-        _log.analyze(self.rt_id, "+", {'status': status.__str__()}, peer_node_id=to_rt_uuid)
+        if _log.analyzing:
+            _log.analyze(self.rt_id, "+", {'status': status.__str__()}, peer_node_id=to_rt_uuid)
         link = self.network.link_get(to_rt_uuid)
         if not link or not status:
             # TODO: bad create own exception here
@@ -431,9 +516,11 @@ class CalvinProto(CalvinCBClass):
         """ Create a new tunnel (response side) """
         tunnel = self._get_tunnel(payload['from_rt_uuid'], payload['type'])
         ok = False
-        _log.analyze(self.rt_id, "+", payload, peer_node_id=payload['from_rt_uuid'])
+        if _log.analyzing:
+            _log.analyze(self.rt_id, "+", payload, peer_node_id=payload['from_rt_uuid'])
         if tunnel:
-            _log.analyze(self.rt_id, "+ PENDING", payload, peer_node_id=payload['from_rt_uuid'])
+            if _log.analyzing:
+                _log.analyze(self.rt_id, "+ PENDING", payload, peer_node_id=payload['from_rt_uuid'])
             # Got tunnel new request while we already have one pending
             # it is not allowed to send new request while a tunnel is working
             if tunnel.status != CalvinTunnel.STATUS.WORKING:
@@ -447,7 +534,8 @@ class CalvinProto(CalvinCBClass):
                             'value': response.CalvinResponse(ok, data={'tunnel_id': payload['tunnel_id']}).encode()}
                     self.network.link_request(payload['from_rt_uuid'], callback=CalvinCB(send_message, msg=msg))
                     tunnel._setup_ack(response.CalvinResponse(True, data={'tunnel_id': payload['tunnel_id']}))
-                    _log.analyze(self.rt_id, "+ CHANGE ID", payload, peer_node_id=payload['from_rt_uuid'])
+                    if _log.analyzing:
+                        _log.analyze(self.rt_id, "+ CHANGE ID", payload, peer_node_id=payload['from_rt_uuid'])
                 else:
                     # Our tunnel has highest id, keep our id
                     # update status and call proper callbacks
@@ -456,16 +544,19 @@ class CalvinProto(CalvinCBClass):
                             'value': response.CalvinResponse(ok, data={'tunnel_id': tunnel.id}).encode()}
                     self.network.link_request(payload['from_rt_uuid'], callback=CalvinCB(send_message, msg=msg))
                     tunnel._setup_ack(response.CalvinResponse(True, data={'tunnel_id': tunnel.id}))
-                    _log.analyze(self.rt_id, "+ KEEP ID", payload, peer_node_id=payload['from_rt_uuid'])
+                    if _log.analyzing:
+                        _log.analyze(self.rt_id, "+ KEEP ID", payload, peer_node_id=payload['from_rt_uuid'])
             else:
                 # FIXME if this happens need to decide what to do
-                _log.analyze(self.rt_id, "+ DROP FIXME", payload, peer_node_id=payload['from_rt_uuid'])
+                if _log.analyzing:
+                    _log.analyze(self.rt_id, "+ DROP FIXME", payload, peer_node_id=payload['from_rt_uuid'])
             return
         else:
             # No simultaneous tunnel requests, lets create it...
             tunnel = CalvinTunnel(self.network, self.tunnels, payload['from_rt_uuid'],
                                     payload['type'], payload['policy'], rt_id=self.node.id, id=payload['tunnel_id'])
-            _log.analyze(self.rt_id, "+ NO SMASH", payload, peer_node_id=payload['from_rt_uuid'])
+            if _log.analyzing:
+                _log.analyze(self.rt_id, "+ NO SMASH", payload, peer_node_id=payload['from_rt_uuid'])
             try:
                 # ... and see if the handler wants it
                 ok = self.tunnel_handlers[payload['type']](tunnel)
@@ -488,7 +579,8 @@ class CalvinProto(CalvinCBClass):
         try:
             tunnel = self.tunnels[to_rt_uuid][tunnel_uuid]
         except KeyError:
-            _log.analyze(self.rt_id, "+ ERROR_UNKNOWN_TUNNEL", None)
+            if _log.analyzing:
+                _log.analyze(self.rt_id, "+ ERROR_UNKNOWN_TUNNEL", None)
             raise Exception("ERROR_UNKNOWN_TUNNEL")
         # It exist, lets request its destruction
         msg = {'cmd': 'TUNNEL_DESTROY', 'tunnel_id': tunnel.id}
@@ -500,7 +592,8 @@ class CalvinProto(CalvinCBClass):
             tunnel = self.tunnels[payload['from_rt_uuid']][payload['tunnel_id']]
         except:
             raise Exception("ERROR_UNKNOWN_TUNNEL")
-            _log.analyze(self.rt_id, "+ ERROR_UNKNOWN_TUNNEL", payload, peer_node_id=payload['from_rt_uuid'])
+            if _log.analyzing:
+                _log.analyze(self.rt_id, "+ ERROR_UNKNOWN_TUNNEL", payload, peer_node_id=payload['from_rt_uuid'])
         # We have the tunnel so close it
         tunnel.close(local_only=True)
         ok = False
@@ -518,14 +611,16 @@ class CalvinProto(CalvinCBClass):
         try:
             tunnel = self.tunnels[payload['from_rt_uuid']][payload['tunnel_id']]
         except:
-            _log.analyze(self.rt_id, "+ ERROR_UNKNOWN_TUNNEL", payload, peer_node_id=payload['from_rt_uuid'])
+            if _log.analyzing:
+                _log.analyze(self.rt_id, "+ ERROR_UNKNOWN_TUNNEL", payload, peer_node_id=payload['from_rt_uuid'])
             raise Exception("ERROR_UNKNOWN_TUNNEL")
         try:
             tunnel.recv_handler(payload['value'])
         except Exception as e:
             _log.exception("Check error in tunnel recv handler")
-            _log.analyze(self.rt_id, "+ EXCEPTION TUNNEL RECV HANDLER", {'payload': payload, 'exception': str(e)},
-                                                                peer_node_id=payload['from_rt_uuid'], tb=True)
+            if _log.analyzing:
+                _log.analyze(self.rt_id, "+ EXCEPTION TUNNEL RECV HANDLER", {'payload': payload, 'exception': str(e)},
+                                                                    peer_node_id=payload['from_rt_uuid'], tb=True)
 
     #### PORTS ####
 
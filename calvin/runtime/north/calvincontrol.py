@@ -18,6 +18,7 @@ import re
 import time
 import json
 from random import randint
+from collections import deque
 from calvin.csparser import cscompile as compiler
 from calvin.csparser.dscodegen import calvin_dscodegen
 from calvin.runtime.north.appmanager import Deployer
@@ -32,8 +33,12 @@ from calvin.requests import calvinresponse
 from calvin.utilities.security import Security, security_enabled
 from calvin.actorstore.store import DocumentationStore
 from calvin.utilities import calvinuuid
+from calvin.utilities import metrics
+from calvin.utilities import trace_recorder
 from calvin.utilities.issuetracker import IssueTracker
+from calvin.utilities import calvinconfig
 _log = get_logger(__name__)
+_conf = calvinconfig.get()
 
 uuid_re = "[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
 
@@ -109,6 +114,16 @@ control_api_doc += \
 """
 re_get_log = re.compile(r"GET /log/(TRACE_" + uuid_re + "|" + uuid_re + ")\sHTTP/1")
 
+control_api_doc += \
+    """
+    POST /trace/dump
+    Write the runtime's trace recorder (enabled with config trace_recorder_size) to a binary
+    file in trace_dump_dir, convert it to Chrome trace event JSON with cstrace
+    Response status code: OK, NOT_FOUND when not recording or INTERNAL_ERROR
+    Response: {'filename': <dump file on the runtime's host>}
+"""
+re_post_trace_dump = re.compile(r"POST /trace/dump\sHTTP/1")
+
 control_api_doc += \
     """
     GET /id
@@ -231,6 +246,59 @@ control_api_doc += \
 """
 re_get_actors = re.compile(r"GET /actors\sHTTP/1")
 
+control_api_doc += \
+    """
+    POST /query/{actors|ports|applications|nodes}
+    Get the information of many actors, ports, applications or nodes in one request,
+    a page at a time ordered by id
+    Body (all optional):
+    {
+        'ids': <list of ids, default the actors, ports and applications on this runtime or
+                the nodes it is linked to>,
+        'fields': <list of fields to include, default all>,
+        'limit': <max number of ids in the page, default 100 and at most 1000>,
+        'cursor': <cursor from previous page>
+    }
+    Response status code: OK or BAD_REQUEST
+    Response:
+    {
+        'items': {<id>: <information as for GET of single id or null when not found>, ...},
+        'cursor': <cursor for next page or null when last page>
+    }
+"""
+re_post_query = re.compile(r"POST /query/(actors|ports|applications|nodes)\sHTTP/1")
+
+control_api_doc += \
+    """
+    GET /runtime/snapshot
+    Get the state of this runtime in one document
+    Response status code: OK
+    Response:
+    {
+        'node_id': <node id>,
+        'timestamp': <seconds since epoch>,
+        'links': <list of linked node ids>,
+        'applications': <list of application ids>,
+        'actors': {
+            <actor id>: {
+                'name': <name>, 'type': <actor type>, 'status': <actor status>,
+                'inports': {
+                    <port id>: {
+                        'name': <port name>, 'queue_type': <queue type>,
+                        'peers': [[<peer node id>, <peer port id>], ...],
+                        'tokens': <tokens queued>, 'written': <tokens written>, 'read': <tokens read>,
+                        'capacity': <queue capacity>
+                    },
+                    ...
+                },
+                'outports': {<port id>: {'name': ..., 'queue_type': ..., 'peers': ...}, ...}
+            },
+            ...
+        }
+    }
+"""
+re_get_runtime_snapshot = re.compile(r"GET /runtime/snapshot\sHTTP/1")
+
 control_api_doc += \
     """
     GET /actor/{actor-id}
@@ -265,11 +333,30 @@ control_api_doc += \
 """
 re_actor_report = re.compile(r"(?:GET|POST) /actor/(ACTOR_" + uuid_re + "|" + uuid_re + ")/report\sHTTP/1")
 
+control_api_doc += \
+    """
+    GET /actor/{actor-id}/pressure
+    Backpressure on the actor's inports, i.e. tokens not fitting in the queues (NACK)
+    Response status code: OK or NOT_FOUND
+    Response:
+    {
+        'count': <total NACK count>,
+        'ports':
+        {
+            <port-id>: {<peer-port-id>: [<NACK count>, <sequence number of last NACK>], ...},
+            ...
+        }
+    }
+"""
+re_get_actor_pressure = re.compile(r"GET /actor/(ACTOR_" + uuid_re + "|" + uuid_re + ")/pressure\sHTTP/1")
+
 control_api_doc += \
     """
     POST /actor/{actor-id}/migrate
     Migrate actor to (other) node, either explicit node_id or by updated requirements
-    Body: {"peer_node_id": <node-id>}
+    Body: {"peer_node_id": <node-id>, "precopy": True or False}
+    where the optional precopy (defaults to the migration_precopy config) pre-copies the actor state
+    to the node, which validates it while the actor keeps running
     Alternative body:
     Body:
     {
@@ -544,6 +631,25 @@ control_api_doc += \
         {
             <actor-id>: [<start time of counter>, <last modification time>],
             ...
+        },
+        'action_time':
+        {
+            <actor-id>:
+            {
+                <action-name>: <total seconds in action>,
+                ...
+            },
+            ...
+        },
+        'tokens':
+        {
+            <actor-id>: [<total tokens consumed>, <total tokens produced>],
+            ...
+        },
+        'costs':
+        {
+            <runtime internal work e.g. replication_loop>: [<count>, <total seconds>],
+            ...
         }
     }
 """
@@ -575,6 +681,78 @@ control_api_doc += \
 """
 re_get_metainfo_meter = re.compile(r"GET /meter/(METERING_" + uuid_re + "|" + uuid_re + ")/metainfo\sHTTP/1")
 
+control_api_doc += \
+    """
+    POST /profiler
+    Start profiling, attributes the time actors spend firing to actor types, actors and
+    actions. Restarting clears the previous profile.
+    Body (optional):
+    {
+        'window': <seconds to profile, default 0 i.e. until DELETE /profiler>
+    }
+    Response status code: OK or BAD_REQUEST
+"""
+re_post_profiler = re.compile(r"POST /profiler\sHTTP/1")
+
+control_api_doc += \
+    """
+    DELETE /profiler
+    Stop profiling, the profile is kept until profiling is started again
+    Response status code: OK
+"""
+re_delete_profiler = re.compile(r"DELETE /profiler\sHTTP/1")
+
+control_api_doc += \
+    """
+    GET /profiler[/{top}]
+    Get the top (default 10) actor types, actors and actions by time spent firing
+    Response status code: OK or NOT_FOUND when never started
+    Response:
+    {
+        'active': <true while profiling>,
+        'window': <seconds profiled>,
+        'cpu': <CPU seconds used by the runtime during the window>,
+        'time': <seconds spent firing actors during the window>,
+        'actor_types': [{'actor_type': <type>, 'count': <firings>, 'time': <seconds>,
+                         'share': <part of window>}, ...],
+        'actors': [{'actor_id': <id>, 'actor_name': <name>, 'actor_type': <type>, 'count': ...,
+                    'time': ..., 'share': ...}, ...],
+        'actions': [{'actor_type': <type>, 'action': <action method>, 'count': ..., 'time': ...,
+                     'share': ...}, ...]
+    }
+"""
+re_get_profiler = re.compile(r"GET /profiler(?:/([0-9]+))?\sHTTP/1")
+
+control_api_doc += \
+    """
+    GET /metrics
+    Histograms of runtime hot paths: scheduler loop time and actors fired per loop,
+    inport queue occupancy, link round trip time, token ACK latency, storage operation
+    latency and message encode/decode time
+    Response status code: OK
+    Response: Prometheus text exposition format (text/plain)
+"""
+re_get_metrics = re.compile(r"GET /metrics\sHTTP/1")
+
+control_api_doc += \
+    """
+    GET /metrics/summary
+    Summaries of the histograms in GET /metrics
+    Response status code: OK
+    Response:
+    [
+        {
+            'name': <metric name>,
+            'labels': {<label>: <value>, ...},
+            'summary': {'count': <n>, 'sum': <sum>, 'min': <min>, 'max': <max>, 'mean': <mean>,
+                        'p50': <median>, 'p90': <90th percentile>, 'p99': <99th percentile>}
+        },
+        ...
+    ]
+    Durations in microseconds
+"""
+re_get_metrics_summary = re.compile(r"GET /metrics/summary\sHTTP/1")
+
 control_api_doc += \
     """
     POST /index/{key}
@@ -776,20 +954,141 @@ def get_calvincontrol():
     return _calvincontrol
 
 
+# Default and max number of ids per page in POST /query
+QUERY_LIMIT = 100
+QUERY_MAX_LIMIT = 1000
+
+re_route_key = re.compile(r"(?:\(\?:)?([A-Z|]+)\)? /([0-9a-zA-Z_]*)(\\s|/|\(\?:/|$)")
+
+
+def _index_routes(routes):
+    """ Index the routes on method and first path segment, e.g. ('GET', 'actor').
+        Returns the index with the routes to try for each key, in the original order, and
+        the routes that can't be indexed, which are tried for any request.
+    """
+    keys = []
+    for regex, _ in routes:
+        m = re_route_key.match(regex.pattern)
+        keys.append([(method, m.group(2)) for method in m.group(1).split("|")] if m else None)
+    other_routes = [route for route, route_keys in zip(routes, keys) if route_keys is None]
+    index = {}
+    for route_keys in keys:
+        for key in route_keys or []:
+            index[key] = [route for route, k in zip(routes, keys) if k is None or key in k]
+    return index, other_routes
+
+
+def _request_key(command):
+    """ Method and first path segment of a request line """
+    parts = command.split(" ", 2)
+    if len(parts) < 2:
+        return None
+    return parts[0], parts[1][1:].split("/", 1)[0].split("?", 1)[0]
+
+
 class Logger(object):
 
-    """ Log object
+    """ Log object, a subscriber of log events. Events for a stream connection that can't
+        keep up are buffered, at most buffer_size of them, dropping the oldest
     """
 
-    def __init__(self, actors, events):
+    def __init__(self, actors, events, buffer_size=None):
         self.handle = None
         self.connection = None
         self.actors = actors
         self.events = events
+        self.action_result = CalvinControl.LOG_ACTION_RESULT in events
+        self.buffer = deque()
+        self.buffer_size = buffer_size or _conf.get(None, 'control_log_buffer_size') or 1000
+        self.dropped = 0
+        self._reported_dropped = 0
 
     def set_connection(self, handle, connection):
         self.handle = handle
         self.connection = connection
+        if connection is not None:
+            connection.watch_writable(self.flush)
+
+    def send(self, event):
+        """ Send the serialized event on the connection, returns False when the connection is lost """
+        if self.connection.connection_lost:
+            return False
+        if self.buffer or not self.connection.writable:
+            if len(self.buffer) >= self.buffer_size:
+                self.buffer.popleft()
+                self.dropped += 1
+            self.buffer.append(event)
+        else:
+            self.connection.send(event)
+        return True
+
+    def flush(self):
+        """ Send buffered events while the connection is writable """
+        if self.connection is None or self.connection.connection_lost:
+            return
+        if self.dropped > self._reported_dropped and self.connection.writable:
+            _log.debug("Log stream %s dropped %d events" % (self.handle, self.dropped - self._reported_dropped))
+            self.connection.send(": dropped %d events\n\n" % (self.dropped - self._reported_dropped))
+            self._reported_dropped = self.dropped
+        while self.buffer and self.connection.writable:
+            self.connection.send(self.buffer.popleft())
+
+
+class LogFanout(object):
+
+    """ The log subscribers by user id, indexed on event type and actor id
+        to find the subscribers of an event without filtering all of them
+    """
+
+    def __init__(self):
+        self.loggers = {}
+        # event type: user ids of subscribers to all actors
+        self._subscribers = {}
+        # event type: {actor id: user ids}
+        self._actor_subscribers = {}
+
+    def __contains__(self, user_id):
+        return user_id in self.loggers
+
+    def __getitem__(self, user_id):
+        return self.loggers[user_id]
+
+    def add(self, user_id, logger):
+        self.loggers[user_id] = logger
+        for event_type in logger.events or CalvinControl.LOG_EVENTS:
+            if logger.actors and event_type in CalvinControl.LOG_ACTOR_EVENTS:
+                by_actor = self._actor_subscribers.setdefault(event_type, {})
+                for actor_id in logger.actors:
+                    by_actor.setdefault(actor_id, set()).add(user_id)
+            else:
+                self._subscribers.setdefault(event_type, set()).add(user_id)
+
+    def remove(self, user_id):
+        logger = self.loggers.pop(user_id, None)
+        if logger is None:
+            return
+        for user_ids in self._subscribers.itervalues():
+            user_ids.discard(user_id)
+        for by_actor in self._actor_subscribers.itervalues():
+            for actor_id in logger.actors:
+                user_ids = by_actor.get(actor_id)
+                if user_ids is not None:
+                    user_ids.discard(user_id)
+                    if not user_ids:
+                        del by_actor[actor_id]
+
+    def remove_handle(self, handle):
+        for user_id in [u for u, logger in self.loggers.iteritems() if logger.handle == handle]:
+            self.remove(user_id)
+
+    def subscribers(self, event_type, actor_id=None):
+        """ User ids subscribing to event type (for actor id), do not modify """
+        user_ids = self._subscribers.get(event_type)
+        if actor_id is not None and event_type in self._actor_subscribers:
+            actor_user_ids = self._actor_subscribers[event_type].get(actor_id)
+            if actor_user_ids:
+                return user_ids | actor_user_ids if user_ids else actor_user_ids
+        return user_ids
 
 
 class CalvinControl(object):
@@ -809,10 +1108,17 @@ class CalvinControl(object):
     LOG_ACTOR_REPLICATE = 9
     LOG_ACTOR_DEREPLICATE = 10
     LOG_LOG_MESSAGE = 11
+    # Action result is not an event, it adds the result to actor firing events
+    LOG_EVENTS = [LOG_ACTOR_FIRING, LOG_ACTOR_NEW, LOG_ACTOR_DESTROY, LOG_ACTOR_MIGRATE, LOG_APPLICATION_NEW,
+                  LOG_APPLICATION_DESTROY, LOG_LINK_CONNECTED, LOG_LINK_DISCONNECTED, LOG_ACTOR_REPLICATE,
+                  LOG_ACTOR_DEREPLICATE, LOG_LOG_MESSAGE]
+    # Events filtered on the actors of the log session
+    LOG_ACTOR_EVENTS = [LOG_ACTOR_FIRING, LOG_ACTOR_NEW, LOG_ACTOR_DESTROY, LOG_ACTOR_MIGRATE, LOG_ACTOR_REPLICATE,
+                        LOG_ACTOR_DEREPLICATE]
 
     def __init__(self):
         self.node = None
-        self.loggers = {}
+        self.loggers = LogFanout()
         self.routes = None
         self.server = None
         self.connections = {}
@@ -830,6 +1136,7 @@ class CalvinControl(object):
             (re_post_log, self.handle_post_log),
             (re_delete_log, self.handle_delete_log),
             (re_get_log, self.handle_get_log),
+            (re_post_trace_dump, self.handle_post_trace_dump),
             (re_get_node_id, self.handle_get_node_id),
             (re_get_node_capabilities, self.handle_get_node_capabilities),
             (re_get_nodes, self.handle_get_nodes),
@@ -841,9 +1148,12 @@ class CalvinControl(object):
             (re_del_application, self.handle_del_application),
             (re_post_new_actor, self.handle_new_actor),
             (re_get_actors, self.handle_get_actors),
+            (re_post_query, self.handle_post_query),
+            (re_get_runtime_snapshot, self.handle_get_runtime_snapshot),
             (re_get_actor, self.handle_get_actor),
             (re_del_actor, self.handle_del_actor),
             (re_actor_report, self.handle_actor_report),
+            (re_get_actor_pressure, self.handle_get_actor_pressure),
             (re_post_actor_migrate, self.handle_actor_migrate),
             (re_post_actor_disable, self.handle_actor_disable),
             (re_post_actor_replicate, self.handle_actor_replicate),
@@ -860,6 +1170,11 @@ class CalvinControl(object):
             (re_get_timed_meter, self.handle_get_timed_meter),
             (re_get_aggregated_meter, self.handle_get_aggregated_meter),
             (re_get_metainfo_meter, self.handle_get_metainfo_meter),
+            (re_post_profiler, self.handle_post_profiler),
+            (re_delete_profiler, self.handle_delete_profiler),
+            (re_get_profiler, self.handle_get_profiler),
+            (re_get_metrics, self.handle_get_metrics),
+            (re_get_metrics_summary, self.handle_get_metrics_summary),
             (re_post_index, self.handle_post_index),
             (re_delete_index, self.handle_delete_index),
             (re_get_index, self.handle_get_index),
@@ -878,6 +1193,7 @@ class CalvinControl(object):
             (re_del_authorization_policy, self.handle_del_authorization_policy),
             (re_options, self.handle_options)
         ]
+        self.route_index, self.other_routes = _index_routes(self.routes)
 
     def authentication_decorator(func):
         def _exit_with_error(issue_tracker):
@@ -979,7 +1295,8 @@ class CalvinControl(object):
                 self.external_host = self.host
             _log.info("Control API trying to listening on: %s:%s" % (self.host, self.port))
 
-            self.server = server_connection.ServerProtocolFactory(self.handle_request, "http", node_name=node.node_name)
+            self.server = server_connection.ServerProtocolFactory(None, "http", node_name=node.node_name,
+                                                                  request_cb=self.request_received)
             self.server.start(self.host, self.port)
 
             # Create tunnel server
@@ -996,21 +1313,13 @@ class CalvinControl(object):
     def close_log_tunnel(self, handle):
         """ Close log tunnel
         """
-        for user_id, logger in self.loggers:
-            if logger.handle == handle:
-                del self.loggers[user_id]
-
-    def handle_request(self, actor_ids=None):
-        """ Handle incoming requests on socket
-        """
-        if self.server.pending_connections:
-            addr, conn = self.server.accept()
-            self.connections[addr] = conn
+        self.loggers.remove_handle(handle)
 
-        for handle, connection in self.connections.items():
-            if connection.data_available:
-                command, headers, data = connection.data_get()
-                self.route_request(handle, connection, command, headers, data)
+    def request_received(self, connection, seq, command, headers, data):
+        """ Handle a request as soon as it is received on a connection, seq orders the responses """
+        handle = (connection, seq)
+        self.connections[handle] = connection
+        self.route_request(handle, connection, command, headers, data)
 
     def route_request(self, handle, connection, command, headers, data):
         if self.node.quitting:
@@ -1021,7 +1330,7 @@ class CalvinControl(object):
         try:
             issuetracker = IssueTracker()
             found = False
-            for route in self.routes:
+            for route in self.route_index.get(_request_key(command), self.other_routes):
                 match = route[0].match(command)
                 if match:
                     credentials = None
@@ -1060,10 +1369,11 @@ class CalvinControl(object):
             self.tunnel_client.send(msg)
         else:
             if not connection.connection_lost:
-                connection.send(header)
-                if data:
-                    connection.send(data)
-                connection.close()
+                headers = [] if data is None else [content_type.strip()]
+                headers += ["Access-Control-Allow-Methods: GET, POST, PUT, DELETE, OPTIONS",
+                            "Access-Control-Allow-Origin: *"]
+                connection.respond(handle[1], str(status) + " " + calvinresponse.RESPONSE_CODES[status],
+                                   headers, data)
             del self.connections[handle]
 
     def send_streamheader(self, handle, connection):
@@ -1190,7 +1500,7 @@ class CalvinControl(object):
                         status = calvinresponse.BAD_REQUEST
                         break
             if status == calvinresponse.OK:
-                self.loggers[user_id] = Logger(actors=actors, events=events)
+                self.loggers.add(user_id, Logger(actors=actors, events=events))
         else:
             status = calvinresponse.BAD_REQUEST
 
@@ -1204,7 +1514,7 @@ class CalvinControl(object):
         """ Delete log session
         """
         if match.group(1) in self.loggers:
-            del self.loggers[match.group(1)]
+            self.loggers.remove(match.group(1))
             status = calvinresponse.OK
         else:
             status = calvinresponse.NOT_FOUND
@@ -1346,6 +1656,61 @@ class CalvinControl(object):
         self.send_response(
             handle, connection, json.dumps(actors))
 
+    @authentication_decorator
+    def handle_post_query(self, handle, connection, match, data, hdr):
+        """ Get many actors, ports, applications or nodes, a page at a time
+        """
+        kind = match.group(1)
+        data = data or {}
+        try:
+            if data.get('ids') is not None:
+                ids = data['ids']
+            elif kind == 'actors':
+                ids = self.node.am.list_actors()
+            elif kind == 'ports':
+                ids = [port.id for actor in self.node.am.actors.values()
+                       for port in actor.inports.values() + actor.outports.values()]
+            elif kind == 'applications':
+                ids = self.node.app_manager.list_applications()
+            else:
+                ids = self.node.network.list_links()
+            ids = sorted(set(ids))
+            if data.get('cursor'):
+                ids = [id_ for id_ in ids if id_ > data['cursor']]
+            limit = max(1, min(int(data.get('limit', QUERY_LIMIT)), QUERY_MAX_LIMIT))
+            fields = data.get('fields')
+        except:
+            _log.exception("handle_post_query")
+            self.send_response(handle, connection, None, status=calvinresponse.BAD_REQUEST)
+            return
+        page = ids[:limit]
+        result = {'items': {}, 'cursor': page[-1] if len(ids) > limit else None}
+        if not page:
+            self.send_response(handle, connection, json.dumps(result))
+            return
+        prefix = {'actors': "actor-", 'ports': "port-", 'applications': "application-", 'nodes': "node-"}[kind]
+        self.node.storage.get_many(prefix, page, cb=CalvinCB(self._query_cb, handle, connection, fields, result))
+
+    def _query_cb(self, handle, connection, fields, result, values):
+        for id_, value in values.iteritems():
+            if value is False:
+                value = None
+            if fields and isinstance(value, dict):
+                value = {field: value[field] for field in fields if field in value}
+            result['items'][id_] = value
+        self.send_response(handle, connection, json.dumps(result))
+
+    @authentication_decorator
+    def handle_get_runtime_snapshot(self, handle, connection, match, data, hdr):
+        """ Get actors, ports, queues and connections of this runtime in one document
+        """
+        snapshot = {'node_id': self.node.id,
+                    'timestamp': time.time(),
+                    'links': self.node.network.list_links(),
+                    'applications': self.node.app_manager.list_applications(),
+                    'actors': self.node.am.snapshot()}
+        self.send_response(handle, connection, json.dumps(snapshot))
+
     @authentication_decorator
     def handle_get_actor(self, handle, connection, match, data, hdr):
         """ Get actor from id
@@ -1380,6 +1745,23 @@ class CalvinControl(object):
         self.send_response(
             handle, connection, None if report is None else json.dumps(report), status=status)
 
+    @authentication_decorator
+    def handle_get_actor_pressure(self, handle, connection, match, data, hdr):
+        """ Get backpressure summary of actor
+        """
+        try:
+            actor = self.node.am.actors[match.group(1)]
+            ports = {}
+            for (port_id, peer_id), pressure in actor.get_pressure().iteritems():
+                ports.setdefault(port_id, {})[peer_id] = pressure
+            pressure = {'count': actor.pressure_count, 'ports': ports}
+            status = calvinresponse.OK
+        except:
+            pressure = None
+            status = calvinresponse.NOT_FOUND
+        self.send_response(
+            handle, connection, None if pressure is None else json.dumps(pressure), status=status)
+
     @authentication_decorator
     def handle_actor_migrate(self, handle, connection, match, data, hdr):
         """ Migrate actor
@@ -1388,7 +1770,8 @@ class CalvinControl(object):
         if 'peer_node_id' in data:
             try:
                 self.node.am.migrate(match.group(1), data['peer_node_id'],
-                                 callback=CalvinCB(self.actor_migrate_cb, handle, connection))
+                                 callback=CalvinCB(self.actor_migrate_cb, handle, connection),
+                                 precopy=data.get('precopy', None))
             except:
                 _log.exception("Migration failed")
                 status = calvinresponse.INTERNAL_ERROR
@@ -1747,6 +2130,51 @@ class CalvinControl(object):
         self.send_response(handle, connection,
             json.dumps(data) if status == calvinresponse.OK else None, status=status)
 
+    @authentication_decorator
+    def handle_post_profiler(self, handle, connection, match, data, hdr):
+        try:
+            self.metering.start_profiling(float(data.get('window', 0.0)) if data else 0.0)
+            status = calvinresponse.OK
+        except:
+            _log.exception("handle_post_profiler")
+            status = calvinresponse.BAD_REQUEST
+        self.send_response(handle, connection, None, status=status)
+
+    @authentication_decorator
+    def handle_delete_profiler(self, handle, connection, match, data, hdr):
+        self.metering.stop_profiling()
+        self.send_response(handle, connection, None, status=calvinresponse.OK)
+
+    @authentication_decorator
+    def handle_get_profiler(self, handle, connection, match, data, hdr):
+        profile = self.metering.get_profile(int(match.group(1)) if match.group(1) else 10)
+        if profile is None:
+            self.send_response(handle, connection, None, status=calvinresponse.NOT_FOUND)
+        else:
+            self.send_response(handle, connection, json.dumps(profile))
+
+    @authentication_decorator
+    def handle_post_trace_dump(self, handle, connection, match, data, hdr):
+        trace = trace_recorder.get()
+        if not trace.enabled:
+            self.send_response(handle, connection, None, status=calvinresponse.NOT_FOUND)
+            return
+        try:
+            filename = trace.dump()
+            self.send_response(handle, connection, json.dumps({'filename': filename}))
+        except Exception:
+            _log.exception("handle_post_trace_dump")
+            self.send_response(handle, connection, None, status=calvinresponse.INTERNAL_ERROR)
+
+    @authentication_decorator
+    def handle_get_metrics(self, handle, connection, match, data, hdr):
+        self.send_response(handle, connection, metrics.get().prometheus(),
+                           content_type="Content-Type: text/plain; version=0.0.4")
+
+    @authentication_decorator
+    def handle_get_metrics_summary(self, handle, connection, match, data, hdr):
+        self.send_response(handle, connection, json.dumps(metrics.get().summary()))
+
     @authentication_decorator
     def handle_post_index(self, handle, connection, match, data, hdr):
         """ Add to index
@@ -1932,270 +2360,119 @@ class CalvinControl(object):
             status = calvinresponse.INTERNAL_ERROR
         self.send_response(handle, connection, None, status=status)
 
-    def log_actor_firing(self, actor_id, action_method, tokens_produced, tokens_consumed, production):
-        """ Trace actor firing
+    def _log_event(self, event, **kwargs):
+        data = {'timestamp': time.time(), 'node_id': self.node.id, 'type': event}
+        data.update(kwargs)
+        return data
+
+    def _send_log_event(self, user_ids, data):
+        """ Send the log event data, serialized once, to the subscribers user_ids
         """
+        if not user_ids:
+            return
+        event = "data: %s\n\n" % json.dumps(data)
         disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_ACTOR_FIRING in logger.events:
-                if not logger.actors or actor_id in logger.actors:
-                    data = {}
-                    data['timestamp'] = time.time()
-                    data['node_id'] = self.node.id
-                    data['type'] = 'actor_fire'
-                    data['actor_id'] = actor_id
-                    data['action_method'] = action_method
-                    data['produced'] = tokens_produced
-                    data['consumed'] = tokens_consumed
-                    if self.LOG_ACTION_RESULT in logger.events:
-                        data['action_result'] = production
-                    if logger.connection is not None:
-                        if not logger.connection.connection_lost:
-                            logger.connection.send("data: %s\n\n" % json.dumps(data))
-                        else:
-                            disconnected.append(user_id)
-                    elif self.tunnel_client is not None and logger.handle is not None:
-                        msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                        self.tunnel_client.send(msg)
+        for user_id in user_ids:
+            logger = self.loggers[user_id]
+            if logger.connection is not None:
+                if not logger.send(event):
+                    disconnected.append(user_id)
+            elif self.tunnel_client is not None and logger.handle is not None:
+                msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": event}
+                self.tunnel_client.send(msg)
         for user_id in disconnected:
-            del self.loggers[user_id]
+            self.loggers.remove(user_id)
+
+    def log_actor_firing(self, actor_id, action_method, tokens_produced, tokens_consumed, production):
+        """ Trace actor firing
+        """
+        user_ids = self.loggers.subscribers(self.LOG_ACTOR_FIRING, actor_id)
+        if not user_ids:
+            return
+        data = self._log_event('actor_fire', actor_id=actor_id, action_method=action_method,
+                               produced=tokens_produced, consumed=tokens_consumed)
+        with_result = set([user_id for user_id in user_ids if self.loggers[user_id].action_result])
+        self._send_log_event(user_ids.difference(with_result) if with_result else user_ids, data)
+        if with_result:
+            data['action_result'] = production
+            self._send_log_event(with_result, data)
 
     def log_actor_new(self, actor_id, actor_name, actor_type, is_shadow):
         """ Trace actor new
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_ACTOR_NEW in logger.events:
-                if not logger.actors or actor_id in logger.actors:
-                    data = {}
-                    data['timestamp'] = time.time()
-                    data['node_id'] = self.node.id
-                    data['type'] = 'actor_new'
-                    data['actor_id'] = actor_id
-                    data['actor_name'] = actor_name
-                    data['actor_type'] = actor_type
-                    data['is_shadow'] = is_shadow
-                    if logger.connection is not None:
-                        if not logger.connection.connection_lost:
-                            logger.connection.send("data: %s\n\n" % json.dumps(data))
-                        else:
-                            disconnected.append(user_id)
-                    elif self.tunnel_client is not None and logger.handle is not None:
-                        msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                        self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
+        user_ids = self.loggers.subscribers(self.LOG_ACTOR_NEW, actor_id)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('actor_new', actor_id=actor_id, actor_name=actor_name,
+                                                           actor_type=actor_type, is_shadow=is_shadow))
 
     def log_actor_destroy(self, actor_id):
         """ Trace actor destroy
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_ACTOR_DESTROY in logger.events:
-                if not logger.actors or actor_id in logger.actors:
-                    data = {}
-                    data['timestamp'] = time.time()
-                    data['node_id'] = self.node.id
-                    data['type'] = 'actor_destroy'
-                    data['actor_id'] = actor_id
-                    if logger.connection is not None:
-                        if not logger.connection.connection_lost:
-                            logger.connection.send("data: %s\n\n" % json.dumps(data))
-                        else:
-                            disconnected.append(user_id)
-                    elif self.tunnel_client is not None and logger.handle is not None:
-                        msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                        self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
+        user_ids = self.loggers.subscribers(self.LOG_ACTOR_DESTROY, actor_id)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('actor_destroy', actor_id=actor_id))
 
     def log_actor_migrate(self, actor_id, dest_node_id):
         """ Trace actor migrate
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_ACTOR_MIGRATE in logger.events:
-                if not logger.actors or actor_id in logger.actors:
-                    data = {}
-                    data['timestamp'] = time.time()
-                    data['node_id'] = self.node.id
-                    data['type'] = 'actor_migrate'
-                    data['actor_id'] = actor_id
-                    data['dest_node_id'] = dest_node_id
-                    if logger.connection is not None:
-                        if not logger.connection.connection_lost:
-                            logger.connection.send("data: %s\n\n" % json.dumps(data))
-                        else:
-                            disconnected.append(user_id)
-                    elif self.tunnel_client is not None and logger.handle is not None:
-                        msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                        self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
+        user_ids = self.loggers.subscribers(self.LOG_ACTOR_MIGRATE, actor_id)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('actor_migrate', actor_id=actor_id,
+                                                           dest_node_id=dest_node_id))
 
     def log_actor_replicate(self, actor_id, replica_actor_id, replication_id, dest_node_id):
         """ Trace actor replication
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_ACTOR_REPLICATE in logger.events:
-                if not logger.actors or actor_id in logger.actors:
-                    data = {}
-                    data['timestamp'] = time.time()
-                    data['node_id'] = self.node.id
-                    data['type'] = 'actor_replicate'
-                    data['actor_id'] = actor_id
-                    data['dest_node_id'] = dest_node_id
-                    data['replication_id'] = replication_id
-                    data['replica_actor_id'] = replica_actor_id
-                    if logger.connection is not None:
-                        if not logger.connection.connection_lost:
-                            logger.connection.send("data: %s\n\n" % json.dumps(data))
-                        else:
-                            disconnected.append(user_id)
-                    elif self.tunnel_client is not None and logger.handle is not None:
-                        msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                        self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
+        user_ids = self.loggers.subscribers(self.LOG_ACTOR_REPLICATE, actor_id)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('actor_replicate', actor_id=actor_id,
+                                                           dest_node_id=dest_node_id, replication_id=replication_id,
+                                                           replica_actor_id=replica_actor_id))
 
     def log_actor_dereplicate(self, actor_id, replica_actor_id, replication_id):
         """ Trace actor dereplication
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_ACTOR_DEREPLICATE in logger.events:
-                if not logger.actors or actor_id in logger.actors:
-                    data = {}
-                    data['timestamp'] = time.time()
-                    data['node_id'] = self.node.id
-                    data['type'] = 'actor_dereplicate'
-                    data['actor_id'] = actor_id
-                    data['replication_id'] = replication_id
-                    data['replica_actor_id'] = replica_actor_id
-                    if logger.connection is not None:
-                        if not logger.connection.connection_lost:
-                            logger.connection.send("data: %s\n\n" % json.dumps(data))
-                        else:
-                            disconnected.append(user_id)
-                    elif self.tunnel_client is not None and logger.handle is not None:
-                        msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                        self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
+        user_ids = self.loggers.subscribers(self.LOG_ACTOR_DEREPLICATE, actor_id)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('actor_dereplicate', actor_id=actor_id,
+                                                           replication_id=replication_id,
+                                                           replica_actor_id=replica_actor_id))
 
     def log_application_new(self, application_id, application_name):
         """ Trace application new
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_APPLICATION_NEW in logger.events:
-                data = {}
-                data['timestamp'] = time.time()
-                data['node_id'] = self.node.id
-                data['type'] = 'application_new'
-                data['application_id'] = application_id
-                data['application_name'] = application_name
-                if logger.connection is not None:
-                    if not logger.connection.connection_lost:
-                        logger.connection.send("data: %s\n\n" % json.dumps(data))
-                    else:
-                        disconnected.append(user_id)
-                elif self.tunnel_client is not None and logger.handle is not None:
-                    msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                    self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
+        user_ids = self.loggers.subscribers(self.LOG_APPLICATION_NEW)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('application_new', application_id=application_id,
+                                                           application_name=application_name))
 
     def log_application_destroy(self, application_id):
         """ Trace application destroy
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_APPLICATION_DESTROY in logger.events:
-                data = {}
-                data['timestamp'] = time.time()
-                data['node_id'] = self.node.id
-                data['type'] = 'application_destroy'
-                data['application_id'] = application_id
-                if logger.connection is not None:
-                    if not logger.connection.connection_lost:
-                        logger.connection.send("data: %s\n\n" % json.dumps(data))
-                    else:
-                        disconnected.append(user_id)
-                elif self.tunnel_client is not None and logger.handle is not None:
-                    msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                    self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
+        user_ids = self.loggers.subscribers(self.LOG_APPLICATION_DESTROY)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('application_destroy', application_id=application_id))
 
     def log_link_connected(self, peer_id, uri):
         """ Trace node connect
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_LINK_CONNECTED in logger.events:
-                data = {}
-                data['timestamp'] = time.time()
-                data['node_id'] = self.node.id
-                data['type'] = 'link_connected'
-                data['peer_id'] = peer_id
-                data['uri'] = uri
-                if logger.connection is not None:
-                    if not logger.connection.connection_lost:
-                        logger.connection.send("data: %s\n\n" % json.dumps(data))
-                    else:
-                        disconnected.append(user_id)
-                elif self.tunnel_client is not None and logger.handle is not None:
-                    msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                    self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
-
+        user_ids = self.loggers.subscribers(self.LOG_LINK_CONNECTED)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('link_connected', peer_id=peer_id, uri=uri))
 
     def log_link_disconnected(self, peer_id):
         """ Trace node connect
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_LINK_DISCONNECTED in logger.events:
-                data = {}
-                data['timestamp'] = time.time()
-                data['node_id'] = self.node.id
-                data['type'] = 'link_disconnected'
-                data['peer_id'] = peer_id
-                if logger.connection is not None:
-                    if not logger.connection.connection_lost:
-                        logger.connection.send("data: %s\n\n" % json.dumps(data))
-                    else:
-                        disconnected.append(user_id)
-                elif self.tunnel_client is not None and logger.handle is not None:
-                    msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                    self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
+        user_ids = self.loggers.subscribers(self.LOG_LINK_DISCONNECTED)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('link_disconnected', peer_id=peer_id))
 
     def log_log_message(self, message):
         """ Log message that is displayed at listener
         """
-        disconnected = []
-        for user_id, logger in self.loggers.iteritems():
-            if not logger.events or self.LOG_LOG_MESSAGE in logger.events:
-                data = {}
-                data['timestamp'] = time.time()
-                data['node_id'] = self.node.id
-                data['type'] = 'log_message'
-                data['msg'] = message
-                if logger.connection is not None:
-                    if not logger.connection.connection_lost:
-                        logger.connection.send("data: %s\n\n" % json.dumps(data))
-                    else:
-                        disconnected.append(user_id)
-                elif self.tunnel_client is not None and logger.handle is not None:
-                    msg = {"cmd": "logevent", "msgid": logger.handle, "header": None, "data": "data: %s\n\n" % json.dumps(data)}
-                    self.tunnel_client.send(msg)
-        for user_id in disconnected:
-            del self.loggers[user_id]
+        user_ids = self.loggers.subscribers(self.LOG_LOG_MESSAGE)
+        if user_ids:
+            self._send_log_event(user_ids, self._log_event('log_message', msg=message))
 
     @authentication_decorator
     def handle_options(self, handle, connection, match, data, hdr):
@@ -14,10 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import time
+from array import array
+from calvin.runtime.south.plugins.async import async
 from calvin.utilities import calvinlogger
 from calvin.utilities import calvinuuid
 from calvin.utilities import calvinconfig
+from calvin.utilities import metrics
 
 _conf = calvinconfig.get()
 _log = calvinlogger.get_logger(__name__)
@@ -39,6 +43,51 @@ def set_metering(metering):
         _metering = metering
     return _metering
 
+def _cpu_time():
+    """ User and system CPU seconds of this process """
+    t = os.times()
+    return t[0] + t[1]
+
+
+class _FiringLog(object):
+    """
+    Fixed size circular log of an actor's firings, as timestamps and action indices.
+    Entries are numbered by a sequence number that keeps increasing, a reader
+    remembers the sequence number to continue from.
+    """
+    def __init__(self, size):
+        super(_FiringLog, self).__init__()
+        self.size = size
+        self.times = array('d', [0.0]) * size
+        self.actions = array('H', [0]) * size
+        self.action_names = []
+        self.seq = 0
+
+    def append(self, t, action_name, count=1):
+        try:
+            action = self.action_names.index(action_name)
+        except ValueError:
+            action = len(self.action_names)
+            self.action_names.append(action_name)
+        # Only the last size entries would remain anyway
+        for _ in xrange(min(count, self.size)):
+            index = self.seq % self.size
+            self.times[index] = t
+            self.actions[index] = action
+            self.seq += 1
+
+    def read(self, seq, after):
+        """ Entries from sequence number seq, still in the log, with time later than after """
+        names = self.action_names
+        entries = []
+        for s in xrange(max(seq, self.seq - self.size), self.seq):
+            index = s % self.size
+            t = self.times[index]
+            if t > after:
+                entries.append((t, names[self.actions[index]]))
+        return entries
+
+
 class Metering(object):
     """Metering logs all actor activity"""
     def __init__(self, node):
@@ -46,34 +95,167 @@ class Metering(object):
         self.node = node
         self.timeout = _conf.get(None, 'metering_timeout')
         self.aggregated_timeout = _conf.get(None, 'metering_aggregated_timeout')
+        # Actor id -> _FiringLog
         self.actors_log = {}
+        self.log_size = _conf.get(None, 'metering_log_size') or 1024
         self.actors_meta = {}
         self.actors_destroyed = {}
         self.active = False
         # Keep track of user's last access time, should inactive users be deleted? When?
         self.users = {}
-        self.oldest = time.time()
-        self.last_forget = time.time()
+        # User id -> actor id -> sequence number to continue reading timed metering from
+        self.users_seq = {}
         self.next_forget_aggregated = time.time()
         self.actors_aggregated = {}
         self.actors_aggregated_time = {}
+        # Name of runtime internal work -> [count, total seconds]
+        self.costs = {}
+        # Actor id -> action name -> seconds spent in the action
+        self.actors_action_time = {}
+        # Actor id -> [tokens consumed, tokens produced]
+        self.actors_tokens = {}
+        # The actors count their firings, collected periodically
+        self.collect_period = _conf.get(None, 'metering_collect_period') or 1.0
+        self._collected = {}
+        self._collect = None
+        # Profiling: (actor type, actor id, action name) -> [count, seconds], None when never started
+        self.profile = None
+        self.profile_names = {}
+        self.profile_started = None
+        self.profile_ended = None
+        self._profile_stop = None
+
+    def start(self):
+        self._collect = async.DelayedCall(self.collect_period, self._collect_timeout)
 
-    def fired(self, actor_id, action_name):
+    def _collect_timeout(self):
+        self._collect = None
+        if self.node.quitting:
+            return
+        self.collect()
+        self.start()
+
+    def collect(self):
+        """ Collect the firings counted by the actors since last time """
         t = time.time()
+        for actor_id, actor in self.node.am.actors.items():
+            self.collect_actor(actor_id, actor, t)
+            # Sample the queue occupancy
+            for port_id, (written, read, capacity) in actor.get_queue_load().iteritems():
+                metrics.get().record('queue_occupancy_tokens', written - read, actor_id=actor_id, port_id=port_id)
+
+    def collect_actor(self, actor_id, actor, t=None):
+        """ Collect the firings counted by one actor since last time """
+        if actor_id not in self.actors_meta:
+            return
+        counts, times = self._collected.setdefault(actor_id, ([0] * len(actor.fire_counts),
+                                                              [0.0] * len(actor.fire_times)))
+        for index, action_method in enumerate(actor.__class__.action_priority):
+            count = actor.fire_counts[index] - counts[index]
+            if count <= 0:
+                continue
+            action_name = action_method.__name__
+            action_time = self.actors_action_time.setdefault(actor_id, {})
+            action_time[action_name] = action_time.get(action_name, 0.0) + actor.fire_times[index] - times[index]
+            tokens = self.actors_tokens.setdefault(actor_id, [0, 0])
+            tokens[0] += count * len(getattr(action_method, 'action_input', ()))
+            tokens[1] += count * len(getattr(action_method, 'action_output', ()))
+            if self.profile is not None and self.profile_ended is None:
+                entry = self.profile.setdefault((actor._type, actor_id, action_name), [0, 0.0])
+                entry[0] += count
+                entry[1] += actor.fire_times[index] - times[index]
+                self.profile_names[actor_id] = actor.name
+            counts[index] = actor.fire_counts[index]
+            times[index] = actor.fire_times[index]
+            self.fired(actor_id, action_name, count, t)
+
+    def fired(self, actor_id, action_name, count=1, t=None):
+        if t is None:
+            t = time.time()
         if self.aggregated_timeout > 0.0:
             # Aggregate
             self.actors_aggregated.setdefault(actor_id,
-                                            {action: 0 for action in self.actors_meta[actor_id]})[action_name] += 1
+                                            {action: 0 for action in self.actors_meta[actor_id]})[action_name] += count
             # Set [start time, modification time] and update modification time
             self.actors_aggregated_time.setdefault(actor_id, [t, t])[1] = t
             if self.next_forget_aggregated <= t:
                 self.forget_aggregated(t)
         if self.active and self.timeout > 0.0:
             # Timed metering
-            self.actors_log[actor_id].append((t, action_name))
-            # Remove old data at most once per second
-            if self.oldest < t - self.timeout and self.last_forget < t - 1.0:
-                self.forget(t)
+            log = self.actors_log.get(actor_id)
+            if log is None:
+                log = self.actors_log[actor_id] = _FiringLog(self.log_size)
+            log.append(t, action_name, count)
+
+    def start_profiling(self, window=0.0):
+        """ Attribute the time actors spend firing to actor types, actors and actions,
+            for window seconds or until stopped when 0.
+        """
+        # Only firings from now on
+        self.collect()
+        if self._profile_stop is not None:
+            self._profile_stop.cancel()
+            self._profile_stop = None
+        self.profile = {}
+        self.profile_names = {}
+        self.profile_started = (time.time(), _cpu_time())
+        self.profile_ended = None
+        if window > 0.0:
+            self._profile_stop = async.DelayedCall(window, self._profile_timeout)
+
+    def _profile_timeout(self):
+        self._profile_stop = None
+        self.stop_profiling()
+
+    def stop_profiling(self):
+        """ Stop profiling, the profile is kept until next start """
+        if self.profile is None or self.profile_ended is not None:
+            return
+        self.collect()
+        self.profile_ended = (time.time(), _cpu_time())
+        if self._profile_stop is not None:
+            self._profile_stop.cancel()
+            self._profile_stop = None
+
+    def get_profile(self, top=10):
+        """ Top tables of the actor types, actors and actions that spent most time firing,
+            None if profiling never started
+        """
+        if self.profile is None:
+            return None
+        if self.profile_ended is None:
+            self.collect()
+        end = self.profile_ended or (time.time(), _cpu_time())
+        window = end[0] - self.profile_started[0]
+        by_type = {}
+        by_actor = {}
+        by_action = {}
+        for (actor_type, actor_id, action_name), (count, seconds) in self.profile.iteritems():
+            for d, key in ((by_type, actor_type), (by_actor, (actor_type, actor_id)),
+                           (by_action, (actor_type, action_name))):
+                entry = d.setdefault(key, [0, 0.0])
+                entry[0] += count
+                entry[1] += seconds
+
+        def table(d, row):
+            items = sorted(d.iteritems(), key=lambda item: item[1][1], reverse=True)[:top]
+            return [dict(row(key), count=count, time=seconds, share=seconds / window if window > 0.0 else 0.0)
+                    for key, (count, seconds) in items]
+
+        return {'active': self.profile_ended is None,
+                'window': window,
+                'cpu': end[1] - self.profile_started[1],
+                'time': sum([seconds for _, seconds in self.profile.itervalues()]),
+                'actor_types': table(by_type, lambda k: {'actor_type': k}),
+                'actors': table(by_actor, lambda k: {'actor_type': k[0], 'actor_id': k[1],
+                                                     'actor_name': self.profile_names.get(k[1], "")}),
+                'actions': table(by_action, lambda k: {'actor_type': k[0], 'action': k[1]})}
+
+    def add_cost(self, name, duration):
+        """ Count runtime internal work, e.g. replication control, and the time in seconds it took """
+        cost = self.costs.setdefault(name, [0, 0.0])
+        cost[0] += 1
+        cost[1] += duration
 
     def register(self, user_id=None):
         if not user_id:
@@ -81,14 +263,17 @@ class Metering(object):
         if user_id in self.users:
             raise Exception("User id already in use")
         self.users[user_id] = time.time()
+        self.users_seq[user_id] = {actor_id: log.seq for actor_id, log in self.actors_log.iteritems()}
         self.active = True
         return user_id
 
     def unregister(self, user_id):
         if user_id in self.users:
             self.users.pop(user_id)
+            self.users_seq.pop(user_id)
             self.active = bool(self.users)
-            self.forget(time.time())
+            if not self.active:
+                self.actors_log = {}
         else:
             raise Exception("User id not found")
 
@@ -97,32 +282,24 @@ class Metering(object):
             _log.debug("get_timed_meter: User id not found")
             raise Exception("User id not found")
         t = time.time()
-        response = {actor_id: [d for d in data if d[0] > self.users[user_id]] 
-                                for actor_id, data in self.actors_log.iteritems()}
+        # Only what is logged since the user's last fetch and not older than the timeout
+        after = max(self.users[user_id], t - self.timeout)
+        users_seq = self.users_seq[user_id]
+        response = {}
+        for actor_id, log in self.actors_log.iteritems():
+            response[actor_id] = log.read(users_seq.get(actor_id, 0), after)
+            users_seq[actor_id] = log.seq
         self.users[user_id] = t
-        self.forget(t)
         return response
 
     def get_aggregated_meter(self, user_id):
         if user_id not in self.users:
             _log.debug("get_aggregated_meter: User id not found")
             raise Exception("User id not found")
-        response = {'activity': self.actors_aggregated, 'time': self.actors_aggregated_time}
+        response = {'activity': self.actors_aggregated, 'time': self.actors_aggregated_time,
+                    'action_time': self.actors_action_time, 'tokens': self.actors_tokens, 'costs': self.costs}
         return response
 
-    def forget(self, current):
-        self.last_forget = current
-        if not self.active:
-            self.actors_log = {}
-            self.oldest = current
-            return
-        t = min(self.users.values())
-        if t < current - self.timeout:
-            t = current - self.timeout
-        self.oldest = t
-        for actor_id, data in self.actors_log.iteritems():
-            self.actors_log[actor_id] = [d for d in data if d[0] > t]
-
     def forget_aggregated(self, current):
         # Remove meta info that we don't have any action data for anyway.
         # Also remove aggregated data for timeouted destroyed actors
@@ -130,6 +307,11 @@ class Metering(object):
         for actor_id, dt in self.actors_destroyed.iteritems():
             if dt < et:
                 self.actors_meta.pop(actor_id)
+                self.actors_log.pop(actor_id, None)
+                for users_seq in self.users_seq.itervalues():
+                    users_seq.pop(actor_id, None)
+                self.actors_action_time.pop(actor_id, None)
+                self.actors_tokens.pop(actor_id, None)
                 try:
                     self.actors_aggregated_time.pop(actor_id)
                     self.actors_aggregated.pop(actor_id)
@@ -147,15 +329,17 @@ class Metering(object):
         # Remove note on actor destroyed for an actor that migrates back
         if actor.id in self.actors_destroyed:
             self.actors_destroyed.pop(actor.id)
-        # Make sure the log exist but don't overwrite old data for an actor that migrates back
-        self.actors_log.setdefault(actor.id, [])
+        # A new actor instance counts from zero
+        self._collected.pop(actor.id, None)
         for action_method in actor.__class__.action_priority:
             self.actors_meta[actor.id][action_method.__name__] = {
-                    'inports': {p[0]: p[1] for p in action_method.action_input},
-                    'outports': {p[0]: p[1] for p in action_method.action_output}}
+                    'inports': {p: 1 for p in getattr(action_method, 'action_input', ())},
+                    'outports': {p: 1 for p in getattr(action_method, 'action_output', ())}}
         _log.analyze(self.node.id, "+", {'actor_id': actor.id, 'metainfo': self.actors_meta[actor.id]})
 
     def remove_actor_info(self, actor_id):
+        self._collected.pop(actor_id, None)
+        metrics.get().remove(actor_id=actor_id)
         if actor_id in self.actors_meta:
             self.actors_destroyed[actor_id] = time.time()
             self.next_forget_aggregated = (min(self.actors_destroyed.values()) +
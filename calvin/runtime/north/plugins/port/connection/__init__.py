@@ -59,7 +59,8 @@ class ConnectionFactory(object):
             return TunnelConnection(self.node, self.purpose, port, peer_port_meta, callback, self, **kwargs)
 
     def get_existing(self, port_id, callback=None, **kwargs):
-        _log.analyze(self.node.id, "+", {'port_id': port_id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'port_id': port_id})
         port_meta = PortMeta(self.node.pm, port_id=port_id)
         if not port_meta.is_local():
             status = response.CalvinResponse(response.NOT_FOUND, "Port %s must be local" % (port_id))
@@ -68,12 +69,14 @@ class ConnectionFactory(object):
                 return
             else:
                 raise response.CalvinResponseException(status)
-        _log.analyze(self.node.id, "+ LOCAL CHECKED", {'port_id': port_id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ LOCAL CHECKED", {'port_id': port_id})
         port = port_meta.port
         # Now check the peer port, peer_ids is list of (peer_node_id, peer_port_id) tuples
         peer_ids = port.get_peers()
 
-        _log.analyze(self.node.id, "+ GOT PEERS", {'port_id': port_id, 'peer_ids': peer_ids})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ GOT PEERS", {'port_id': port_id, 'peer_ids': peer_ids})
         # A port may have several peers, create individual connection instances
         connections = []
         for peer_id in peer_ids:
@@ -86,7 +89,8 @@ class ConnectionFactory(object):
         # Make a connection instance aware of all parallel connection instances
         for connection in connections:
             connection.parallel_connections(connections)
-        _log.analyze(self.node.id, "+ DONE", {'port_id': port_id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ DONE", {'port_id': port_id})
         return connections
 
     def init(self):
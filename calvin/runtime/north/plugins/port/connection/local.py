@@ -32,8 +32,9 @@ class LocalConnection(BaseConnection):
         self.kwargs = kwargs
 
     def connect(self):
-        _log.analyze(self.node.id, "+ LOCAL", {'local_port': self.port, 'peer_port': self.peer_port_meta},
-                        peer_node_id=self.peer_port_meta.node_id)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ LOCAL", {'local_port': self.port, 'peer_port': self.peer_port_meta},
+                            peer_node_id=self.peer_port_meta.node_id)
         port1 = self.port
         port2 = self.peer_port_meta.port
 
@@ -55,7 +56,8 @@ class LocalConnection(BaseConnection):
 
     def _connect_via_local(self, inport, outport):
         """ Both connecting ports are local, just connect them """
-        _log.analyze(self.node.id, "+", {})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {})
         inport.set_queue(queue.get(inport, peer_port=outport))
         outport.set_queue(queue.get(outport, peer_port=inport))
         ein = endpoint.LocalInEndpoint(inport, outport)
@@ -85,9 +87,11 @@ class LocalConnection(BaseConnection):
     def disconnect(self, terminate=DISCONNECT.TEMPORARY):
         """ Obtain any missing information to enable disconnecting one peer port and make the disconnect"""
 
-        _log.analyze(self.node.id, "+", {'port_id': self.port.id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'port_id': self.port.id})
         endpoints = self.port.disconnect(peer_ids=[self.peer_port_meta.port_id], terminate=terminate)
-        _log.analyze(self.node.id, "+ EP", {'port_id': self.port.id, 'endpoints': endpoints})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ EP", {'port_id': self.port.id, 'endpoints': endpoints})
         remaining_tokens = {}
         # Can only be one for the one peer as argument to disconnect, but loop for simplicity
         for ep in endpoints:
@@ -95,12 +99,14 @@ class LocalConnection(BaseConnection):
             if ep.use_monitor():
                 self.node.monitor.unregister_endpoint(ep)
             ep.destroy()
-        _log.analyze(self.node.id, "+ EP DESTROYED", {'port_id': self.port.id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ EP DESTROYED", {'port_id': self.port.id})
 
         # Disconnect other end also, which is also local
         terminate_peer = DISCONNECT.EXHAUST_PEER if terminate == DISCONNECT.EXHAUST else terminate
         endpoints = self.peer_port_meta.port.disconnect(peer_ids=[self.port.id], terminate=terminate_peer)
-        _log.analyze(self.node.id, "+ EP PEER", {'port_id': self.port.id, 'endpoints': endpoints})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ EP PEER", {'port_id': self.port.id, 'endpoints': endpoints})
         peer_remaining_tokens = {}
         # Can only be one for the one peer as argument to disconnect, but loop for simplicity
         for ep in endpoints:
@@ -108,7 +114,8 @@ class LocalConnection(BaseConnection):
             if ep.use_monitor():
                 self.node.monitor.unregister_endpoint(ep)
             ep.destroy()
-        _log.analyze(self.node.id, "+ DISCONNECTED", {'port_id': self.port.id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ DISCONNECTED", {'port_id': self.port.id})
 
         self.port.exhausted_tokens(peer_remaining_tokens)
         self.peer_port_meta.port.exhausted_tokens(remaining_tokens)
@@ -126,7 +133,8 @@ class LocalConnection(BaseConnection):
         except:
             pass
         if not getattr(self, 'sent_callback', False) and not self._parallel_connections:
-            _log.analyze(self.node.id, "+ SEND OK", {'port_id': self.port.id})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ SEND OK", {'port_id': self.port.id})
             # Last peer connection we should send OK
             if self.callback:
                 self.callback(status=response.CalvinResponse(True), port_id=self.port.id)
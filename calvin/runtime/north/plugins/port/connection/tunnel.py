@@ -42,13 +42,15 @@ class TunnelConnection(BaseConnection):
             # FIXME the factory should provide the verification method instead of a simple node id match
             # The peer port has moved to this node!
             # Need ConnectionFactory to redo its job.
-            _log.analyze(self.node.id, "+ TUNNELED-TO-LOCAL", {'factory': self.factory})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ TUNNELED-TO-LOCAL", {'factory': self.factory})
             self.factory.get(self.port, self.peer_port_meta, self.callback).connect()
             return
         tunnel = None
         if self.peer_port_meta.node_id not in self.token_tunnel.tunnels.iterkeys():
             # No tunnel to peer, get one first
-            _log.analyze(self.node.id, "+ GET TUNNEL", self.peer_port_meta, peer_node_id=self.peer_port_meta.node_id)
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ GET TUNNEL", self.peer_port_meta, peer_node_id=self.peer_port_meta.node_id)
             tunnel = self.node.proto.tunnel_new(self.peer_port_meta.node_id, 'token', {})
             tunnel.register_tunnel_down(CalvinCB(self.token_tunnel.tunnel_down, tunnel))
             tunnel.register_tunnel_up(CalvinCB(self.token_tunnel.tunnel_up, tunnel))
@@ -76,22 +78,25 @@ class TunnelConnection(BaseConnection):
                          peer_port_id=self.peer_port_meta.port_id)
             return
 
-        _log.analyze(self.node.id, "+ HAD TUNNEL",
-                        {'local_port': self.port, 'peer_port': self.peer_port_meta,
-                        'tunnel_status': self.token_tunnel.tunnels[self.peer_port_meta.node_id].status},
-                        peer_node_id=self.peer_port_meta.node_id)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ HAD TUNNEL",
+                            {'local_port': self.port, 'peer_port': self.peer_port_meta,
+                            'tunnel_status': self.token_tunnel.tunnels[self.peer_port_meta.node_id].status},
+                            peer_node_id=self.peer_port_meta.node_id)
         self._connect_via_tunnel(status=response.CalvinResponse(True))
 
     def _connect_via_tunnel(self, status=None):
         """ All information and hopefully (status OK) a tunnel to the peer is available for a port connect"""
-        _log.analyze(self.node.id, "+ " + str(status),
-                     {'local_port': self.port, 'peer_port': self.peer_port_meta,
-                     'port_is_connected': self.port.is_connected_to(self.peer_port_meta.port_id)},
-                     peer_node_id=self.peer_port_meta.node_id, tb=True)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ " + str(status),
+                         {'local_port': self.port, 'peer_port': self.peer_port_meta,
+                         'port_is_connected': self.port.is_connected_to(self.peer_port_meta.port_id)},
+                         peer_node_id=self.peer_port_meta.node_id, tb=True)
         if self.port.is_connected_to(self.peer_port_meta.port_id):
             # The other end beat us to connecting the port, lets just report success and return
-            _log.analyze(self.node.id, "+ IS CONNECTED", {'local_port': self.port, 'peer_port': self.peer_port_meta},
-                            peer_node_id=self.peer_port_meta.node_id)
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ IS CONNECTED", {'local_port': self.port, 'peer_port': self.peer_port_meta},
+                                peer_node_id=self.peer_port_meta.node_id)
             if self.callback:
                 self.callback(status=response.CalvinResponse(True),
                          actor_id=self.port.owner.id,
@@ -118,10 +123,11 @@ class TunnelConnection(BaseConnection):
         # Finally we have all information and a tunnel
         # Lets ask the peer if it can connect our port.
         tunnel = self.token_tunnel.tunnels[self.peer_port_meta.node_id]
-        _log.analyze(self.node.id, "+ SENDING",
-                        {'local_port': self.port, 'peer_port': self.peer_port_meta,
-                        'tunnel_status': self.token_tunnel.tunnels[self.peer_port_meta.node_id].status},
-                        peer_node_id=self.peer_port_meta.node_id)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ SENDING",
+                            {'local_port': self.port, 'peer_port': self.peer_port_meta,
+                            'tunnel_status': self.token_tunnel.tunnels[self.peer_port_meta.node_id].status},
+                            peer_node_id=self.peer_port_meta.node_id)
 
         self.node.proto.port_connect(callback=CalvinCB(self._connected_via_tunnel),
                                         port_id=self.port.id, port_properties=self.port.properties,
@@ -129,8 +135,9 @@ class TunnelConnection(BaseConnection):
 
     def _connected_via_tunnel(self, reply):
         """ Gets called when remote responds to our request for port connection """
-        _log.analyze(self.node.id, "+ " + str(reply), {'local_port': self.port, 'peer_port': self.peer_port_meta},
-                            peer_node_id=self.peer_port_meta.node_id, tb=True)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ " + str(reply), {'local_port': self.port, 'peer_port': self.peer_port_meta},
+                                peer_node_id=self.peer_port_meta.node_id, tb=True)
         if reply in [response.BAD_REQUEST, response.NOT_FOUND, response.GATEWAY_TIMEOUT]:
             # Other end did not accept our port connection request
             if self.peer_port_meta.retries < 2 and self.peer_port_meta.node_id:
@@ -152,8 +159,9 @@ class TunnelConnection(BaseConnection):
         if reply == response.GONE:
             # Other end did not accept our port connection request, likely due to they have not got the message
             # about the tunnel in time
-            _log.analyze(self.node.id, "+ RETRY", {'local_port': self.port, 'peer_port': self.peer_port_meta},
-                            peer_node_id=self.peer_port_meta.node_id)
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ RETRY", {'local_port': self.port, 'peer_port': self.peer_port_meta},
+                                peer_node_id=self.peer_port_meta.node_id)
             if self.peer_port_meta.retries < 3:
                 self.peer_port_meta.retries += 1
                 # Status here just indicate that we should have a tunnel
@@ -220,7 +228,8 @@ class TunnelConnection(BaseConnection):
 
     def connection_request(self):
         """ A request from a peer to connect a port"""
-        _log.analyze(self.node.id, "+", self.kwargs, peer_node_id=self.peer_port_meta.node_id)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", self.kwargs, peer_node_id=self.peer_port_meta.node_id)
         try:
             payload = self.kwargs['payload']
         except:
@@ -232,7 +241,8 @@ class TunnelConnection(BaseConnection):
             # For some reason does the tunnel id not match the one we have to connect to the peer
             # Likely due to that we have not yet received a tunnel request from the peer that replace our tunnel id
             # Can happen when race of simultaneous link setup and commands can be received out of order
-            _log.analyze(self.node.id, "+ WRONG TUNNEL", payload, peer_node_id=self.peer_port_meta.node_id)
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ WRONG TUNNEL", payload, peer_node_id=self.peer_port_meta.node_id)
             return response.CalvinResponse(response.GONE)
 
         self.node.rm.connect_verification(
@@ -266,13 +276,15 @@ class TunnelConnection(BaseConnection):
         # Update storage
         self.node.storage.add_port(self.port, self.node.id, self.port.owner.id)
 
-        _log.analyze(self.node.id, "+ OK", payload, peer_node_id=self.peer_port_meta.node_id)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ OK", payload, peer_node_id=self.peer_port_meta.node_id)
         return response.CalvinResponse(response.OK, {'port_id': self.port.id, 'port_properties': self.port.properties})
 
     def disconnect(self, terminate=DISCONNECT.TEMPORARY):
         """ Obtain any missing information to enable disconnecting one port peer and make the disconnect"""
 
-        _log.analyze(self.node.id, "+", {'port_id': self.port.id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'port_id': self.port.id})
         # Disconnect and destroy the endpoints
         remaining_tokens = self._destroy_endpoints(terminate=terminate)
         self._serialize_remaining_tokens(remaining_tokens)
@@ -341,7 +353,8 @@ class TunnelConnection(BaseConnection):
 
     def _destroy_endpoints(self, terminate=DISCONNECT.TEMPORARY):
         endpoints = self.port.disconnect(peer_ids=[self.peer_port_meta.port_id], terminate=terminate)
-        _log.analyze(self.node.id, "+ EP", {'port_id': self.port.id, 'endpoints': endpoints})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ EP", {'port_id': self.port.id, 'endpoints': endpoints})
         remaining_tokens = {}
         # Can only be one for the one peer as argument to disconnect, but loop for simplicity
         for ep in endpoints:
@@ -25,6 +25,9 @@ class Endpoint(object):
         self.port = port
         self.former_peer_id = former_peer_id
         self.remaining_tokens = {}
+        # Pressure summary, NACK count and the sequence number of the last NACK
+        self.pressure_count = 0
+        self.pressure_last = None
 
     def __str__(self):
         return "%s(port_id=%s)" % (self.__class__.__name__, self.port.id)
@@ -45,6 +48,16 @@ class Endpoint(object):
     def destroy(self):
         pass
 
+    def nack(self, sequencenbr):
+        """ Record that the token with sequencenbr did not fit in the queue,
+            repeated NACKs of the same token count once.
+        """
+        if sequencenbr == self.pressure_last:
+            return
+        self.pressure_last = sequencenbr
+        self.pressure_count += 1
+        self.port.owner.pressure_count += 1
+
     def get_peer(self):
         return (None, self.former_peer_id)
 
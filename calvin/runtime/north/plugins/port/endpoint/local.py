@@ -25,8 +25,6 @@ _log = get_logger(__name__)
 # Local endpoints
 #
 
-PRESSURE_LENGTH = 20
-
 class LocalInEndpoint(Endpoint):
 
     """docstring for LocalEndpoint"""
@@ -35,9 +33,6 @@ class LocalInEndpoint(Endpoint):
         super(LocalInEndpoint, self).__init__(port)
         self.peer_port = peer_port
         self.peer_id = peer_port.id
-        self.pressure_count = 0
-        self.pressure = [0] * PRESSURE_LENGTH
-        self.pressure_last = 0
 
     def is_connected(self):
         return True
@@ -117,11 +112,7 @@ class LocalOutEndpoint(Endpoint):
             except QueueFull:
                 # Could not write, rollback read
                 self.port.queue.com_cancel(self.peer_id, nbr)
-                if (self.peer_endpoint and
-                        self.peer_endpoint.pressure[(self.peer_endpoint.pressure_count - 1) % PRESSURE_LENGTH] == nbr):
-                    self.peer_endpoint.pressure[self.peer_endpoint.pressure_count % PRESSURE_LENGTH] = nbr
-                    self.peer_endpoint.pressure_count += 1
+                if self.peer_endpoint:
+                    self.peer_endpoint.nack(nbr)
                 break
-        if self.peer_endpoint and nbr is not None:
-            self.peer_endpoint.pressure_last = nbr
         return sent
@@ -20,15 +20,16 @@ from calvin.runtime.north.plugins.port.queue.common import COMMIT_RESPONSE, Queu
 from calvin.runtime.north.plugins.port import DISCONNECT
 import time
 from calvin.utilities.calvinlogger import get_logger
+from calvin.utilities import metrics
+from calvin.utilities import trace_recorder
 
 _log = get_logger(__name__)
+_trace = trace_recorder.get()
 
 #
 # Remote tunnel endpoints
 #
 
-PRESSURE_LENGTH = 20
-
 class TunnelInEndpoint(Endpoint):
 
     """docstring for TunnelInEndpoint"""
@@ -40,9 +41,6 @@ class TunnelInEndpoint(Endpoint):
         self.peer_node_id = peer_node_id
         self.peer_port_properties = peer_port_properties
         self.trigger_loop = trigger_loop
-        self.pressure_count = 0
-        self.pressure = [0] * PRESSURE_LENGTH
-        self.pressure_last = 0
 
     def __str__(self):
         str = super(TunnelInEndpoint, self).__str__()
@@ -81,10 +79,7 @@ class TunnelInEndpoint(Endpoint):
         except QueueFull:
             # Queue full just send NACK
             ok = False
-            if self.pressure[(self.pressure_count - 1) % PRESSURE_LENGTH] != payload['sequencenbr']:
-                self.pressure[self.pressure_count % PRESSURE_LENGTH] = payload['sequencenbr']
-                self.pressure_count += 1
-        self.pressure_last = payload['sequencenbr']
+            self.nack(payload['sequencenbr'])
         reply = {
             'cmd': 'TOKEN_REPLY',
             'port_id': payload['port_id'],
@@ -120,6 +115,9 @@ class TunnelOutEndpoint(Endpoint):
         self.backoff = 0.0
         self.time_cont = 0.0
         self.bulk = True
+        # Send time per sequence number slot, sized when attached to the queue
+        self._sent_at = None
+        self._ack_latency = metrics.get().histogram('token_ack_seconds', peer_node_id=peer_node_id)
 
     def __str__(self):
         str = super(TunnelOutEndpoint, self).__str__()
@@ -131,6 +129,7 @@ class TunnelOutEndpoint(Endpoint):
     def attached(self):
         self.port.queue.add_reader(self.peer_id, self.peer_port_properties)
         self.port.queue.add_writer(self.port.id, self.port.properties)
+        self._sent_at = [0.0] * getattr(self.port.queue, 'N', 16)
 
     def detached(self, terminate=DISCONNECT.TEMPORARY):
         if terminate == DISCONNECT.TEMPORARY:
@@ -164,6 +163,12 @@ class TunnelOutEndpoint(Endpoint):
         self.backoff = 0.0
         # Maybe someone can fill the queue again
         self.trigger_loop()
+        if self._sent_at:
+            now = time.time()
+            latency = now - self._sent_at[sequencenbr % len(self._sent_at)]
+            self._ack_latency.record(latency * 1000000)
+            if _trace.enabled:
+                _trace.record(trace_recorder.TOKEN_ACK, self.port.id, self.peer_id, now, latency, sequencenbr)
         r = self.port.queue.com_commit(self.peer_id, sequencenbr)
         if r == COMMIT_RESPONSE.handled or r == COMMIT_RESPONSE.invalid:
             return
@@ -190,8 +195,12 @@ class TunnelOutEndpoint(Endpoint):
             # Filter out ACK for later seq nbrs, should not happen but precaution
             self.sequencenbrs_acked = [n for n in self.sequencenbrs_acked if n < sequencenbr]
 
-    def _send_one_token(self):
+    def _send_one_token(self, now=None):
         sequencenbr_sent, token = self.port.queue.com_peek(self.peer_id)
+        if self._sent_at:
+            self._sent_at[sequencenbr_sent % len(self._sent_at)] = now or time.time()
+        if _trace.enabled:
+            _trace.record(trace_recorder.TOKEN_SEND, self.port.id, self.peer_id, now, 0.0, sequencenbr_sent)
         _log.debug("Send on port  %s/%s/%s [%i] %s" % (self.port.owner.name,
                                                        self.peer_id,
                                                        self.port.name,
@@ -214,16 +223,19 @@ class TunnelOutEndpoint(Endpoint):
         if self.bulk:
             # Send all we have, since other side seems to keep up
             while self.port.queue.tokens_available(1, self.peer_id):
+                if not sent:
+                    now = time.time()
                 sent = True
-                self._send_one_token()
+                self._send_one_token(now)
         elif (self.port.queue.tokens_available(1, self.peer_id) and
               self.port.queue.com_is_committed(self.peer_id) and
               time.time() >= self.time_cont):
             # Send only one since other side sent NACK likely due to their FIFO is full
             # Something to read and last (N)ACK recived
-            self._send_one_token()
+            now = time.time()
+            self._send_one_token(now)
             sent = True
-            self.time_cont = time.time() + self.backoff
+            self.time_cont = now + self.backoff
             # Make sure that resend will be tried in backoff seconds
             self.trigger_loop(self.backoff)
         return sent
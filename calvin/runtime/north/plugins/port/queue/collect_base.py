@@ -15,7 +15,7 @@
 # limitations under the License.
 
 from calvin.runtime.north.calvin_token import Token
-from calvin.runtime.north.plugins.port.queue.common import QueueFull, COMMIT_RESPONSE
+from calvin.runtime.north.plugins.port.queue.common import QueueFull, COMMIT_RESPONSE, encode_fifo, encode_empty_fifo, decode_fifo
 from calvin.runtime.north.plugins.port import DISCONNECT
 from calvin.utilities import calvinlogger
 
@@ -61,7 +61,8 @@ class CollectBase(object):
         if remap is None:
             state = {
                 'queuetype': self._type,
-                'fifo': {p: [t.encode() for t in tokens] for p, tokens in self.fifo.items()},
+                'fifo': {p: encode_fifo(tokens, self.N, self.read_pos.get(p), self.write_pos.get(p))
+                         for p, tokens in self.fifo.items()},
                 'N': self.N,
                 'writers': self.writers,
                 'write_pos': self.write_pos,
@@ -73,7 +74,7 @@ class CollectBase(object):
         else:
             state = {
                 'queuetype': self._type,
-                'fifo': {remap[p] if p in remap else p: [Token(0).encode() for t in tokens] for p, tokens in self.fifo.items()},
+                'fifo': {remap[p] if p in remap else p: encode_empty_fifo(len(tokens)) for p, tokens in self.fifo.items()},
                 'N': self.N,
                 'writers': sorted([remap[pid] if pid in remap else pid for pid in self.writers]),
                 'write_pos': {remap[pid] if pid in remap else pid: 0 for pid in self.write_pos.keys()},
@@ -87,7 +88,7 @@ class CollectBase(object):
 
     def _set_state(self, state):
         self._type = state.get('queuetype')
-        self.fifo = {p: [Token.decode(t) for t in tokens] for p, tokens in state['fifo'].items()}
+        self.fifo = {p: decode_fifo(tokens) for p, tokens in state['fifo'].items()}
         self.N = state['N']
         self.writers = state['writers']
         self.write_pos = state['write_pos']
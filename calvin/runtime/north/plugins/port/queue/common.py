@@ -15,9 +15,38 @@
 # limitations under the License.
 
 from calvin.utilities.utils import enum
+from calvin.utilities import calvinconfig
+from calvin.runtime.north.calvin_token import Token
+
+_conf = calvinconfig.get()
 
 COMMIT_RESPONSE = enum('handled', 'unhandled', 'invalid')
 
+
+def compact_fifo():
+    """ Empty fifo slots are left out of queue states unless compact_state is false """
+    return _conf.get(None, 'compact_state') is not False
+
+
+def encode_fifo(fifo, N, first=None, last=None):
+    """ Encode the tokens of a fifo for the queue state, only the slots from position first
+        to last (exclusive) hold tokens, with compact state the empty slots are left out as None
+    """
+    if not compact_fifo() or first is None or last is None or last - first >= N:
+        return [t.encode() for t in fifo]
+    used = set([pos % N for pos in range(first, last)])
+    return [t.encode() if i in used else None for i, t in enumerate(fifo)]
+
+
+def encode_empty_fifo(N):
+    """ Encode a fifo of N slots without any tokens """
+    return [None] * N if compact_fifo() else [Token(0).encode()] * N
+
+
+def decode_fifo(encoded):
+    """ Decode a fifo encoded with encode_fifo or encode_empty_fifo """
+    return [Token(0) if t is None else Token.decode(t) for t in encoded]
+
 class QueueNone(object):
     def __init__(self):
         super(QueueNone, self).__init__()
@@ -15,7 +15,7 @@
 # limitations under the License.
 
 from calvin.runtime.north.calvin_token import Token
-from calvin.runtime.north.plugins.port.queue.common import QueueFull, QueueEmpty, COMMIT_RESPONSE
+from calvin.runtime.north.plugins.port.queue.common import QueueFull, QueueEmpty, COMMIT_RESPONSE, encode_fifo, encode_empty_fifo, decode_fifo
 from calvin.runtime.north.plugins.port import DISCONNECT
 from calvin.utilities import calvinlogger
 
@@ -54,9 +54,10 @@ class FanoutFIFO(object):
 
     def _state(self, remap=None):
         if remap is None:
+            first = min(self.read_pos.values()) if self.read_pos else self.write_pos
             state = {
                 'queuetype': self._type,
-                'fifo': [t.encode() for t in self.fifo],
+                'fifo': encode_fifo(self.fifo, self.N, first, self.write_pos),
                 'N': self.N,
                 'readers': list(self.readers),
                 'write_pos': self.write_pos,
@@ -68,7 +69,7 @@ class FanoutFIFO(object):
             # Remapping of port ids, also implies reset of tokens
             state = {
                 'queuetype': self._type,
-                'fifo': [Token(0).encode()] * len(self.fifo),
+                'fifo': encode_empty_fifo(len(self.fifo)),
                 'N': self.N,
                 'readers': [remap[pid] if pid in remap else pid for pid in self.readers],
                 'write_pos': 0,
@@ -80,7 +81,7 @@ class FanoutFIFO(object):
 
     def _set_state(self, state):
         self._type = state.get('queuetype',"fanout_fifo")
-        self.fifo = [Token.decode(d) for d in state['fifo']]
+        self.fifo = decode_fifo(state['fifo'])
         self.N = state['N']
         self.readers = set(state['readers'])
         self.write_pos = state['write_pos']
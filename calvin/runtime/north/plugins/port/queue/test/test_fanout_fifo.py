@@ -5,6 +5,7 @@ pytest_unittest = pytest.mark.unittest
 
 from calvin.runtime.north.calvin_token import Token
 from calvin.runtime.north.plugins.port import queue, DISCONNECT
+from calvin.runtime.north.plugins.port.queue import common
 from calvin.runtime.north.plugins.port.queue.common import QueueFull, QueueEmpty
 
 class DummyPort(object):
@@ -173,7 +174,35 @@ class TestFanoutFIFO(unittest.TestCase):
         # check that 1 token has been consumed
         for i in [1,2,3]:
             self.assertEqual(port.peek("reader-%d" % i).value, "data-%d" % 2)
-    
+
+    def testSerialize_EmptySlots(self):
+        self.outport.add_reader("reader-1", {})
+        for i in [1,2,3]:
+                self.outport.write(Token("data-%d" % i), None)
+        # consume first token
+        self.outport.peek("reader-1")
+        self.outport.commit("reader-1")
+        state = self.outport._state()
+        # only the unread tokens are in the state
+        self.assertEqual(len([t for t in state['fifo'] if t is not None]), 2)
+        port = self.create_port()
+        port._set_state(state)
+        self.assertEqual(port.peek("reader-1").value, "data-2")
+        self.assertEqual(port.peek("reader-1").value, "data-3")
+
+    def testSerialize_EmptySlotsNotCompact(self):
+        common._conf.set('global', 'compact_state', False)
+        try:
+            self.outport.add_reader("reader-1", {})
+            self.outport.write(Token("data-1"), None)
+            state = self.outport._state()
+            # all slots are encoded as tokens
+            self.assertEqual(state['fifo'][1:], [Token(0).encode()] * (self.outport.N - 1))
+            state = self.outport._state({"reader-1": "xreader-1"})
+            self.assertEqual(state['fifo'], [Token(0).encode()] * self.outport.N)
+        finally:
+            del common._conf.config['global']['compact_state']
+
     def testSerialize_remap(self):
         self.outport.add_reader("reader-1", {})
         self.outport.add_reader("reader-2", {})
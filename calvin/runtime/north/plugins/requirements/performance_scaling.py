@@ -14,99 +14,146 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from calvin.utilities.replication_defs import PRE_CHECK
+import time
 import random
+from calvin.utilities.replication_defs import PRE_CHECK
+from calvin.utilities import calvinconfig
 from calvin.utilities.calvinlogger import get_logger
 
 _log = get_logger(__name__)
+_conf = calvinconfig.get()
 
 req_type = "replication"
 
+# Defaults for the scaling parameters, can be set in the requirement kwargs or in the config as
+# autoscale_<name>
+DEFAULTS = {
+    # Seconds between evaluations
+    'interval': 1.0,
+    # Weight of a new sample in the exponentially smoothed values
+    'smoothing': 0.3,
+    # Seconds ahead that queue occupancy is predicted from the smoothed rates
+    'horizon': 2.0,
+    # Target queue occupancy (0-1), scale out above target + hysteresis
+    'target': 0.5,
+    'hysteresis': 0.2,
+    # Number of evaluations below target - hysteresis before scaling in
+    'scale_in_checks': 5,
+    # Seconds after a scaling operation when no new is made
+    'cooldown': 5.0
+}
+
+
+def _option(kwargs, name):
+    if name in kwargs:
+        return kwargs[name]
+    value = _conf.get(None, 'autoscale_' + name)
+    return DEFAULTS[name] if value is None else value
+
+
 def init(replication_data):
-    replication_data.replication_pressure_counts = {}
-    replication_data.check_pressure_positions = {}
-    replication_data.dereplication_position = {}
-    replication_data.check_count = 0
+    replication_data.arrival_rate = 0.0
+    replication_data.processing_rate = 0.0
+    replication_data.occupancy = 0.0
+    replication_data.low_count = 0
+    _reset(replication_data)
+
+
+def _reset(replication_data):
+    # Samples and times are local to the runtime
+    replication_data.scaling_sample = None
+    replication_data.scaling_next = 0.0
+    replication_data.scaling_last = None
+
 
 def set_state(replication_data, state):
-    replication_data.replication_pressure_counts = state.get('replication_pressure_counts', {})
-    replication_data.check_pressure_positions = state.get('check_pressure_positions', {})
-    replication_data.dereplication_position =  state.get('dereplication_position', {})
-    replication_data.check_count =  state.get('check_count', 0)
+    replication_data.arrival_rate = state.get('arrival_rate', 0.0)
+    replication_data.processing_rate = state.get('processing_rate', 0.0)
+    replication_data.occupancy = state.get('occupancy', 0.0)
+    replication_data.low_count = state.get('low_count', 0)
+    _reset(replication_data)
+
 
 def get_state(replication_data):
     state = {}
-    state['replication_pressure_counts'] = replication_data.replication_pressure_counts
-    state['check_pressure_positions'] = replication_data.check_pressure_positions
-    state['dereplication_position'] = replication_data.dereplication_position
-    state['check_count'] = replication_data.check_count
+    state['arrival_rate'] = replication_data.arrival_rate
+    state['processing_rate'] = replication_data.processing_rate
+    state['occupancy'] = replication_data.occupancy
+    state['low_count'] = replication_data.low_count
     return state
 
+
+def _sample(replication_data, actor, t, alpha):
+    """ Update the smoothed arrival and processing rates and queue occupancy,
+        returns the capacity of the queues or 0 when no new values
+    """
+    load = actor.get_queue_load().values()
+    written = sum(l[0] for l in load)
+    read = sum(l[1] for l in load)
+    capacity = sum(l[2] for l in load)
+    sample = replication_data.scaling_sample
+    replication_data.scaling_sample = (t, written, read)
+    if sample is None or not capacity or t <= sample[0]:
+        return 0
+    dt = t - sample[0]
+    # Positions are restored after a migration, but never count backwards
+    arrival = max(0, written - sample[1]) / dt
+    processing = max(0, read - sample[2]) / dt
+    occupancy = min(1.0, max(0, written - read) / float(capacity))
+    replication_data.arrival_rate += alpha * (arrival - replication_data.arrival_rate)
+    replication_data.processing_rate += alpha * (processing - replication_data.processing_rate)
+    replication_data.occupancy += alpha * (occupancy - replication_data.occupancy)
+    return capacity
+
+
 def pre_check(node, **kwargs):
     """ Check if actor should scale out/in
+        Predicts the inport queue occupancy from the smoothed arrival and processing rates,
+        scale out when above the target utilization and scale in when below it for a while.
     """
-    # TODO check if scale in as well
     actor_id = kwargs['actor_id']
     actor = node.am.actors[actor_id]
-    actor._replication_data._one_per_runtime = kwargs.get('alone', False)
+    replication_data = actor._replication_data
+    replication_data._one_per_runtime = kwargs.get('alone', False)
+    instances = len(replication_data.instances)
     # Check limits
-    if 'max' in kwargs and len(actor._replication_data.instances) > kwargs['max']:
+    if 'max' in kwargs and instances > kwargs['max']:
         return PRE_CHECK.SCALE_IN
-    if 'min' in kwargs and len(actor._replication_data.instances) < kwargs['min']:
+    if 'min' in kwargs and instances < kwargs['min']:
         return PRE_CHECK.SCALE_OUT
-    # Check performance
-    replicate_actor = False
-    dereplicate_actor = False
-    same_count = True
-    pressure = actor.get_pressure()
-    counts = {pp: port_queues[1] for pp, port_queues in pressure.items()}
-    positions = {pp: port_queues[0] for pp, port_queues in pressure.items()}
-    full_positions = {pp: port_queues[2][-2:] for pp, port_queues in pressure.items() if len(port_queues[2]) >= 2}
-    replicate_actor_pp = [
-        actor._replication_data.replication_pressure_counts.get(pp, 0) < (counts[pp] - 2) and
-        fp[0] > (positions[pp] - 15) and fp[1] > (positions[pp] - 15)
-        for pp, fp in full_positions.items()]
-    limit = 60
-    dereplicate_actor_pp = [
-        actor._replication_data.dereplication_position.get(pp, positions[pp]) < (positions[pp] - limit) and
-        fp[1] < (positions[pp] - limit)
-        for pp, fp in full_positions.items()]
-    same_count_pp = [
-        actor._replication_data.check_pressure_positions.get(pp, 0) == positions[pp]
-        for pp in full_positions]
-    replicate_actor = any(replicate_actor_pp)
-    dereplicate_actor = all(dereplicate_actor_pp)
-    same_count = all(same_count_pp)
-    #_log.info("PERF %s %s %s" % (positions.values(), counts.values(), full_positions.values()))
-    #_log.info("REP %s" % ["Y" if r else "N" for r in replicate_actor_pp])
-    #_log.info("DER %s" % ["Y" if r else "N" for r in dereplicate_actor_pp])
-    #_log.info("SAM %s" % ["Y" if r else "N" for r in same_count_pp])
-    if same_count:
-        actor._replication_data.check_count += 1
+    # Evaluate on own interval independent of how often called
+    t = time.time()
+    if t < replication_data.scaling_next:
+        return PRE_CHECK.NO_OPERATION
+    replication_data.scaling_next = t + _option(kwargs, 'interval')
+    capacity = _sample(replication_data, actor, t, _option(kwargs, 'smoothing'))
+    if not capacity:
+        return PRE_CHECK.NO_OPERATION
+    predicted = replication_data.occupancy + (
+        (replication_data.arrival_rate - replication_data.processing_rate) * _option(kwargs, 'horizon') / capacity)
+    target = _option(kwargs, 'target')
+    hysteresis = _option(kwargs, 'hysteresis')
+    if predicted < target - hysteresis:
+        replication_data.low_count += 1
     else:
-        actor._replication_data.check_count = 0
-        actor._replication_data.check_pressure_positions = positions
-    # Nothing has happend for a while, dereplicate
-    if actor._replication_data.check_count > 5:
-        dereplicate_actor = True
-    if replicate_actor:
-        if 'max' in kwargs and len(actor._replication_data.instances) == kwargs['max']:
-            actor._replication_data.check_count = 0
+        replication_data.low_count = 0
+    last = replication_data.scaling_last
+    if last is not None and t < last + _option(kwargs, 'cooldown'):
+        return PRE_CHECK.NO_OPERATION
+    if predicted > target + hysteresis:
+        if 'max' in kwargs and instances >= kwargs['max']:
             return PRE_CHECK.NO_OPERATION
-        actor._replication_data.replication_pressure_counts = counts
-        actor._replication_data.dereplication_position = positions
-        actor._replication_data.check_count = 0
+        _log.debug("Scale out %s predicted occupancy %f" % (actor_id, predicted))
+        replication_data.scaling_last = t
         return PRE_CHECK.SCALE_OUT
-    elif dereplicate_actor:
-        if len(actor._replication_data.instances) == kwargs.get('min', 1):
-            actor._replication_data.check_count = 0
+    if replication_data.low_count >= _option(kwargs, 'scale_in_checks'):
+        replication_data.low_count = 0
+        if instances <= kwargs.get('min', 1):
             return PRE_CHECK.NO_OPERATION
-        actor._replication_data.replication_pressure_counts = counts
-        actor._replication_data.dereplication_position = positions
-        actor._replication_data.check_count = 0
+        _log.debug("Scale in %s predicted occupancy %f" % (actor_id, predicted))
+        replication_data.scaling_last = t
         return PRE_CHECK.SCALE_IN
-    else:
-        return PRE_CHECK.NO_OPERATION
+    return PRE_CHECK.NO_OPERATION
 
 def initiate(node, actor, **kwargs):
     pass
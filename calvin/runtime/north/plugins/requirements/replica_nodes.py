@@ -17,6 +17,8 @@
 from calvin.utilities import dynops
 
 req_type = "placement"
+# Result depends on the actor, not only the requirement arguments
+req_actor_specific = True
 
 def req_op(node, actor_id=None, component=None):
     """ Returns any nodes that have replicas of actor """
@@ -19,18 +19,31 @@ from calvin.utilities import calvinlogger
 from calvin.utilities import calvinconfig
 from calvin.utilities.calvin_callback import CalvinCB
 from calvin.utilities import calvinuuid
+from calvin.runtime.south.plugins.async import async
 
 _conf = calvinconfig.get()
 _log = calvinlogger.get_logger(__name__)
 
 
 class StorageProxy(StorageBase):
-    """ Implements a storage that asks a master node, this is the client class"""
+    """ Implements a storage that asks a master node, this is the client class
+
+        Requests issued during the same reactor turn are pipelined to the master
+        in one BATCH frame, at most 'storage_proxy_window' requests are in flight
+        at a time and identical concurrent gets share a single request.
+    """
     def __init__(self, node):
         self.master_uri = _conf.get('global', 'storage_proxy')
         self.node = node
         self.tunnel = None
         self.replies = {}
+        # Requests waiting to be sent, in order
+        self.queued = []
+        # (cmd, key) -> list of callbacks waiting for an outstanding get
+        self.pending_gets = {}
+        self.inflight = 0
+        self.window = _conf.get(None, 'storage_proxy_window') or 32
+        self.flush_delayedcall = None
         _log.info("PROXY init for %s", self.master_uri)
         super(StorageProxy, self).__init__()
 
@@ -49,7 +62,8 @@ class StorageProxy(StorageBase):
                                corresponding_server_node_names=[fqdn.decode('unicode-escape')])
 
     def _start_link_cb(self, status, uri, peer_node_id, org_cb):
-        _log.analyze(self.node.id, "+", {'status': str(status)}, peer_node_id=peer_node_id)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'status': str(status)}, peer_node_id=peer_node_id)
         if status == "NACK":
             if org_cb:
                 org_cb(False)
@@ -66,8 +80,10 @@ class StorageProxy(StorageBase):
         _log.info("storage proxy down")
         if not self.tunnel:
             return True
-        _log.analyze(self.node.id, "+ CLIENT", {'tunnel_id': self.tunnel.id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", {'tunnel_id': self.tunnel.id})
         self.tunnel = None
+        self._fail_requests()
         # FIXME assumes that the org_cb is the callback given by storage when starting, can only be called once
         # not future up/down
         if org_cb:
@@ -75,12 +91,24 @@ class StorageProxy(StorageBase):
         # We should always return True which sends an ACK on the destruction of the tunnel
         return True
 
+    def _fail_requests(self):
+        """ Reply None to all requests not yet replied, they are lost with the tunnel """
+        replies = self.replies
+        self.replies = {}
+        self.queued = []
+        self.pending_gets = {}
+        self.inflight = 0
+        for key, cb in replies.itervalues():
+            if cb:
+                cb(key=key, value=None)
+
     def tunnel_up(self, org_cb):
         """ Callback that the tunnel is working """
         _log.info("storage proxy up")
         if not self.tunnel:
             return True
-        _log.analyze(self.node.id, "+ CLIENT", {'tunnel_id': self.tunnel.id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", {'tunnel_id': self.tunnel.id})
         # FIXME assumes that the org_cb is the callback given by storage when starting, can only be called once
         # not future up/down
         if org_cb:
@@ -90,49 +118,109 @@ class StorageProxy(StorageBase):
 
     def tunnel_recv_handler(self, payload):
         """ Gets called when a storage master replies"""
-        _log.analyze(self.node.id, "+ CLIENT", {'payload': payload})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", {'payload': payload})
+        if payload.get('cmd') == 'BATCH':
+            for msg in payload.get('msgs', []):
+                self._handle_reply(msg)
+        else:
+            self._handle_reply(payload)
+        if self.queued:
+            self._trigger_flush()
+
+    def _handle_reply(self, payload):
         if 'msg_uuid' in payload and payload['msg_uuid'] in self.replies and 'cmd' in payload and payload['cmd']=='REPLY':
-            self.replies.pop(payload['msg_uuid'])(**{k: v for k, v in payload.iteritems() if k in ('key', 'value')})
+            self.inflight -= 1
+            _, cb = self.replies.pop(payload['msg_uuid'])
+            if cb:
+                cb(**{k: v for k, v in payload.iteritems() if k in ('key', 'value')})
+
+    def _coalesced_reply(self, key, value, cbs, coalesce_key):
+        """ Reply to a get, fan out to all callbacks that waited on it """
+        if self.pending_gets.get(coalesce_key) is cbs:
+            del self.pending_gets[coalesce_key]
+        for cb in cbs:
+            if cb:
+                cb(key=key, value=value)
+
+    def _trigger_flush(self):
+        if self.flush_delayedcall is None:
+            self.flush_delayedcall = async.DelayedCall(0, self._flush)
+
+    def _flush(self):
+        """ Send queued requests, as many as the in-flight window allows """
+        self.flush_delayedcall = None
+        if not self.tunnel:
+            return
+        n = min(len(self.queued), self.window - self.inflight)
+        if n <= 0:
+            return
+        msgs = self.queued[:n]
+        del self.queued[:n]
+        self.inflight += n
+        if n == 1:
+            self.tunnel.send(msgs[0])
+        else:
+            self.tunnel.send({'cmd': 'BATCH', 'msgs': msgs})
 
     def send(self, cmd, msg, cb):
+        if cmd in ('GET', 'GET_CONCAT'):
+            coalesce_key = (cmd, msg['key'])
+            if coalesce_key in self.pending_gets:
+                self.pending_gets[coalesce_key].append(cb)
+                return
+            cbs = [cb]
+            self.pending_gets[coalesce_key] = cbs
+            cb = CalvinCB(self._coalesced_reply, cbs=cbs, coalesce_key=coalesce_key)
+        else:
+            # Modifying a key, gets issued after this must not join earlier gets
+            self.pending_gets.pop(('GET', msg['key']), None)
+            self.pending_gets.pop(('GET_CONCAT', msg['key']), None)
         msg_id = calvinuuid.uuid("MSGID")
-        self.replies[msg_id] = cb
-        msg['msg_uuid'] = msg_id
-        self.tunnel.send(dict(msg, cmd=cmd, msg_uuid=msg_id))
+        self.replies[msg_id] = (msg['key'], cb)
+        self.queued.append(dict(msg, cmd=cmd, msg_uuid=msg_id))
+        self._trigger_flush()
 
     def set(self, key, value, cb=None):
         """
             Set a key, value pair in the storage
         """
-        _log.analyze(self.node.id, "+ CLIENT", {'key': key, 'value': value})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", {'key': key, 'value': value})
         self.send(cmd='SET',msg={'key':key, 'value': value}, cb=cb)
 
     def get(self, key, cb=None):
         """
             Gets a value from the storage
         """
-        _log.analyze(self.node.id, "+ CLIENT", {'key': key})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", {'key': key})
         self.send(cmd='GET',msg={'key':key}, cb=cb)
 
     def get_concat(self, key, cb=None):
         """
             Gets a value from the storage
         """
-        _log.analyze(self.node.id, "+ CLIENT", {'key': key})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", {'key': key})
         self.send(cmd='GET_CONCAT',msg={'key':key}, cb=cb)
 
     def append(self, key, value, cb=None):
-        _log.analyze(self.node.id, "+ CLIENT", {'key': key, 'value': value})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", {'key': key, 'value': value})
         self.send(cmd='APPEND',msg={'key':key, 'value': value}, cb=cb)
 
     def remove(self, key, value, cb=None):
-        _log.analyze(self.node.id, "+ CLIENT", {'key': key, 'value': value})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", {'key': key, 'value': value})
         self.send(cmd='REMOVE',msg={'key':key, 'value': value}, cb=cb)
 
     def bootstrap(self, addrs, cb=None):
-        _log.analyze(self.node.id, "+ CLIENT", None)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", None)
 
     def stop(self, cb=None):
-        _log.analyze(self.node.id, "+ CLIENT", None)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CLIENT", None)
         if cb:
             cb()
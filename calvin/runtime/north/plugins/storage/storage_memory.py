@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from calvin.runtime.north.plugins.storage.storage_base import StorageBase
+from calvin.runtime.south.plugins.async import async
+from calvin.utilities import calvinlogger
+
+_log = calvinlogger.get_logger(__name__)
+
+
+class StorageMemory(StorageBase):
+    """
+        In-memory storage for a storage server node, i.e. a node serving
+        proxy storage requests for other runtimes.
+
+        Sets are kept as Python sets, only coded when read with get_concat.
+
+        Callbacks are called after the operation returns, like for the other
+        storage plugins, but all callbacks of one reactor turn are called from
+        a single DelayedCall instead of one DelayedCall per operation.
+    """
+    def __init__(self, node=None):
+        super(StorageMemory, self).__init__(node)
+        self._values = {}
+        self._sets = {}
+        # (cb, key, result) to call, in order
+        self._callbacks = []
+        self._callbacks_delayedcall = None
+
+    def _reply(self, cb, key, result):
+        if cb is None:
+            return
+        self._callbacks.append((cb, key, result))
+        if self._callbacks_delayedcall is None:
+            self._callbacks_delayedcall = async.DelayedCall(0, self._call_callbacks)
+
+    def _call_callbacks(self):
+        self._callbacks_delayedcall = None
+        callbacks = self._callbacks
+        self._callbacks = []
+        for cb, key, result in callbacks:
+            cb(key, result)
+
+    def start(self, iface='', network='', bootstrap=[], cb=None, name=None, nodeid=None):
+        if cb:
+            async.DelayedCall(0, cb, True)
+
+    def set(self, key, value, cb=None):
+        self._sets.pop(key, None)
+        if value is None:
+            # Set with None is a delete
+            self._values.pop(key, None)
+        else:
+            self._values[key] = value
+        self._reply(cb, key, True)
+
+    def get(self, key, cb=None):
+        self._reply(cb, key, self._values.get(key, None))
+
+    def get_concat(self, key, cb=None):
+        values = self._sets.get(key, None)
+        self._reply(cb, key, None if values is None else json.dumps(list(values)))
+
+    def append(self, key, value, cb=None):
+        try:
+            values = json.loads(value)
+        except:
+            _log.debug("Trying to append something not a JSON coded list %s" % value, exc_info=True)
+            self._reply(cb, key, False)
+            return
+        self._values.pop(key, None)
+        self._sets.setdefault(key, set()).update(values)
+        self._reply(cb, key, True)
+
+    def remove(self, key, value, cb=None):
+        try:
+            values = json.loads(value)
+        except:
+            _log.debug("Trying to remove something not a JSON coded list %s" % value, exc_info=True)
+            self._reply(cb, key, False)
+            return
+        existing = self._sets.get(key, None)
+        if existing is not None:
+            existing.difference_update(values)
+        self._reply(cb, key, True)
+
+    def bootstrap(self, addrs, cb=None):
+        if cb:
+            async.DelayedCall(0, cb, True)
+
+    def stop(self, cb=None):
+        if cb:
+            async.DelayedCall(0, cb, True)
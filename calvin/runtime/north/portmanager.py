@@ -45,12 +45,14 @@ class PortManager(object):
 
     def set_port_property(self, port_id=None, actor_id=None, port_dir=None, port_name=None,
                             port_property=None, value=None):
-        _log.analyze(self.node.id, "+", {port_property: value})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {port_property: value})
         port = self._get_local_port(actor_id=actor_id, port_name=port_name, port_dir=port_dir, port_id=port_id)
         return self._set_port_property(port, port_property, value)
 
     def set_script_port_property(self, actor_id, port_property_list):
-        _log.analyze(self.node.id, "+", port_property_list)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", port_property_list)
         success = []
         if port_property_list is None:
             return response.CalvinResponse(True)
@@ -69,7 +71,8 @@ class PortManager(object):
 
     def set_port_properties(self, port_id=None, actor_id=None, port_dir=None, port_name=None,
                             **port_properties):
-        _log.analyze(self.node.id, "+", port_properties)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", port_properties)
         port = self._get_local_port(actor_id=actor_id, port_name=port_name, port_dir=port_dir, port_id=port_id)
         success = []
         for port_property, value in port_properties.items():
@@ -83,13 +86,15 @@ class PortManager(object):
 
     def connection_request(self, payload):
         """ A request from a peer to connect a port"""
-        _log.analyze(self.node.id, "+", payload, peer_node_id=payload['from_rt_uuid'])
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", payload, peer_node_id=payload['from_rt_uuid'])
         if not ('peer_port_id' in payload or
                 ('peer_actor_id' in payload and
                 'peer_port_name' in payload and
                 'peer_port_properties' in payload)):
             # Not enough info to find port
-            _log.analyze(self.node.id, "+ NOT ENOUGH DATA", payload, peer_node_id=payload['from_rt_uuid'])
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ NOT ENOUGH DATA", payload, peer_node_id=payload['from_rt_uuid'])
             return response.CalvinResponse(response.BAD_REQUEST)
         our_port_meta = PortMeta(self,
                                 actor_id=payload['peer_actor_id'],
@@ -101,7 +106,8 @@ class PortManager(object):
             port = our_port_meta.port
         except:
             # We don't have the port
-            _log.analyze(self.node.id, "+ PORT NOT FOUND", payload, peer_node_id=payload['from_rt_uuid'])
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ PORT NOT FOUND", payload, peer_node_id=payload['from_rt_uuid'])
             return response.CalvinResponse(response.NOT_FOUND)
         else:
             # Let a specific connection handler take care of the request
@@ -131,8 +137,9 @@ class PortManager(object):
         peer_port_meta = PortMeta(self, actor_id=peer_actor_id, port_id=peer_port_id, port_name=peer_port_name,
                             properties=peer_port_properties, node_id=peer_node_id)
 
-        _log.analyze(self.node.id, "+", {'local': local_port_meta, 'peer': peer_port_meta},
-                    peer_node_id=peer_node_id, tb=True)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'local': local_port_meta, 'peer': peer_port_meta},
+                        peer_node_id=peer_node_id, tb=True)
         try:
             port = local_port_meta.port
         except response.CalvinResponseException as e:
@@ -181,8 +188,9 @@ class PortManager(object):
                          peer_port_name=port_meta.port_name,
                          peer_port_id=port_meta.port_id)
             return
-        _log.analyze(self.node.id, "+", {'local_port': local_port, 'peer_port': port_meta},
-                        peer_node_id=port_meta.node_id, tb=True)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'local_port': local_port, 'peer_port': port_meta},
+                            peer_node_id=port_meta.node_id, tb=True)
 
         ConnectionFactory(self.node, PURPOSE.CONNECT).get(local_port, port_meta, callback).connect()
 
@@ -246,21 +254,26 @@ class PortManager(object):
                     # Found locally
                     port_ids.append(port.id)
 
-        _log.analyze(self.node.id, "+", {'port_ids': port_ids})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'port_ids': port_ids})
         
         # Run over copy of list of ports since modified inside the loop
         for port_id in port_ids[:]:
-            _log.analyze(self.node.id, "+ PRE FACTORY", {'port_id': port_id})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ PRE FACTORY", {'port_id': port_id})
             connections = ConnectionFactory(self.node, PURPOSE.DISCONNECT).get_existing(
                             port_id, callback=callback)
-            _log.analyze(self.node.id, "+ POST FACTORY", {'port_id': port_id,
-                            'connections': map(lambda x: str(x), connections)})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ POST FACTORY", {'port_id': port_id,
+                                'connections': map(lambda x: str(x), connections)})
             # Run over copy since connections modified (tricky!) in loop
             for c in connections[:]:
                 c.disconnect(terminate=terminate)
-            _log.analyze(self.node.id, "+ POST DISCONNECT", {'port_id': port_id,
-                            'connection': str(c)})
-        _log.analyze(self.node.id, "+ DONE", {'actor_id': actor_id})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ POST DISCONNECT", {'port_id': port_id,
+                                'connection': str(c)})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ DONE", {'actor_id': actor_id})
 
     def _disconnecting_actor_cb(self, status, _callback, port_ids, port_id=None, actor_id=None):
         """ Get called for each of the actor's ports when disconnecting, but callback should only be called once
@@ -269,7 +282,8 @@ class PortManager(object):
             port_ids: list of port ids kept in context between calls when *changed* by this function, do not replace it
             state: dictionary keeping disconnect information
         """
-        _log.analyze(self.node.id, "+", {'port_ids': port_ids, 'port_id': port_id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'port_ids': port_ids, 'port_id': port_id})
         # Send negative response if not already done it
         if not status and port_ids:
             if _callback:
@@ -303,8 +317,9 @@ class PortManager(object):
             node_id=self.node.id)
         peer_port_meta = PortMeta(self, port_id=payload['port_id'], node_id=payload['from_rt_uuid'])
 
-        _log.analyze(self.node.id, "+", {'local': local_port_meta, 'peer': peer_port_meta},
-                    peer_node_id=payload['from_rt_uuid'], tb=True)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'local': local_port_meta, 'peer': peer_port_meta},
+                        peer_node_id=payload['from_rt_uuid'], tb=True)
         try:
             port = local_port_meta.port
         except response.CalvinResponseException as e:
@@ -343,16 +358,18 @@ class PortManager(object):
                 if port.name == port_name and port.owner and port.owner.id == actor_id and port.direction == port_dir:
                     return port
             # For new shadow actors we create the port
-            _log.analyze(self.node.id, "+ SHADOW PORT?", {'actor_id': actor_id, 'port_name': port_name,
-                                                            'port_dir': port_dir, 'port_id': port_id})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ SHADOW PORT?", {'actor_id': actor_id, 'port_name': port_name,
+                                                                'port_dir': port_dir, 'port_id': port_id})
             actor = self.node.am.actors.get(actor_id, None)
             _log.debug("SHADOW ACTOR: %s, %s, %s" %
                         (("SHADOW" if isinstance(actor, ShadowActor) else "NOT SHADOW"), type(actor), actor))
             if isinstance(actor, ShadowActor):
                 port = actor.create_shadow_port(port_name, port_dir, port_id)
-                _log.analyze(self.node.id, "+ CREATED SHADOW PORT",
-                                {'actor_id': actor_id, 'port_name': port_name,
-                                'port_dir': port_dir, 'port_id': port.id if port else None})
+                if _log.analyzing:
+                    _log.analyze(self.node.id, "+ CREATED SHADOW PORT",
+                                    {'actor_id': actor_id, 'port_name': port_name,
+                                    'port_dir': port_dir, 'port_id': port.id if port else None})
                 if port:
                     self.ports[port.id] = port
                     return port
@@ -21,6 +21,7 @@ from calvin.requests import calvinresponse
 from calvin.utilities.calvin_callback import CalvinCB
 from calvin.utilities.calvinuuid import uuid
 from calvin.utilities.calvinlogger import get_logger
+from calvin.utilities import calvinconfig
 from calvin.utilities import dynops
 from calvin.utilities.requirement_matching import ReqMatch
 from calvin.utilities.replication_defs import REPLICATION_STATUS, PRE_CHECK
@@ -32,6 +33,7 @@ from calvin.runtime.north.plugins.port import DISCONNECT
 from calvin.utilities.utils import enum
 
 _log = get_logger(__name__)
+_conf = calvinconfig.get()
 
 
 class ReplicationData(object):
@@ -159,6 +161,39 @@ class ReplicationManager(object):
     def __init__(self, node):
         super(ReplicationManager, self).__init__()
         self.node = node
+        # Replication control runs periodically and is woken up earlier on pressure changes,
+        # but not more often than the minimum period
+        self.loop_period = _conf.get(None, 'replication_loop_period') or 0.5
+        self.loop_min_period = _conf.get(None, 'replication_loop_min_period') or 0.05
+        self._loop = None
+        self._loop_at = 0.0
+        self._loop_last = 0.0
+
+    def start(self):
+        self.trigger_replication_loop(delay=True)
+
+    def trigger_replication_loop(self, delay=False):
+        """ Schedule the replication control after the period when delay,
+            otherwise as soon as the minimum period allows. Never have more than one outstanding.
+        """
+        t = time.time()
+        if delay:
+            at = t + self.loop_period
+        else:
+            at = max(t, self._loop_last + self.loop_min_period)
+        if self._loop is not None:
+            if self._loop_at <= at:
+                return
+            self._loop.cancel()
+        self._loop_at = at
+        self._loop = async.DelayedCall(at - t, self._replication_loop_timeout)
+
+    def _replication_loop_timeout(self):
+        self._loop = None
+        if self.node.quitting:
+            return
+        self.replication_loop()
+        self.trigger_replication_loop(delay=True)
 
     def supervise_actor(self, actor_id, requirements):
         try:
@@ -404,6 +439,14 @@ class ReplicationManager(object):
     def replication_loop(self):
         if self.node.quitting:
             return
+        start = time.time()
+        self._loop_last = start
+        try:
+            self._replication_control()
+        finally:
+            self.node.metering.add_cost("replication_loop", time.time() - start)
+
+    def _replication_control(self):
         replicate = []
         dereplicate = []
         no_op = []
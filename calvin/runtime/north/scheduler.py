@@ -22,6 +22,7 @@ from calvin.runtime.south.plugins.async import async
 from calvin.utilities.calvin_callback import CalvinCB
 from calvin.utilities.calvinlogger import get_logger
 from calvin.utilities import calvinconfig
+from calvin.utilities import metrics
 
 _log = get_logger(__name__)
 _conf = calvinconfig.get()
@@ -46,6 +47,8 @@ class Scheduler(object):
         self._maintenance_loop = None
         self._maintenance_delay = _conf.get(None, "maintenance_delay") or 300
         self.actor_pressures = {}
+        self._loop_time = metrics.get().histogram('scheduler_loop_seconds')
+        self._loop_fired = metrics.get().histogram('scheduler_actors_fired')
 
     def run(self):
         async.run_ioloop()
@@ -81,9 +84,6 @@ class Scheduler(object):
                 self._heartbeat_loop.cancel()
             self._heartbeat_loop = async.DelayedCall(self._heartbeat, self.trigger_loop)
 
-        # Control replication
-        self.node.rm.replication_loop()
-
     def trigger_loop(self, delay=0, actor_ids=None):
         """ Trigger the loop_once potentially after waiting delay seconds """
         if delay > 0:
@@ -117,24 +117,33 @@ class Scheduler(object):
         random.shuffle(actors)
 
         start_time = time.time()
+        now = start_time
         timeout = False
+        nbr_fired = 0
         for actor in actors:
             try:
                 _log.debug("Fire actor %s (%s, %s)" % (actor.name, actor._type, actor.id))
-                did_fire |= actor.fire()
+                if actor.fire():
+                    did_fire = True
+                    nbr_fired += 1
                 actor_ids.add(actor.id)
             except Exception as e:
                 self._log_exception_during_fire(e)
 
-            pressure = actor.get_pressure().values()
-            pressure_values = [p for _, _, p in pressure]
-            if self.actor_pressures.get(actor.id, False) != pressure_values:
-                self.actor_pressures[actor.id] = pressure_values
+            if self.actor_pressures.get(actor.id) != actor.pressure_count:
+                self.actor_pressures[actor.id] = actor.pressure_count
+                # Let replication control act on the change
+                self.node.rm.trigger_replication_loop()
 
-            timeout = time.time() - start_time > 0.100
+            now = time.time()
+            timeout = now - start_time > 0.100
             if timeout:
                 break
 
+        if actors:
+            self._loop_time.record((now - start_time) * 1000000)
+            self._loop_fired.record(nbr_fired)
+
         # FIXME: self.idle = not (timeout or did_fire)
         self.idle = False if timeout else not did_fire
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import hashlib
+import zlib
+from collections import OrderedDict
+
+import umsgpack
+
+from calvin.utilities import calvinconfig
+from calvin.utilities import calvinlogger
+
+_log = calvinlogger.get_logger(__name__)
+_conf = calvinconfig.get()
+
+umsgpack.compatibility = True
+
+CODEC = "msgpack"
+
+
+class MissingState(Exception):
+    """ The encoded state refers to values not in the cache, the peer needs to send them again """
+
+    def __init__(self, refs):
+        super(MissingState, self).__init__()
+        self.refs = refs
+
+    def __str__(self):
+        return "Missing state values %s" % self.refs
+
+
+def is_encoded(state):
+    return isinstance(state, dict) and state.get('_codec', None) == CODEC
+
+
+class StateCodec(object):
+    """
+    Compact encoding of actor states sent between runtimes.
+
+    Each top level value of the state is packed with msgpack and the whole is compressed
+    when large. Large values are identified by a hash of their content, when the peer has
+    already received a value (e.g. when replicating the same actor again) only the hash is sent.
+    The encoded state is a dict that can be sent with any message coder.
+    """
+
+    def __init__(self):
+        super(StateCodec, self).__init__()
+        self.compress_threshold = _conf.get(None, 'state_compress_threshold') or 1024
+        self.ref_threshold = _conf.get(None, 'state_ref_threshold') or 256
+        self.cache_size = _conf.get(None, 'state_cache_size') or 256
+        # Peer id: hashes of values the peer have received
+        self._sent = {}
+        # Hash: packed value received
+        self._cache = OrderedDict()
+
+    def encode(self, state, peer_id=None):
+        """ Encode state, values already sent to peer_id are only referenced by their hash """
+        values = {}
+        refs = []
+        sent = self._sent.setdefault(peer_id, OrderedDict()) if peer_id is not None else None
+        for key, value in state.iteritems():
+            packed = umsgpack.packb(value)
+            if sent is not None and len(packed) >= self.ref_threshold:
+                digest = hashlib.sha1(packed).hexdigest()
+                if digest in sent:
+                    values[key] = digest
+                    refs.append(key)
+                    continue
+                self._remember(sent, digest, True)
+            values[key] = packed
+        data = umsgpack.packb({'values': values, 'refs': refs})
+        compressed = len(data) >= self.compress_threshold
+        if compressed:
+            data = zlib.compress(data)
+        return {'_codec': CODEC, 'compressed': compressed, 'data': base64.b64encode(data)}
+
+    def decode(self, encoded):
+        """ Decode a state, raises MissingState when it refers to values not in the cache """
+        data = base64.b64decode(encoded['data'])
+        if encoded.get('compressed', False):
+            data = zlib.decompress(data)
+        content = umsgpack.unpackb(data)
+        values = content['values']
+        refs = set(content['refs'])
+        missing = [values[key] for key in refs if values[key] not in self._cache]
+        if missing:
+            raise MissingState(missing)
+        state = {}
+        for key, packed in values.iteritems():
+            if key in refs:
+                packed = self._cache[packed]
+                self._remember(self._cache, values[key], packed)
+            elif len(packed) >= self.ref_threshold:
+                self._remember(self._cache, hashlib.sha1(packed).hexdigest(), packed)
+            state[key] = umsgpack.unpackb(packed)
+        return state
+
+    def forget(self, peer_id):
+        """ The peer lost values, send everything next time """
+        self._sent.pop(peer_id, None)
+
+    def _remember(self, cache, digest, value):
+        cache.pop(digest, None)
+        cache[digest] = value
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
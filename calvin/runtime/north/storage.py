@@ -26,10 +26,14 @@ from calvin.utilities import calvinconfig
 from calvin.actorstore.store import GlobalStore
 from calvin.utilities.security import Security, security_enabled
 from calvin.utilities import dynops
+from calvin.utilities import metrics
+from calvin.utilities import trace_recorder
 import re
+import time
 
 _log = calvinlogger.get_logger(__name__)
 _conf = calvinconfig.get()
+_trace = trace_recorder.get()
 
 class Storage(object):
 
@@ -46,8 +50,16 @@ class Storage(object):
         storage_type = _conf.get('global', 'storage_type')
         _log.info("#### STORAGE TYPE %s ####", storage_type)
         self.proxy = _conf.get('global', 'storage_proxy') if storage_type == 'proxy' else None
-        _log.analyze(self.node.id, "+", {'proxy': self.proxy})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'proxy': self.proxy})
         self.tunnel = {}
+        # Proxy server state: outstanding gets shared by clients and replies queued per tunnel
+        self._proxy_gets = {}
+        self._proxy_get_timeout = _conf.get(None, 'storage_proxy_get_timeout') or 10.0
+        self._proxy_replies = {}
+        self._proxy_flush_delayedcall = None
+        # Called with the index when this node changes an index
+        self._index_listeners = []
         self.starting = storage_type != 'local'
         if override_storage:
             self.storage = override_storage
@@ -55,8 +67,22 @@ class Storage(object):
             self.storage = storage_factory.get(storage_type, node)
         self.coder = message_coder_factory.get("json")  # TODO: always json? append/remove requires json at the moment
         self.flush_delayedcall = None
+        self._latency = {op: metrics.get().histogram('storage_op_seconds', op=op)
+                         for op in ('set', 'get', 'get_concat', 'append', 'remove')}
         self.reset_flush_timeout()
 
+    def _timed(self, op, prefix, cb):
+        """ Wrap the storage plugin callback cb to record the latency of op on a prefix key """
+        return CalvinCB(self._timed_cb, op, prefix, time.time(), cb)
+
+    def _timed_cb(self, op, prefix, start, cb, *args, **kwargs):
+        duration = time.time() - start
+        self._latency[op].record(duration * 1000000)
+        if _trace.enabled:
+            # Only the key prefix, e.g. actor-, to keep the trace's name table small
+            _trace.record(trace_recorder.STORAGE_OP, op, prefix, start, duration)
+        cb(*args, **kwargs)
+
     ### Storage life cycle management ###
 
     def reset_flush_timeout(self):
@@ -80,12 +106,13 @@ class Storage(object):
         if self.flush_timeout < 600:
             self.flush_timeout = self.flush_timeout * 2
         self.flush_delayedcall = None
-        for key in self.localstore:
-            _log.debug("Flush key %s: %s" % (key, self.localstore[key]))
-            self.storage.set(key=key, value=self.localstore[key],
+        # The callbacks remove flushed keys, could be called directly by the storage
+        for key, value in self.localstore.items():
+            _log.debug("Flush key %s: %s" % (key, value))
+            self.storage.set(key=key, value=value,
                              cb=CalvinCB(func=self.set_cb, org_key=None, org_value=None, org_cb=None, silent=True))
 
-        for key, value in self.localstore_sets.iteritems():
+        for key, value in self.localstore_sets.items():
             self._flush_append(key, value['+'])
             self._flush_remove(key, value['-'])
 
@@ -135,7 +162,8 @@ class Storage(object):
     def start(self, iface='', cb=None):
         """ Start storage
         """
-        _log.analyze(self.node.id, "+", None)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", None)
         if self.starting:
             name = self.node.attributes.get_node_name_as_str() or self.node.id
             try:
@@ -149,7 +177,8 @@ class Storage(object):
             self._init_proxy()
 
     def _init_proxy(self):
-        _log.analyze(self.node.id, "+ SERVER", None)
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ SERVER", None)
         # We are not proxy client, so we can be proxy bridge/master
         self._proxy_cmds = {'GET': self.get,
                             'SET': self.set,
@@ -167,7 +196,8 @@ class Storage(object):
     def stop(self, cb=None):
         """ Stop storage
         """
-        _log.analyze(self.node.id, "+", {'started': self.started})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'started': self.started})
         if self.started:
             self.storage.stop(cb=cb)
         elif cb:
@@ -213,7 +243,8 @@ class Storage(object):
         # Always save locally
         self.localstore[prefix + key] = value
         if self.started:
-            self.storage.set(key=prefix + key, value=value, cb=CalvinCB(func=self.set_cb, org_key=key, org_value=value, org_cb=cb))
+            self.storage.set(key=prefix + key, value=value,
+                             cb=self._timed('set', prefix, CalvinCB(func=self.set_cb, org_key=key, org_value=value, org_cb=cb)))
         elif cb:
             async.DelayedCall(0, cb, key=key, value=True)
 
@@ -244,22 +275,49 @@ class Storage(object):
             async.DelayedCall(0, cb, key=key, value=value)
         else:
             try:
-                self.storage.get(key=prefix + key, cb=CalvinCB(func=self.get_cb, org_cb=cb, org_key=key))
+                self.storage.get(key=prefix + key, cb=self._timed('get', prefix, CalvinCB(func=self.get_cb, org_cb=cb, org_key=key)))
             except:
                 if self.started:
                     _log.error("Failed to get: %s" % key)
                 async.DelayedCall(0, cb, key=key, value=False)
 
+    def get_many_cb(self, key, value, values, nbr_keys, org_cb):
+        """ get_many callback, collects the values
+        """
+        values[key] = value
+        if len(values) == nbr_keys:
+            org_cb(values=values)
+
+    def get_many(self, prefix, keys, cb):
+        """ Get single values for the registry keys: prefix+key, for each key in keys.
+            Callback cb with signature cb(values={key: <retrived value>/None/False}),
+            called once when all values are retrieved, see get for the values.
+            The gets are issued together, hence with a proxy storage they are sent
+            to the storage server in one request frame.
+        """
+        if not cb:
+            return
+        keys = set(keys)
+        if not keys:
+            async.DelayedCall(0, cb, values={})
+            return
+        values = {}
+        for key in keys:
+            self.get(prefix, key, cb=CalvinCB(self.get_many_cb, values=values, nbr_keys=len(keys), org_cb=cb))
+
     def get_iter_cb(self, key, value, it, org_key, include_key=False):
         """ get callback
         """
-        _log.analyze(self.node.id, "+ BEGIN", {'value': value, 'key': org_key})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ BEGIN", {'value': value, 'key': org_key})
         if value:
             value = self.coder.decode(value)
             it.append((key, value) if include_key else value)
-            _log.analyze(self.node.id, "+", {'value': value, 'key': org_key})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+", {'value': value, 'key': org_key})
         else:
-            _log.analyze(self.node.id, "+", {'value': 'FailedElement', 'key': org_key})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+", {'value': 'FailedElement', 'key': org_key})
             it.append((key, dynops.FailedElement) if include_key else dynops.FailedElement)
 
     def get_iter(self, prefix, key, it, include_key=False):
@@ -284,7 +342,8 @@ class Storage(object):
                 value = self.localstore[prefix + key]
                 if value:
                     value = self.coder.decode(value)
-                _log.analyze(self.node.id, "+", {'value': value, 'key': key})
+                if _log.analyzing:
+                    _log.analyze(self.node.id, "+", {'value': value, 'key': key})
                 it.append((key, value) if include_key else value)
             else:
                 try:
@@ -292,7 +351,8 @@ class Storage(object):
                                      cb=CalvinCB(func=self.get_iter_cb, it=it, org_key=key, include_key=include_key))
                 except:
                     if self.started:
-                        _log.analyze(self.node.id, "+", {'value': 'FailedElement', 'key': key})
+                        if _log.analyzing:
+                            _log.analyze(self.node.id, "+", {'value': 'FailedElement', 'key': key})
                         _log.error("Failed to get: %s" % key)
                     it.append((key, dynops.FailedElement) if include_key else dynops.FailedElement)
 
@@ -328,7 +388,8 @@ class Storage(object):
             return
 
         if prefix + key in self.localstore_sets:
-            _log.analyze(self.node.id, "+ GET LOCAL", None)
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ GET LOCAL", None)
             value = self.localstore_sets[prefix + key]
             # Return the set that we intended to append since that's all we have until it is synced
             local_list = list(value['+'])
@@ -336,7 +397,8 @@ class Storage(object):
             local_list = []
         try:
             self.storage.get_concat(key=prefix + key,
-                                    cb=CalvinCB(func=self.get_concat_cb, org_cb=cb, org_key=key, local_list=local_list))
+                                    cb=self._timed('get_concat', prefix, CalvinCB(func=self.get_concat_cb, org_cb=cb,
+                                                                          org_key=key, local_list=local_list)))
         except:
             if self.started:
                 _log.error("Failed to get: %s" % key, exc_info=True)
@@ -345,14 +407,17 @@ class Storage(object):
     def get_concat_iter_cb(self, key, value, org_key, include_key, it):
         """ get callback
         """
-        _log.analyze(self.node.id, "+ BEGIN", {'key': org_key, 'value': value, 'iter': str(it)})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ BEGIN", {'key': org_key, 'value': value, 'iter': str(it)})
         if value:
             value = self.coder.decode(value)
-            _log.analyze(self.node.id, "+ VALUE", {'value': value, 'key': org_key})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ VALUE", {'value': value, 'key': org_key})
             if isinstance(value, (list, tuple, set)):
                 it.extend([(org_key, v) for v in value] if include_key else value)
         it.final()
-        _log.analyze(self.node.id, "+ END", {'key': org_key, 'iter': str(it)})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ END", {'key': org_key, 'iter': str(it)})
 
     def get_concat_iter(self, prefix, key, include_key=False):
         """ Get multiple values for registry key: prefix+key,
@@ -374,13 +439,16 @@ class Storage(object):
             list of values, it may also miss values added by others but
             not yet distributed.
         """
-        _log.analyze(self.node.id, "+ BEGIN", {'key': key})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ BEGIN", {'key': key})
         if prefix + key in self.localstore_sets:
-            _log.analyze(self.node.id, "+ GET LOCAL", None)
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ GET LOCAL", None)
             value = self.localstore_sets[prefix + key]
             # Return the set that we intended to append since that's all we have until it is synced
             local_list = list(value['+'])
-            _log.analyze(self.node.id, "+", {'value': local_list, 'key': key})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+", {'value': local_list, 'key': key})
         else:
             local_list = []
         if include_key:
@@ -394,7 +462,8 @@ class Storage(object):
             if self.started:
                 _log.error("Failed to get: %s" % key, exc_info=True)
             it.final()
-        _log.analyze(self.node.id, "+ END", {'key': key, 'iter': str(it)})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ END", {'key': key, 'iter': str(it)})
         return it
 
     def append_cb(self, key, value, org_key, org_value, org_cb, silent=False):
@@ -438,7 +507,8 @@ class Storage(object):
         if self.started:
             coded_value = self.coder.encode(list(self.localstore_sets[prefix + key]['+']))
             self.storage.append(key=prefix + key, value=coded_value,
-                                cb=CalvinCB(func=self.append_cb, org_key=key, org_value=value, org_cb=cb))
+                                cb=self._timed('append', prefix, CalvinCB(func=self.append_cb, org_key=key,
+                                                                  org_value=value, org_cb=cb)))
         else:
             if cb:
                 cb(key=key, value=True)
@@ -484,7 +554,8 @@ class Storage(object):
         if self.started:
             coded_value = self.coder.encode(list(self.localstore_sets[prefix + key]['-']))
             self.storage.remove(key=prefix + key, value=coded_value,
-                                cb=CalvinCB(func=self.remove_cb, org_key=key, org_value=value, org_cb=cb))
+                                cb=self._timed('remove', prefix, CalvinCB(func=self.remove_cb, org_key=key,
+                                                                  org_value=value, org_cb=cb)))
         else:
             if cb:
                 cb(key=key, value=True)
@@ -618,7 +689,8 @@ class Storage(object):
 
     def _delete_node_index(self, node, cb=None):
         indexes = node.attributes.get_indexed_public()
-        _log.analyze(self.node.id, "+", {'indexes': indexes})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'indexes': indexes})
         try:
             counter = [len(indexes)]  # counter value by reference used in callback
             for index in indexes:
@@ -631,13 +703,15 @@ class Storage(object):
                 cb()
 
     def _delete_node_cb(self, counter, org_cb, *args, **kwargs):
-        _log.analyze(self.node.id, "+", {'counter': counter[0]})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'counter': counter[0]})
         counter[0] = counter[0] - 1
         if counter[0] == 0:
             org_cb(*args, **kwargs)
 
     def _delete_node_timeout_cb(self, counter, org_cb):
-        _log.analyze(self.node.id, "+", {'counter': counter[0]})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+", {'counter': counter[0]})
         if counter[0] > 0:
             _log.debug("Delete node index not finished but call callback anyway")
             org_cb()
@@ -855,6 +929,14 @@ class Storage(object):
         indexes = ['/'+'/'.join(items[:l]) for l in range(1,len(items)+1)]
         return indexes
 
+    def add_index_listener(self, cb):
+        """ Register cb(index) to be called when an index is added to or removed from """
+        self._index_listeners.append(cb)
+
+    def _index_changed(self, index):
+        for cb in self._index_listeners:
+            cb(index)
+
     def add_index(self, index, value, root_prefix_level=3, cb=None):
         """
         Add single value (e.g. a node id) to a set stored in registry
@@ -878,6 +960,7 @@ class Storage(object):
         # prefix search built in.
 
         _log.debug("add index %s: %s" % (index, value))
+        self._index_changed(index)
 
         indexes = self._index_strings(index, root_prefix_level)
 
@@ -914,6 +997,7 @@ class Storage(object):
         # all deeper indeces. But no current use case exist either.
 
         _log.debug("remove index %s: %s" % (index, value))
+        self._index_changed(index)
 
         indexes = self._index_strings(index, root_prefix_level)
 
@@ -1026,7 +1110,8 @@ class Storage(object):
     def tunnel_request_handles(self, tunnel):
         """ Incoming tunnel request for storage proxy server"""
         # TODO check if we want a tunnel first
-        _log.analyze(self.node.id, "+ SERVER", {'tunnel_id': tunnel.id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ SERVER", {'tunnel_id': tunnel.id})
         self.tunnel[tunnel.peer_node_id] = tunnel
         tunnel.register_tunnel_down(CalvinCB(self.tunnel_down, tunnel))
         tunnel.register_tunnel_up(CalvinCB(self.tunnel_up, tunnel))
@@ -1036,24 +1121,40 @@ class Storage(object):
 
     def tunnel_down(self, tunnel):
         """ Callback that the tunnel is not accepted or is going down """
-        _log.analyze(self.node.id, "+ SERVER", {'tunnel_id': tunnel.id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ SERVER", {'tunnel_id': tunnel.id})
+        # Nobody to reply to on this tunnel anymore
+        for fanin in self._proxy_gets.values():
+            fanin['waiters'][:] = [w for w in fanin['waiters'] if w[0] is not tunnel]
+        self._proxy_replies.pop(tunnel.id, None)
         # We should always return True which sends an ACK on the destruction of the tunnel
         return True
 
     def tunnel_up(self, tunnel):
         """ Callback that the tunnel is working """
-        _log.analyze(self.node.id, "+ SERVER", {'tunnel_id': tunnel.id})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ SERVER", {'tunnel_id': tunnel.id})
         # We should always return True which sends an ACK on the destruction of the tunnel
         return True
 
     def _proxy_reply(self, cb, *args, **kwargs):
         # Should not get any replies to the server but log it just in case
-        _log.analyze(self.node.id, "+ SERVER", {args: args, 'kwargs': kwargs})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ SERVER", {args: args, 'kwargs': kwargs})
 
     def tunnel_recv_handler(self, tunnel, payload):
         """ Gets called when a storage client request"""
         _log.debug("Storage proxy request %s" % payload)
-        _log.analyze(self.node.id, "+ SERVER", {'payload': payload})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ SERVER", {'payload': payload})
+        if payload.get('cmd') == 'BATCH':
+            # Pipelined requests, handled in order
+            for msg in payload.get('msgs', []):
+                self._proxy_handle_request(tunnel, msg)
+        else:
+            self._proxy_handle_request(tunnel, payload)
+
+    def _proxy_handle_request(self, tunnel, payload):
         if 'cmd' in payload and payload['cmd'] in self._proxy_cmds:
             if 'value' in payload:
                 if payload['cmd'] == 'SET' and payload['value'] is None:
@@ -1063,18 +1164,72 @@ class Storage(object):
                 else:
                     # Normal set op, but it will be encoded again in the set func when external storage, hence decode
                     payload['value']=self.coder.decode(payload['value'])
+            cmd = payload['cmd']
+            if cmd in ('GET', 'GET_CONCAT'):
+                # Identical concurrent gets, from any client, share one backend operation
+                fanin_key = (cmd, payload['key'])
+                if fanin_key in self._proxy_gets:
+                    self._proxy_gets[fanin_key]['waiters'].append((tunnel, payload['msg_uuid']))
+                    return
+                fanin = {'waiters': [(tunnel, payload['msg_uuid'])]}
+                fanin['timeout'] = async.DelayedCall(self._proxy_get_timeout, self._proxy_fanin_timeout,
+                                                     payload['key'], fanin, fanin_key)
+                self._proxy_gets[fanin_key] = fanin
+                cb = CalvinCB(self._proxy_fanin_reply, fanin=fanin, fanin_key=fanin_key)
+            else:
+                if 'key' in payload:
+                    # Later gets must see the result of this operation
+                    self._proxy_gets.pop(('GET', payload['key']), None)
+                    self._proxy_gets.pop(('GET_CONCAT', payload['key']), None)
+                cb = CalvinCB(self._proxy_send_reply, tunnel=tunnel, encode=False, msgid=payload['msg_uuid'])
             # Call this nodes storage methods, which could be local or DHT,
             # prefix is empty since that is already in the key (due to these calls come from the storage plugin level).
             # If we are doing a get or get_concat then the result needs to be encoded, to correspond with what the
             # client's higher level expect from storage plugin level.
-            self._proxy_cmds[payload['cmd']](cb=CalvinCB(self._proxy_send_reply, tunnel=tunnel,
-                                                        encode=True if payload['cmd'] in ('GET', 'GET_CONCAT') else False,
-                                                        msgid=payload['msg_uuid']),
-                                             prefix="",
-                                             **{k: v for k, v in payload.iteritems() if k in ('key', 'value')})
+            self._proxy_cmds[cmd](cb=cb, prefix="", **{k: v for k, v in payload.iteritems() if k in ('key', 'value')})
         else:
             _log.error("Unknown storage proxy request %s" % payload['cmd'] if 'cmd' in payload else "")
 
+    def _proxy_fanin_reply(self, key, value, fanin, fanin_key):
+        if self._proxy_gets.get(fanin_key) is fanin:
+            del self._proxy_gets[fanin_key]
+        timeout = fanin.pop('timeout', None)
+        if timeout:
+            timeout.cancel()
+        waiters = fanin['waiters']
+        if not waiters:
+            return
+        encoded_value = self.coder.encode(value)
+        for tunnel, msgid in waiters:
+            self._proxy_queue_reply(tunnel, {'cmd': 'REPLY', 'msg_uuid': msgid, 'key': key, 'value': encoded_value})
+        # Replied, a late timeout or backend callback has nobody left to reply to
+        del waiters[:]
+
+    def _proxy_fanin_timeout(self, key, fanin, fanin_key):
+        """ The backend never replied to a shared get, reply None so that the key is not blocked """
+        fanin.pop('timeout', None)
+        if fanin['waiters']:
+            _log.warning("Storage proxy get of %s timed out" % key)
+        self._proxy_fanin_reply(key, None, fanin, fanin_key)
+
     def _proxy_send_reply(self, key, value, tunnel, encode, msgid):
-        _log.analyze(self.node.id, "+ SERVER", {'msgid': msgid, 'key': key, 'value': value})
-        tunnel.send({'cmd': 'REPLY', 'msg_uuid': msgid, 'key': key, 'value': self.coder.encode(value) if encode else value})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ SERVER", {'msgid': msgid, 'key': key, 'value': value})
+        self._proxy_queue_reply(tunnel, {'cmd': 'REPLY', 'msg_uuid': msgid, 'key': key,
+                                         'value': self.coder.encode(value) if encode else value})
+
+    def _proxy_queue_reply(self, tunnel, reply):
+        """ Replies to the same client during one reactor turn are sent in one frame """
+        self._proxy_replies.setdefault(tunnel.id, (tunnel, []))[1].append(reply)
+        if self._proxy_flush_delayedcall is None:
+            self._proxy_flush_delayedcall = async.DelayedCall(0, self._proxy_flush_replies)
+
+    def _proxy_flush_replies(self):
+        self._proxy_flush_delayedcall = None
+        replies = self._proxy_replies
+        self._proxy_replies = {}
+        for tunnel, msgs in replies.itervalues():
+            if len(msgs) == 1:
+                tunnel.send(msgs[0])
+            else:
+                tunnel.send({'cmd': 'BATCH', 'msgs': msgs})
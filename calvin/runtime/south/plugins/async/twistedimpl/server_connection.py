@@ -150,6 +150,13 @@ class LineProtocol(LineReceiver):
 
 
 class HTTPProtocol(LineReceiver):
+    """
+    HTTP server connection. Either polled, one request at a time with data_available and
+    data_get, or when the factory has a request_cb, event driven with keep-alive and
+    pipelining: each request is passed to request_cb(connection, seq, command, headers, data)
+    when received and its response given to respond(seq, ...), responses are sent in
+    request order.
+    """
 
     def __init__(self, factory, actor_id):
         self.delimiter = '\r\n\r\n'
@@ -161,25 +168,46 @@ class HTTPProtocol(LineReceiver):
         self.factory = factory
         self._actor_id = actor_id
         self._expected_length = 0
+        # Event driven: sequence number of next request and next response to send
+        self._request_seq = 0
+        self._response_seq = 0
+        # seq: (version, keep alive) of requests not yet responded to
+        self._requests = {}
+        # seq: response waiting for earlier responses
+        self._responses = {}
+        self._closing = False
+        # Streamed responses: False while the transport's write buffer is full
+        self.writable = True
+        self._writable_cb = None
 
         self.factory.connections.append(self)
-        self.factory.trigger()
+        if self.factory.request_cb is None:
+            self.factory.trigger()
 
     def connectionLost(self, reason):
         self.connection_lost = True
         self.factory.connections.remove(self)
-        self.factory.trigger()
+        if self.factory.request_cb is None:
+            self.factory.trigger()
 
     def rawDataReceived(self, data):
         self._data_buffer += data
 
-        if self._expected_length - len(self._data_buffer) == 0:
-            self._data = self._data_buffer
+        if len(self._data_buffer) >= self._expected_length:
+            self._data = self._data_buffer[:self._expected_length]
+            rest = self._data_buffer[self._expected_length:]
             self._data_buffer = b""
-            self.data_available = True
-            self.factory.trigger()
+            if self.factory.request_cb is None:
+                self.data_available = True
+                self.factory.trigger()
+            else:
+                self._request_received(self._data)
+                # Pipelined requests following the body
+                self.setLineMode(rest)
 
     def lineReceived(self, line):
+        if self._closing:
+            return
         header = [h.strip() for h in line.split("\r\n")]
         self._command = header.pop(0)
         self._header = {}
@@ -189,13 +217,68 @@ class HTTPProtocol(LineReceiver):
         self._expected_length = int(self._header.get('content-length', 0))
         if self._expected_length != 0:
             self.setRawMode()
-        else:
+        elif self.factory.request_cb is None:
             self.data_available = True
             self.factory.trigger()
+        else:
+            self._request_received(b"")
+
+    def _request_received(self, data):
+        seq = self._request_seq
+        self._request_seq += 1
+        version = "HTTP/1.1" if self._command.endswith("HTTP/1.1") else "HTTP/1.0"
+        connection = self._header.get('connection', "").lower()
+        keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+        self._requests[seq] = (version, keep_alive)
+        if not keep_alive:
+            # Ignore anything after a request that closes the connection
+            self._closing = True
+        command, headers = self._command, self._header
+        if command.lower().startswith("get "):
+            data = b""
+        self._header = None
+        self._expected_length = 0
+        self.factory.request_cb(self, seq, command, headers, data)
+
+    def respond(self, seq, status, headers, data):
+        """ Respond to request seq with status e.g. '200 OK', list of header lines and data (or None) """
+        if seq not in self._requests:
+            return
+        self._responses[seq] = (status, headers, data)
+        while self._response_seq in self._responses and not self.connection_lost:
+            status, headers, data = self._responses.pop(self._response_seq)
+            version, keep_alive = self._requests.pop(self._response_seq)
+            self._response_seq += 1
+            data = data or b""
+            lines = [version + " " + status] + headers + [
+                "Content-Length: %d" % len(data),
+                "Connection: " + ("keep-alive" if keep_alive else "close")]
+            self.transport.write("\r\n".join(lines) + "\r\n\r\n" + data)
+            if not keep_alive:
+                self.transport.loseConnection()
+                return
 
     def send(self, data):
         LineReceiver.sendLine(self, data)  # LineReceiver is an old style class.
 
+    def watch_writable(self, callback):
+        """ Track writable for a streamed response, callback is called when it becomes writable again """
+        if self._writable_cb is None and not self.connection_lost:
+            self.transport.registerProducer(self, True)
+        self._writable_cb = callback
+
+    # Push producer, paused by the transport when its write buffer is full
+    def pauseProducing(self):
+        self.writable = False
+
+    def resumeProducing(self):
+        self.writable = True
+        if self._writable_cb is not None:
+            self._writable_cb()
+
+    def stopProducing(self):
+        self._writable_cb = None
+
     def close(self):
         self.transport.loseConnection()
 
@@ -217,8 +300,11 @@ class HTTPProtocol(LineReceiver):
 
 
 class ServerProtocolFactory(Factory):
-    def __init__(self, trigger, mode='line', delimiter='\r\n', max_length=8192, actor_id=None, node_name=None):
+    def __init__(self, trigger, mode='line', delimiter='\r\n', max_length=8192, actor_id=None, node_name=None,
+                 request_cb=None):
         self._trigger             = trigger
+        # In http mode, when given requests are passed to request_cb instead of polled
+        self.request_cb          = request_cb
         self.mode                = mode
         self.delimiter           = delimiter
         self.MAX_LENGTH          = max_length
@@ -238,6 +324,9 @@ class ServerProtocolFactory(Factory):
             connection = RawDataProtocol(self, self.MAX_LENGTH, actor_id=self._actor_id)
         elif self.mode == 'http':
             connection = HTTPProtocol(self, actor_id=self._actor_id)
+            if self.request_cb is not None:
+                # Not accepted, the requests are passed on when received
+                return connection
         else:
             raise Exception("ServerProtocolFactory: Protocol not supported")
         self.pending_connections.append((addr, connection))
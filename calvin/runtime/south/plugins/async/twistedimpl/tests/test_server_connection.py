@@ -214,3 +214,33 @@ class TestServer(object):
             _, self.conn = self.factory.accept()
 
         assert not self.factory.pending_connections
+
+
+@pytest.mark.unittest
+def test_http_pipelining():
+    from twisted.test.proto_helpers import StringTransport
+    requests = []
+    factory = server_connection.ServerProtocolFactory(None, mode='http',
+                                                      request_cb=lambda *args: requests.append(args))
+    conn = factory.buildProtocol(('127.0.0.1', 0))
+    transport = StringTransport()
+    conn.makeConnection(transport)
+    assert not factory.pending_connections
+
+    # Two pipelined requests, the first with a body
+    conn.dataReceived("POST /a HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}GET /b HTTP/1.1\r\n\r\n")
+    assert [(r[1], r[2], r[4]) for r in requests] == [(0, "POST /a HTTP/1.1", "{}"), (1, "GET /b HTTP/1.1", "")]
+
+    # Responses are sent in request order, and the connection is kept alive
+    conn.respond(1, "200 OK", [], "b")
+    assert transport.value() == ""
+    conn.respond(0, "204 No Content", [], None)
+    assert transport.value() == ("HTTP/1.1 204 No Content\r\nContent-Length: 0\r\nConnection: keep-alive\r\n\r\n"
+                                 "HTTP/1.1 200 OK\r\nContent-Length: 1\r\nConnection: keep-alive\r\n\r\nb")
+    assert not transport.disconnecting
+
+    # HTTP/1.0 closes after the response
+    conn.dataReceived("GET /c HTTP/1.0\r\n\r\n")
+    conn.respond(2, "200 OK", [], "c")
+    assert transport.value().endswith("Connection: close\r\n\r\nc")
+    assert transport.disconnecting
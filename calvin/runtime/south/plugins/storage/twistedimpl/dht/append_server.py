@@ -21,6 +21,7 @@
 import json
 import uuid
 import types
+import time
 
 from twisted.internet import defer, task, reactor
 from kademlia.network import Server
@@ -29,14 +30,19 @@ from kademlia.crawling import NodeSpiderCrawl, ValueSpiderCrawl, RPCFindResponse
 from kademlia.utils import digest
 from kademlia.storage import ForgetfulStorage
 from kademlia.node import Node
+from kademlia.utils import deferredDict
 from kademlia import version as kademlia_version
-from collections import Counter
+from collections import Counter, OrderedDict
 
 from twisted.python import log
 from calvin.utilities import calvinlogger
+from calvin.utilities import calvinconfig
+from calvin.utilities.histogram import Histogram
+from calvin.runtime.south.plugins.storage.twistedimpl.dht.orset import ORSet, is_encoded
 import base64
 
 _log = calvinlogger.get_logger(__name__)
+_conf = calvinconfig.get()
 
 # Make twisted (rpcudp) logs go to null
 log.startLogging(log.NullFile(), setStdout=0)
@@ -51,6 +57,92 @@ class ForgetfulStorageFix(ForgetfulStorage):
         return (False, default)
 
 
+def _conf_or_default(option, default):
+    value = _conf.get(None, option)
+    return default if value is None else value
+
+
+class LookupCache(object):
+    """ Bounded cache of lookup results, entries expire after ttl seconds """
+
+    def __init__(self, size, ttl):
+        super(LookupCache, self).__init__()
+        self.size = size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self.data[key]
+            self.misses += 1
+            return (False, None)
+        self.hits += 1
+        return (True, entry[1])
+
+    def set(self, key, value):
+        if self.ttl <= 0 or self.size <= 0:
+            return
+        self.data.pop(key, None)
+        self.data[key] = (time.time() + self.ttl, value)
+        while len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+    def remove(self, key):
+        self.data.pop(key, None)
+
+    def stats(self):
+        return {'size': len(self.data), 'hits': self.hits, 'misses': self.misses}
+
+
+def stored_set(storage, key):
+    """ The OR-set stored at key, also from a JSON coded list (e.g. stored by rpc_store), or None """
+    exists, current = storage.get(key)
+    if not exists:
+        return None
+    try:
+        return ORSet.from_value(current)
+    except:
+        # Not set-op data
+        return None
+
+
+def merge_set(storage, set_keys, key, delta):
+    """ Merge an OR-set delta into the set stored at key, returns the stored set """
+    set_keys.add(key)
+    current = stored_set(storage, key)
+    if current is None:
+        # Not a set before (e.g. deleted), start over with the delta
+        current = ORSet()
+    current.merge(delta)
+    # Always store to refresh the age of the key
+    storage[key] = current
+    return current
+
+
+def remove_from_set(storage, set_keys, key, values):
+    """ Remove the list values from the set stored at key, returns the stored set or None when no set """
+    set_keys.add(key)
+    current = stored_set(storage, key)
+    if current is not None:
+        # Tombstone the observed tags, the tombstones replicate with the set
+        current.remove(values)
+        storage[key] = current
+    return current
+
+
+def external_value(value):
+    """ Sets are handed to the storage layer as JSON coded lists """
+    if isinstance(value, ORSet):
+        return value.to_json()
+    if is_encoded(value):
+        return ORSet.decode(value).to_json()
+    return value
+
+
 class KademliaProtocolAppend(KademliaProtocol):
 
     def __init__(self, *args, **kwargs):
@@ -130,9 +222,9 @@ class KademliaProtocolAppend(KademliaProtocol):
                 newNodeClose = node.distanceTo(keynode) < neighbors[-1].distanceTo(keynode)
                 thisNodeClosest = self.sourceNode.distanceTo(keynode) < neighbors[0].distanceTo(keynode)
             if len(neighbors) == 0 or (newNodeClose and thisNodeClosest):
-                if key in self.set_keys:
-                    _log.debug("transfer append key value key=%s, value=%s" % (base64.b64encode(key), str(value)))
-                    ds.append(self.callAppend(node, key, value))
+                if key in self.set_keys and isinstance(value, ORSet):
+                    _log.debug("transfer append key value key=%s, value=%s" % (base64.b64encode(key), value.to_json()))
+                    ds.append(self.callAppend(node, key, value.encode()))
                 else:
                     _log.debug("transfer store key value key=%s, value=%s" % (base64.b64encode(key), str(value)))
                     ds.append(self.callStore(node, key, value))
@@ -147,6 +239,8 @@ class KademliaProtocolAppend(KademliaProtocol):
         exists, value = self.storage.get(key, None)
         if not exists:
             return self.rpc_find_node(sender, nodeid, key)
+        if isinstance(value, ORSet):
+            value = value.encode()
         return { 'value': value }
 
     def rpc_append(self, sender, nodeid, key, value):
@@ -156,22 +250,14 @@ class KademliaProtocolAppend(KademliaProtocol):
         self.router.addContact(source)
 
         try:
-            pvalue = json.loads(value)
-            self.set_keys.add(key)
-            if key not in self.storage:
-                _log.debug("%s append key: %s not in storage set value: %s" % (base64.b64encode(nodeid), base64.b64encode(key), pvalue))
-                self.storage[key] = value
-            else:
-                old_value_ = self.storage[key]
-                old_value = json.loads(old_value_)
-                new_value = list(set(old_value + pvalue))
-                _log.debug("%s append key: %s old: %s add: %s new: %s" % (base64.b64encode(nodeid), base64.b64encode(key), old_value, pvalue, new_value))
-                self.storage[key] = json.dumps(new_value)
-            return True
-
+            delta = ORSet.from_value(value)
         except:
-            _log.debug("Trying to append something not a JSON coded list %s" % value, exc_info=True)
+            _log.debug("Trying to append something not a set delta or a JSON coded list %s" % value, exc_info=True)
             return False
+        new_value = merge_set(self.storage, self.set_keys, key, delta)
+        _log.debug("%s append key: %s add: %s new: %s" % (base64.b64encode(nodeid), base64.b64encode(key),
+                                                          delta.to_json(), new_value.to_json()))
+        return True
 
     def callAppend(self, nodeToAsk, key, value):
         address = (nodeToAsk.ip, nodeToAsk.port)
@@ -186,12 +272,9 @@ class KademliaProtocolAppend(KademliaProtocol):
 
         try:
             pvalue = json.loads(value)
-            self.set_keys.add(key)
-            if key in self.storage:
-                old_value = json.loads(self.storage[key])
-                new_value = list(set(old_value) - set(pvalue))
-                self.storage[key] = json.dumps(new_value)
-                _log.debug("%s remove key: %s old: %s remove: %s new: %s" % (base64.b64encode(nodeid), base64.b64encode(key), old_value, pvalue, new_value))
+            current = remove_from_set(self.storage, self.set_keys, key, pvalue)
+            if current is not None:
+                _log.debug("%s remove key: %s remove: %s new: %s" % (base64.b64encode(nodeid), base64.b64encode(key), pvalue, current.to_json()))
 
             return True
 
@@ -207,11 +290,24 @@ class KademliaProtocolAppend(KademliaProtocol):
 
 class AppendServer(Server):
 
-    def __init__(self, ksize=20, alpha=3, id=None, storage=None):
+    def __init__(self, ksize=None, alpha=None, id=None, storage=None):
         storage = storage or ForgetfulStorageFix()
+        ksize = ksize or _conf_or_default('dht_ksize', 20)
+        alpha = alpha or _conf_or_default('dht_alpha', 3)
         Server.__init__(self, ksize, alpha, id, storage=storage)
         self.set_keys=set([])
         self.protocol = KademliaProtocolAppend(self.node, self.storage, ksize, set_keys=self.set_keys)
+        # Recently found single values and nodes closest to recently used keys.
+        # The value cache is only cleared by local writes, hence only keys with a prefix in
+        # dht_value_cache_prefixes, which must be keys that are never changed, are cached.
+        # Actor type keys are the hash of the actor type descriptor and are cached by default.
+        self.value_cache = LookupCache(_conf_or_default('dht_cache_size', 1000),
+                                       _conf_or_default('dht_cache_ttl', 60.0))
+        self.value_cache_prefixes = tuple(_conf_or_default('dht_value_cache_prefixes', ['actor_type-']))
+        self.node_cache = LookupCache(_conf_or_default('dht_cache_size', 1000),
+                                      _conf_or_default('dht_node_cache_ttl', 30.0))
+        # Latency in microseconds per operation
+        self.latency = {op: Histogram() for op in ('get', 'get_concat', 'set', 'append', 'remove')}
         if kademlia_version != '0.5':
             _log.error("#################################################")
             _log.error("### EXPECTING VERSION 0.5 of kademlia package ###")
@@ -232,31 +328,55 @@ class AppendServer(Server):
             _log.debug("AppendServer.bootstrap(%s)" % addrs)
             return Server.bootstrap(self, addrs)
 
+    def _timed(self, d, op):
+        start = time.time()
+
+        def _record(result):
+            self.latency[op].record((time.time() - start) * 1000000)
+            return result
+        return d.addBoth(_record)
+
+    def stats(self):
+        """ Latency summaries per operation and cache usage """
+        return {'latency': {op: h.summary() for op, h in self.latency.iteritems()},
+                'value_cache': self.value_cache.stats(),
+                'node_cache': self.node_cache.stats()}
+
+    def _find_nodes(self, node, nearest):
+        """ The closest nodes to node, reuse the nodes found by a recent crawl """
+        found, nodes = self.node_cache.get(node.id)
+        if found:
+            return defer.succeed(list(nodes))
+
+        def cache_nodes(nodes):
+            if nodes:
+                self.node_cache.set(node.id, list(nodes))
+            return nodes
+
+        spider = NodeSpiderCrawl(self.protocol, node, nearest, self.ksize, self.alpha)
+        return spider.find().addCallback(cache_nodes)
+
     def append(self, key, value):
         """
         For the given key append the given list values to the set in the network.
+        Only the delta, i.e. the added values with their unique tags, is sent.
         """
         dkey = digest(key)
         node = Node(dkey)
+        try:
+            delta = ORSet.from_json(value)
+        except:
+            _log.debug("Trying to append something not a JSON coded list %s" % value, exc_info=True)
+            return defer.succeed(False)
+        coded_delta = delta.encode()
 
         def append_(nodes):
             # if this node is close too, then store here as well
             if not nodes or self.node.distanceTo(node) < max([n.distanceTo(node) for n in nodes]):
-                try:
-                    pvalue = json.loads(value)
-                    self.set_keys.add(dkey)
-                    if dkey not in self.storage:
-                        _log.debug("%s local append key: %s not in storage set value: %s" % (base64.b64encode(node.id), base64.b64encode(dkey), pvalue))
-                        self.storage[dkey] = value
-                    else:
-                        old_value_ = self.storage[dkey]
-                        old_value = json.loads(old_value_)
-                        new_value = list(set(old_value + pvalue))
-                        _log.debug("%s local append key: %s old: %s add: %s new: %s" % (base64.b64encode(node.id), base64.b64encode(dkey), old_value, pvalue, new_value))
-                        self.storage[dkey] = json.dumps(new_value)
-                except:
-                    _log.debug("Trying to append something not a JSON coded list %s" % value, exc_info=True)
-            ds = [self.protocol.callAppend(n, dkey, value) for n in nodes]
+                new_value = merge_set(self.storage, self.set_keys, dkey, delta)
+                _log.debug("%s local append key: %s add: %s new: %s" % (base64.b64encode(node.id), base64.b64encode(dkey),
+                                                                        value, new_value.to_json()))
+            ds = [self.protocol.callAppend(n, dkey, coded_delta) for n in nodes]
             return defer.DeferredList(ds).addCallback(self._anyRespondSuccess)
 
         nearest = self.protocol.router.findNeighbors(node)
@@ -265,16 +385,19 @@ class AppendServer(Server):
             _log.debug("There are no known neighbors to set key %s" % key)
             return defer.succeed(False)
 
-        spider = NodeSpiderCrawl(self.protocol, node, nearest, self.ksize, self.alpha)
-        return spider.find().addCallback(append_)
+        return self._timed(self._find_nodes(node, nearest).addCallback(append_), 'append')
 
     def set(self, key, value):
         """
         Set the given key to the given value in the network.
         """
         _log.debug("setting '%s' = '%s' on network" % (key, value))
+        if isinstance(value, ORSet):
+            # Republished set
+            value = value.encode()
         dkey = digest(key)
         node = Node(dkey)
+        self.value_cache.remove(dkey)
 
         def store(nodes):
             _log.debug("setting '%s' to %s on %s" % (key, value, map(str, nodes)))
@@ -290,8 +413,7 @@ class AppendServer(Server):
         if len(nearest) == 0:
             _log.warning("There are no known neighbors to set key %s" % key)
             return defer.succeed(False)
-        spider = NodeSpiderCrawl(self.protocol, node, nearest, self.ksize, self.alpha)
-        return spider.find().addCallback(store)
+        return self._timed(self._find_nodes(node, nearest).addCallback(store), 'set')
 
     def get(self, key):
         """
@@ -305,14 +427,44 @@ class AppendServer(Server):
         # if this node has it, return it
         exists, value = self.storage.get(dkey)
         if exists:
-            return defer.succeed(value)
+            return defer.succeed(external_value(value))
+        cached = bool(self.value_cache_prefixes) and key.startswith(self.value_cache_prefixes)
+        if cached:
+            found, value = self.value_cache.get(dkey)
+            if found:
+                return defer.succeed(value)
         node = Node(dkey)
         nearest = self.protocol.router.findNeighbors(node)
         if len(nearest) == 0:
             self.log.warning("There are no known neighbors to get key %s" % key)
             return defer.succeed(None)
-        spider = ValueSpiderCrawl(self.protocol, node, nearest, self.ksize, self.alpha)
-        return spider.find()
+        # Start next to the key when a recent lookup found the nodes closest to it
+        found, nodes = self.node_cache.get(dkey)
+        d = self._find_value(node, nodes if found else nearest)
+        if found:
+            d.addCallback(self._find_value_again, node, nearest)
+        return self._timed(d.addCallback(self._found_value, dkey, cached), 'get')
+
+    def _find_value(self, node, nearest):
+        spider = FirstValueSpiderCrawl(self.protocol, node, nearest, self.ksize, self.alpha)
+        return spider.find().addCallback(lambda value: (value, list(spider.nearest)))
+
+    def _find_value_again(self, result, node, nearest):
+        """ The cached nodes did not have the value, do a full lookup """
+        if external_value(result[0]) is not None:
+            return result
+        self.node_cache.remove(node.id)
+        return self._find_value(node, nearest)
+
+    def _found_value(self, result, dkey, cached):
+        value, nodes = result
+        value = external_value(value)
+        if value is not None:
+            if nodes:
+                self.node_cache.set(dkey, nodes)
+            if cached:
+                self.value_cache.set(dkey, value)
+        return value
 
     def remove(self, key, value):
         """
@@ -321,18 +473,16 @@ class AppendServer(Server):
         dkey = digest(key)
         node = Node(dkey)
         _log.debug("Server:remove %s" % base64.b64encode(dkey))
+        self.value_cache.remove(dkey)
 
         def remove_(nodes):
             # if this node is close too, then store here as well
             if not nodes or self.node.distanceTo(node) < max([n.distanceTo(node) for n in nodes]):
                 try:
                     pvalue = json.loads(value)
-                    self.set_keys.add(dkey)
-                    if dkey in self.storage:
-                        old_value = json.loads(self.storage[dkey])
-                        new_value = list(set(old_value) - set(pvalue))
-                        self.storage[dkey] = json.dumps(new_value)
-                        _log.debug("%s local remove key: %s old: %s remove: %s new: %s" % (base64.b64encode(node.id), base64.b64encode(dkey), old_value, pvalue, new_value))
+                    current = remove_from_set(self.storage, self.set_keys, dkey, pvalue)
+                    if current is not None:
+                        _log.debug("%s local remove key: %s remove: %s new: %s" % (base64.b64encode(node.id), base64.b64encode(dkey), pvalue, current.to_json()))
                 except:
                     _log.debug("Trying to remove somthing not a JSON coded list %s" % value, exc_info=True)
             ds = [self.protocol.callRemove(n, dkey, value) for n in nodes]
@@ -343,8 +493,7 @@ class AppendServer(Server):
             self.log.warning("There are no known neighbors to set key %s" % key)
             return defer.succeed(False)
 
-        spider = NodeSpiderCrawl(self.protocol, node, nearest, self.ksize, self.alpha)
-        return spider.find().addCallback(remove_)
+        return self._timed(self._find_nodes(node, nearest).addCallback(remove_), 'remove')
 
     def get_concat(self, key):
         """
@@ -362,12 +511,45 @@ class AppendServer(Server):
         if len(nearest) == 0:
             # No neighbors but we had it, return that value
             if exists:
-                return defer.succeed(value)
+                return defer.succeed(external_value(value))
             self.log.warning("There are no known neighbors to get key %s" % key)
             return defer.succeed(None)
         spider = ValueListSpiderCrawl(self.protocol, node, nearest, self.ksize, self.alpha,
                                       local_value=value if exists else None)
-        return spider.find()
+        return self._timed(spider.find().addCallback(external_value), 'get_concat')
+
+class FirstValueSpiderCrawl(ValueSpiderCrawl):
+    """
+    Single value lookup that is done as soon as any contacted node returns the
+    value, instead of waiting for all responses in the round.
+    """
+
+    def _find(self, rpcmethod):
+        count = self.alpha
+        if self.nearest.getIDs() == self.lastIDsCrawled:
+            count = len(self.nearest)
+        self.lastIDsCrawled = self.nearest.getIDs()
+
+        peers = self.nearest.getUncontacted()[:count]
+        if not peers:
+            return deferredDict({}).addCallback(self._nodesFound)
+        round_done = defer.Deferred()
+        responses = {}
+
+        def response(result, peerid):
+            if round_done.called:
+                return
+            responses[peerid] = result
+            if RPCFindResponse(result).happened() and RPCFindResponse(result).hasValue():
+                round_done.callback(responses)
+            elif len(responses) == len(peers):
+                round_done.callback(responses)
+
+        for peer in peers:
+            self.nearest.markContacted(peer)
+            rpcmethod(peer, self.node).addCallback(response, peer.id)
+        return round_done.addCallback(self._nodesFound)
+
 
 class ValueListSpiderCrawl(ValueSpiderCrawl):
 
@@ -412,36 +594,29 @@ class ValueListSpiderCrawl(ValueSpiderCrawl):
         make sure we tell the nearest node that *didn't* have
         the value to store it.
         """
-        # TODO figure out if we could be more cleaver in what values are combined
         value = None
         _set_op = True
         if self.local_value:
             jvalues.append((None, self.local_value))
-        _log.debug("_handleFoundValues %s" % str(jvalues))
-        if len(jvalues) != 1:
-            args = (self.node.long_id, str(jvalues))
-            _log.debug("Got multiple values for key %i: %s" % args)
-            try:
-                values = [(v[0], json.loads(v[1])) for v in jvalues]
-                value_all = []
-                for v in values:
-                    value_all = value_all + v[1]
-                value = json.dumps(list(set(value_all)))
-            except:
-                # Not JSON coded or list, probably trying to do a get_concat on none set-op data
-                # Do the normal thing
-                _log.debug("_handleFoundValues ********", exc_info=True)
-                valueCounts = Counter([v[1] for v in jvalues])
-                value = valueCounts.most_common(1)[0][0]
-                _set_op = False
-        else:
-            key, value = jvalues[0]
+        _log.debug("Got %d values for key %i" % (len(jvalues), self.node.long_id))
+        try:
+            # Set-op data, merge the OR-sets, duplicates and order of the replicas does not matter
+            value = ORSet()
+            for _, v in jvalues:
+                value.merge(ORSet.from_value(v))
+        except:
+            # Not set-op data, probably trying to do a get_concat on none set-op data
+            # Do the normal thing
+            _log.debug("_handleFoundValues ********", exc_info=True)
+            valueCounts = Counter([v[1] for v in jvalues])
+            value = valueCounts.most_common(1)[0][0]
+            _set_op = False
 
         peerToSaveTo = self.nearestWithoutValue.popleft()
         if peerToSaveTo is not None:
             _log.debug("nearestWithoutValue %d" % (len(self.nearestWithoutValue)+1))
             if _set_op:
-                d = self.protocol.callAppend(peerToSaveTo, self.node.id, value)
+                d = self.protocol.callAppend(peerToSaveTo, self.node.id, value.encode())
             else:
                 d = self.protocol.callStore(peerToSaveTo, self.node.id, value)
             return d.addCallback(lambda _: value)
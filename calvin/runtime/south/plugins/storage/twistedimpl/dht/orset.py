@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import umsgpack
+
+# Prefix of an encoded OR-set, JSON coded values never start with a NUL
+MAGIC = "\x00ORS"
+TAG_SIZE = 8
+
+
+def is_encoded(value):
+    return isinstance(value, str) and value.startswith(MAGIC)
+
+
+class ORSet(object):
+    """
+    Observed-remove set (add wins) used for the DHT set-op values.
+
+    Elements are kept as their JSON text, which makes the JSON list
+    returned by get_concat a plain string join. Every add of an element
+    gets a unique tag, a remove tombstones the tags observed so far. Merging
+    two replicas is a union of adds and tombstones, hence order and
+    duplication of deltas does not matter.
+    """
+
+    def __init__(self, adds=None, removes=None):
+        super(ORSet, self).__init__()
+        # element -> set of tags
+        self.adds = adds or {}
+        # element -> set of removed tags
+        self.removes = removes or {}
+        self._encoded = None
+
+    @staticmethod
+    def element(value):
+        return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+    @classmethod
+    def add_delta(cls, values):
+        """ Delta that adds the list values """
+        return cls(adds={cls.element(v): set([os.urandom(TAG_SIZE)]) for v in values})
+
+    @classmethod
+    def from_json(cls, value):
+        """ Delta from a JSON coded list, raise ValueError when not a list """
+        values = json.loads(value)
+        if not isinstance(values, list):
+            raise ValueError("Not a JSON coded list")
+        return cls.add_delta(values)
+
+    def remove(self, values):
+        """ Remove the list values by tombstoning all observed tags """
+        changed = False
+        for v in values:
+            e = self.element(v)
+            tags = self.adds.get(e)
+            if tags:
+                removed = self.removes.setdefault(e, set())
+                if not tags <= removed:
+                    removed |= tags
+                    changed = True
+        if changed:
+            self._encoded = None
+        return changed
+
+    def merge(self, other):
+        """ Merge other set (or delta) into this, returns True if changed """
+        changed = self._merge_tags(self.adds, other.adds)
+        changed = self._merge_tags(self.removes, other.removes) or changed
+        if changed:
+            self._encoded = None
+        return changed
+
+    @staticmethod
+    def _merge_tags(mine, theirs):
+        changed = False
+        for e, tags in theirs.iteritems():
+            current = mine.get(e)
+            if current is None:
+                mine[e] = set(tags)
+                changed = True
+            elif not tags <= current:
+                current |= tags
+                changed = True
+        return changed
+
+    def elements(self):
+        """ The JSON text of the elements in the set """
+        return [e for e, tags in self.adds.iteritems() if not tags <= self.removes.get(e, set())]
+
+    def to_json(self):
+        return "[" + ",".join(self.elements()) + "]"
+
+    def encode(self):
+        if self._encoded is None:
+            self._encoded = MAGIC + umsgpack.packb([self._flatten(self.adds), self._flatten(self.removes)])
+        return self._encoded
+
+    @staticmethod
+    def _flatten(tagged):
+        flat = []
+        for e, tags in tagged.iteritems():
+            flat.append(e)
+            flat.append("".join(tags))
+        return flat
+
+    @classmethod
+    def decode(cls, data):
+        if not is_encoded(data):
+            raise ValueError("Not an encoded OR-set")
+        adds, removes = umsgpack.unpackb(data[len(MAGIC):])
+        orset = cls(adds=cls._unflatten(adds), removes=cls._unflatten(removes))
+        orset._encoded = data
+        return orset
+
+    @staticmethod
+    def _unflatten(flat):
+        tagged = {}
+        for i in range(0, len(flat), 2):
+            tags = flat[i + 1]
+            tagged[str(flat[i])] = set([tags[j:j + TAG_SIZE] for j in range(0, len(tags), TAG_SIZE)])
+        return tagged
+
+    @classmethod
+    def from_value(cls, value):
+        """ OR-set from a stored or received value, an encoded set or a JSON coded list """
+        if isinstance(value, ORSet):
+            return value
+        if is_encoded(value):
+            return cls.decode(value)
+        return cls.from_json(value)
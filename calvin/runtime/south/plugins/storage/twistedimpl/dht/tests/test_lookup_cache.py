@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from mock import Mock, patch
+
+from calvin.runtime.south.plugins.storage.twistedimpl.dht.append_server import LookupCache
+
+pytestmark = pytest.mark.unittest
+
+
+def test_bounded():
+    cache = LookupCache(2, 10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.get("a") == (False, None)
+    assert cache.get("c") == (True, 3)
+    cache.remove("c")
+    assert cache.get("c") == (False, None)
+    assert cache.stats() == {'size': 1, 'hits': 1, 'misses': 2}
+
+
+def test_expire():
+    cache = LookupCache(10, 10)
+    with patch('calvin.runtime.south.plugins.storage.twistedimpl.dht.append_server.time') as time_mock:
+        time_mock.time.return_value = 100.0
+        cache.set("a", 1)
+        time_mock.time.return_value = 105.0
+        assert cache.get("a") == (True, 1)
+        time_mock.time.return_value = 111.0
+        assert cache.get("a") == (False, None)
+    assert not cache.data
+
+
+def test_disabled():
+    cache = LookupCache(10, 0)
+    cache.set("a", 1)
+    assert cache.get("a") == (False, None)
+
+
+def test_value_cache_opt_in():
+    from calvin.runtime.south.plugins.storage.twistedimpl.dht.append_server import AppendServer
+    from kademlia.utils import digest
+    server = AppendServer()
+    server.value_cache.set(digest("actor-1"), "stale")
+    server.value_cache.set(digest("actor_type-1"), "cached")
+    results = []
+    server.get("actor-1").addCallback(results.append)
+    # Only the never changed actor types are cached by default, no neighbors to ask
+    assert results == [None]
+    server.get("actor_type-1").addCallback(results.append)
+    assert results == [None, "cached"]
+    server.value_cache_prefixes = ()
+    server.get("actor_type-1").addCallback(results.append)
+    assert results == [None, "cached", None]
+
+
+def test_get_seeded_from_node_cache():
+    from twisted.internet import defer
+    from kademlia.utils import digest
+    from calvin.runtime.south.plugins.storage.twistedimpl.dht import append_server
+    crawls = []
+
+    class Spider(object):
+        def __init__(self, protocol, node, peers, ksize, alpha):
+            self.nearest = peers
+            crawls.append(peers)
+
+        def find(self):
+            return defer.succeed(values.pop(0))
+
+    server = append_server.AppendServer()
+    server.protocol.router = Mock(findNeighbors=Mock(return_value=["neighbor"]))
+    server.node_cache.set(digest("actor-1"), ["closest"])
+    results = []
+    with patch.object(append_server, 'FirstValueSpiderCrawl', Spider):
+        values = ["v1"]
+        server.get("actor-1").addCallback(results.append)
+        assert crawls == [["closest"]]
+        # Not found next to the key, a full lookup is done
+        server.node_cache.set(digest("actor-2"), ["gone"])
+        values = [None, "v2"]
+        server.get("actor-2").addCallback(results.append)
+        assert crawls == [["closest"], ["gone"], ["neighbor"]]
+        # The nodes of a found value are reused
+        values = ["v2"]
+        server.get("actor-2").addCallback(results.append)
+        assert crawls[-1] == ["neighbor"]
+        assert server.node_cache.get(digest("actor-2")) == (True, ["neighbor"])
+    assert results == ["v1", "v2", "v2"]
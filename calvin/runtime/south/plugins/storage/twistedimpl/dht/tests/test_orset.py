@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import pytest
+
+from calvin.runtime.south.plugins.storage.twistedimpl.dht.orset import ORSet, is_encoded
+from calvin.runtime.south.plugins.storage.twistedimpl.dht.append_server import (ForgetfulStorageFix, merge_set,
+                                                                                  remove_from_set, external_value)
+
+pytestmark = pytest.mark.unittest
+
+
+def values(orset):
+    return sorted(json.loads(orset.to_json()))
+
+
+def test_add_merge():
+    a = ORSet()
+    a.merge(ORSet.from_json(json.dumps(["apa", "elefant"])))
+    b = ORSet()
+    b.merge(ORSet.from_json(json.dumps(["tiger"])))
+    assert a.merge(b)
+    assert values(a) == ["apa", "elefant", "tiger"]
+    # Merging again is a no-op
+    assert not a.merge(b)
+
+
+def test_remove_replicates():
+    delta = ORSet.from_json(json.dumps(["apa", "elefant"]))
+    a = ORSet()
+    a.merge(delta)
+    b = ORSet()
+    b.merge(delta)
+    assert a.remove(["elefant"])
+    assert not a.remove(["lejon"])
+    # Stale replica must not resurrect the removed element
+    b.merge(a)
+    assert values(b) == ["apa"]
+    # Re-add after remove is a new tag and wins
+    b.merge(ORSet.from_json(json.dumps(["elefant"])))
+    assert values(b) == ["apa", "elefant"]
+
+
+def test_encode_decode():
+    a = ORSet.from_json(json.dumps(["apa", u"\xe4lg", {"b": 1, "a": 2}]))
+    a.remove(["apa"])
+    data = a.encode()
+    assert is_encoded(data)
+    assert not is_encoded(json.dumps(["apa"]))
+    b = ORSet.decode(data)
+    assert b.adds == a.adds
+    assert b.removes == a.removes
+    assert json.loads(b.to_json()) == json.loads(a.to_json())
+    with pytest.raises(ValueError):
+        ORSet.decode(json.dumps(["apa"]))
+    with pytest.raises(ValueError):
+        ORSet.from_json(json.dumps("apa"))
+
+
+def test_merge_set_storage():
+    storage = ForgetfulStorageFix()
+    set_keys = set([])
+    merge_set(storage, set_keys, "key", ORSet.from_json(json.dumps(["apa"])))
+    merge_set(storage, set_keys, "key", ORSet.decode(ORSet.from_json(json.dumps(["tiger"])).encode()))
+    assert "key" in set_keys
+    assert sorted(json.loads(external_value(storage["key"]))) == ["apa", "tiger"]
+    # A deleted key starts over as a set
+    storage["key"] = None
+    merge_set(storage, set_keys, "key", ORSet.from_json(json.dumps(["lejon"])))
+    assert json.loads(external_value(storage["key"].encode())) == ["lejon"]
+    assert external_value("apa") == "apa"
+
+
+def test_merge_set_legacy_list():
+    # A JSON coded list, e.g. stored by rpc_store, keeps its members
+    storage = ForgetfulStorageFix()
+    set_keys = set([])
+    storage["key"] = json.dumps(["a", "b"])
+    merge_set(storage, set_keys, "key", ORSet.from_json(json.dumps(["c"])))
+    assert sorted(json.loads(external_value(storage["key"]))) == ["a", "b", "c"]
+    storage["key2"] = json.dumps(["a", "b"])
+    remove_from_set(storage, set_keys, "key2", ["a"])
+    assert json.loads(external_value(storage["key2"])) == ["b"]
+    # Not set-op data is replaced
+    storage["key3"] = json.dumps("x")
+    merge_set(storage, set_keys, "key3", ORSet.from_json(json.dumps(["c"])))
+    assert json.loads(external_value(storage["key3"])) == ["c"]
+    assert remove_from_set(storage, set_keys, "missing", ["a"]) is None
@@ -26,7 +26,8 @@ import hashlib
 import base64
 from collections import Counter
 
-from twisted.internet import defer, task, reactor
+from twisted.internet import defer, task, reactor, threads
+from twisted.python.threadpool import ThreadPool
 from kademlia.network import Server
 from kademlia.protocol import KademliaProtocol
 from kademlia import crawling
@@ -99,8 +100,101 @@ class KademliaProtocolAppend(KademliaProtocol):
         self.priv_key = None
         self.node_name = kwargs.pop('node_name',None)
         self.runtime_credentials = kwargs.pop('runtime_credentials', None)
+        # Optional thread pool for signing and verifying, pyOpenSSL releases the GIL during ECDSA
+        self.crypto_pool = None
+        self.pending_requests = []
+        crypto_threads = _conf.get(None, 'dht_crypto_threads') or 0
+        if crypto_threads > 0:
+            self.crypto_pool = ThreadPool(minthreads=1, maxthreads=crypto_threads, name="dht_crypto")
+            self.crypto_pool.start()
+            reactor.addSystemEventTrigger('before', 'shutdown', self.crypto_pool.stop)
         KademliaProtocol.__init__(self, *args, **kwargs)
 
+    def signChallenge(self, nodeToAsk, challenge):
+        """
+        Sign the challenge for 'nodeToAsk', returns a deferred with the signature.
+        The signing is done in the crypto thread pool when configured.
+        """
+        data = nodeToAsk.id.encode("hex").upper() + challenge
+        if self.crypto_pool is None:
+            return defer.maybeDeferred(self.runtime_credentials.sign_data, data)
+        return threads.deferToThreadPool(reactor, self.crypto_pool, self.runtime_credentials.sign_data, data)
+
+    def handleSigningFailure(self, failure, name):
+        logger(self.sourceNode, "RETFALSENONE: Signing of {} failed, err={}".format(name, failure.getErrorMessage()))
+        return (False, None)
+
+    def verifySignature(self, cert_str, signature, challenge, verified=None):
+        """
+        Raise an exception unless the signature of the challenge is valid,
+        verified is the result when already checked by verifyCrawlResponses.
+        """
+        if verified is None:
+            self.runtime_credentials.verify_signed_data_from_certstring(cert_str,
+                                                                        signature,
+                                                                        challenge,
+                                                                        certificate.TRUSTSTORE_TRANSPORT)
+        elif not verified:
+            raise Exception("Bad signature")
+
+    def verifyBatch(self, signed):
+        """
+        Verify a list of (certstring, signature, data) together, returns a
+        deferred with a list of True/False. The certificates are verified and
+        stored in the reactor thread, only the signatures are checked in the
+        crypto thread pool when configured.
+        """
+        checks = self.runtime_credentials.get_verified_certificates(signed, certificate.TRUSTSTORE_TRANSPORT)
+        if self.crypto_pool is None or not checks:
+            d = defer.succeed(runtime_credentials.verify_signatures(checks))
+        else:
+            d = threads.deferToThreadPool(reactor, self.crypto_pool, runtime_credentials.verify_signatures, checks)
+        return d.addCallback(lambda results: self.runtime_credentials.store_verified_certificates(signed, results))
+
+    def verifyRequest(self, cert_str, signature, payload):
+        """
+        Verify the signature of a request, returns a deferred with True/False.
+        The requests received in the same reactor iteration are verified together.
+        """
+        d = defer.Deferred()
+        if not self.pending_requests:
+            reactor.callLater(0, self._verifyRequests)
+        self.pending_requests.append(((cert_str, signature, payload), d))
+        return d
+
+    def _verifyRequests(self):
+        pending, self.pending_requests = self.pending_requests, []
+
+        def verified(results):
+            for (signed, d), result in zip(pending, results):
+                d.callback(result)
+        d = self.verifyBatch([signed for signed, request in pending])
+        # A failed verification must still answer the requests
+        d.addErrback(lambda failure: [False] * len(pending))
+        d.addCallback(verified)
+
+    def verifyCrawlResponses(self, responses):
+        """
+        Verify the signed responses of a crawl round together, `responses` is
+        a dict with peer id: (node, result, challenge). Returns a deferred with
+        a dict of peer id: handled response.
+        """
+        peerids = []
+        signed = []
+        for peerid, (node, result, challenge) in responses.items():
+            if not result[0] or "NACK" in result[1] or not result[1].get('signature'):
+                continue
+            cert_stored = self.searchForCertificate(node.id.encode('hex').upper())
+            if cert_stored is not None:
+                peerids.append(peerid)
+                signed.append((cert_stored, result[1]['signature'], challenge))
+
+        def handle(results):
+            verified = dict(zip(peerids, results))
+            return {peerid: self.handleSignedValueResponse(result, node, challenge, verified.get(peerid))
+                    for peerid, (node, result, challenge) in responses.items()}
+        return self.verifyBatch(signed).addCallback(handle)
+
     #####################
     # Call Functions    #
     #####################
@@ -112,66 +206,56 @@ class KademliaProtocolAppend(KademliaProtocol):
         _log.debug("callCertFindValue:\n\tnodeToAsk={}\n\tnodeToFind={}".format(nodeToAsk, nodeToFind))
         address = (nodeToAsk.ip, nodeToAsk.port)
         challenge = generate_challenge()
-        try:
-            signature = self.runtime_credentials.sign_data(
-                                            nodeToAsk.id.encode("hex").upper() + challenge)
-        except:
-            logger(self.sourceNode, "RETNONE: Signing of certFindValue failed")
-            return None
-        d = self.find_value(address,
-                           self.sourceNode.id,
-                           nodeToFind.id,
-                           challenge,
-                           signature,
-                           self.getOwnCert())
-        return d.addCallback(self.handleCertCallResponse,
-                            nodeToAsk,
-                            challenge)
-
-
-    def callFindNode(self, nodeToAsk, nodeToFind):
+        d = self.signChallenge(nodeToAsk, challenge)
+        d.addCallback(lambda signature: self.find_value(address,
+                                                        self.sourceNode.id,
+                                                        nodeToFind.id,
+                                                        challenge,
+                                                        signature,
+                                                        self.getOwnCert()))
+        return d.addCallbacks(self.handleCertCallResponse, self.handleSigningFailure,
+                              callbackArgs=(nodeToAsk, challenge), errbackArgs=("certFindValue",))
+
+
+    def callFindNode(self, nodeToAsk, nodeToFind, verify=True):
         """
-        Asks 'nodeToAsk' for the value 'nodeToFind.id'
+        Asks 'nodeToAsk' for the value 'nodeToFind.id', without verify
+        the result is (nodeToAsk, response, challenge) for verifyCrawlResponses
         """
         _log.debug("callFindNode\n\tnodeToAsk={}\n\tnodeToFind={}".format(nodeToAsk, nodeToFind))
         address = (nodeToAsk.ip, nodeToAsk.port)
         challenge = generate_challenge()
-        try:
-            signature = self.runtime_credentials.sign_data(
-                                            nodeToAsk.id.encode("hex").upper() + challenge)
-        except:
-            logger(self.sourceNode, "RETNONE: Signing of findNode failed")
-            return None
-        d = self.find_node(address,
-                          self.sourceNode.id,
-                          nodeToFind.id,
-                          challenge,
-                          signature)
-        return d.addCallback(self.handleSignedBucketResponse,
-                            nodeToAsk,
-                            challenge)
-
-    def callFindValue(self, nodeToAsk, nodeToFind):
+        d = self.signChallenge(nodeToAsk, challenge)
+        d.addCallback(lambda signature: self.find_node(address,
+                                                       self.sourceNode.id,
+                                                       nodeToFind.id,
+                                                       challenge,
+                                                       signature))
+        if not verify:
+            d.addErrback(self.handleSigningFailure, "findNode")
+            return d.addCallback(lambda result: (nodeToAsk, result, challenge))
+        return d.addCallbacks(self.handleSignedBucketResponse, self.handleSigningFailure,
+                              callbackArgs=(nodeToAsk, challenge), errbackArgs=("findNode",))
+
+    def callFindValue(self, nodeToAsk, nodeToFind, verify=True):
         """
-        Asks 'nodeToAsk' for the information regarding the node 'nodeToFind'
+        Asks 'nodeToAsk' for the information regarding the node 'nodeToFind', without verify
+        the result is (nodeToAsk, response, challenge) for verifyCrawlResponses
         """
         logger(self.sourceNode,"callFindValue:\n\tnodeToAsk={}\n\tnodeToFind={}".format(nodeToAsk, nodeToFind))
         address = (nodeToAsk.ip, nodeToAsk.port)
         challenge = generate_challenge()
-        try:
-            signature = self.runtime_credentials.sign_data(
-                                            nodeToAsk.id.encode("hex").upper() + challenge)
-        except:
-            logger(self.sourceNode, "RETNONE: Signing of findValue failed")
-            return None
-        d = self.find_value(address,
-                           self.sourceNode.id,
-                           nodeToFind.id,
-                           challenge,
-                           signature)
-        return d.addCallback(self.handleSignedValueResponse,
-                            nodeToAsk,
-                            challenge)
+        d = self.signChallenge(nodeToAsk, challenge)
+        d.addCallback(lambda signature: self.find_value(address,
+                                                        self.sourceNode.id,
+                                                        nodeToFind.id,
+                                                        challenge,
+                                                        signature))
+        if not verify:
+            d.addErrback(self.handleSigningFailure, "findValue")
+            return d.addCallback(lambda result: (nodeToAsk, result, challenge))
+        return d.addCallbacks(self.handleSignedValueResponse, self.handleSigningFailure,
+                              callbackArgs=(nodeToAsk, challenge), errbackArgs=("findValue",))
 
     def callPing(self, nodeToAsk, cert=None):
         """
@@ -180,20 +264,14 @@ class KademliaProtocolAppend(KademliaProtocol):
         logger(self.sourceNode,"callPing, nodeToAsk={}".format(nodeToAsk))
         address = (nodeToAsk.ip, nodeToAsk.port)
         challenge = generate_challenge()
-        try:
-            signature = self.runtime_credentials.sign_data(
-                                            nodeToAsk.id.encode("hex").upper() + challenge)
-        except:
-            logger(self.sourceNode, "RETNONE: Signing of ping failed")
-            return None
-        d = self.ping(address,
-                     self.sourceNode.id,
-                     challenge,
-                     signature,
-                     cert)
-        return d.addCallback(self.handleSignedPingResponse,
-                            nodeToAsk,
-                            challenge)
+        d = self.signChallenge(nodeToAsk, challenge)
+        d.addCallback(lambda signature: self.ping(address,
+                                                  self.sourceNode.id,
+                                                  challenge,
+                                                  signature,
+                                                  cert))
+        return d.addCallbacks(self.handleSignedPingResponse, self.handleSigningFailure,
+                              callbackArgs=(nodeToAsk, challenge), errbackArgs=("ping",))
 
     def callStore(self, nodeToAsk, key, value):
         """
@@ -202,22 +280,16 @@ class KademliaProtocolAppend(KademliaProtocol):
         logger(self.sourceNode,"callStore:\n\tnodeAsking.id={}\n\tnodeAsking={}\n\tnodeToAsk.id={}\n\tnodeToAsk={}\n\tkey={}\n\tvalue={}".format(self.sourceNode.id, self.sourceNode, nodeToAsk.id, nodeToAsk, key.encode("hex"), value))
         address = (nodeToAsk.ip, nodeToAsk.port)
         challenge = generate_challenge()
-        try:
-            signature = self.runtime_credentials.sign_data(
-                                            nodeToAsk.id.encode("hex").upper() + challenge)
-        except:
-            logger(self.sourceNode, "RETNONE: Signing of store failed")
-            return None
-        d = self.store(address,
-                      self.sourceNode.id,
-                      key,
-                      value,
-                      challenge,
-                      signature)
+        d = self.signChallenge(nodeToAsk, challenge)
+        d.addCallback(lambda signature: self.store(address,
+                                                   self.sourceNode.id,
+                                                   key,
+                                                   value,
+                                                   challenge,
+                                                   signature))
         logger(self.sourceNode, "callStore initiated")
-        return d.addCallback(self.handleSignedStoreResponse,
-                            nodeToAsk,
-                            challenge)
+        return d.addCallbacks(self.handleSignedStoreResponse, self.handleSigningFailure,
+                              callbackArgs=(nodeToAsk, challenge), errbackArgs=("store",))
 
     def callAppend(self, nodeToAsk, key, value):
         """
@@ -226,19 +298,15 @@ class KademliaProtocolAppend(KademliaProtocol):
         logger(self.sourceNode,"callAppend:\n\tnodeToAsk={}\n\tkey={}\n\tvalue={}".format(nodeToAsk, key, value))
         address = (nodeToAsk.ip, nodeToAsk.port)
         challenge = generate_challenge()
-        try:
-            signature = self.runtime_credentials.sign_data(
-                                            nodeToAsk.id.encode("hex").upper() + challenge)
-        except:
-            logger(self.sourceNode, "RETNONE: Signing of append failed")
-            return None
-        d = self.append(address,
-                        self.sourceNode.id,
-                        key,
-                        value,
-                        challenge,
-                        signature)
-        return d.addCallback(self.handleSignedStoreResponse, nodeToAsk, challenge)
+        d = self.signChallenge(nodeToAsk, challenge)
+        d.addCallback(lambda signature: self.append(address,
+                                                    self.sourceNode.id,
+                                                    key,
+                                                    value,
+                                                    challenge,
+                                                    signature))
+        return d.addCallbacks(self.handleSignedStoreResponse, self.handleSigningFailure,
+                              callbackArgs=(nodeToAsk, challenge), errbackArgs=("append",))
 
     def callRemove(self, nodeToAsk, key, value):
         """
@@ -247,19 +315,15 @@ class KademliaProtocolAppend(KademliaProtocol):
         logger(self.sourceNode,"callRemove:\n\tnodeToAsk={}\n\tkey={}\n\tvalue={}".format(nodeToAsk, key, value))
         address = (nodeToAsk.ip, nodeToAsk.port)
         challenge = generate_challenge()
-        try:
-            signature = self.runtime_credentials.sign_data(
-                                            nodeToAsk.id.encode("hex").upper() + challenge)
-        except:
-            logger(self.sourceNode, "RETNONE: Signing of append failed")
-            return None
-        d = self.remove(address,
-                        self.sourceNode.id,
-                        key,
-                        value,
-                        challenge,
-                        signature)
-        return d.addCallback(self.handleSignedStoreResponse, nodeToAsk, challenge)
+        d = self.signChallenge(nodeToAsk, challenge)
+        d.addCallback(lambda signature: self.remove(address,
+                                                    self.sourceNode.id,
+                                                    key,
+                                                    value,
+                                                    challenge,
+                                                    signature))
+        return d.addCallbacks(self.handleSignedStoreResponse, self.handleSigningFailure,
+                              callbackArgs=(nodeToAsk, challenge), errbackArgs=("remove",))
 
     #####################
     # Response handlers #
@@ -309,7 +373,7 @@ class KademliaProtocolAppend(KademliaProtocol):
             self.router.removeContact(node)
         return result
 
-    def handleSignedBucketResponse(self, result, node, challenge):
+    def handleSignedBucketResponse(self, result, node, challenge, verified=None):
         """
         ???
         `result` is an array and element 1 contains a dict.
@@ -329,11 +393,7 @@ class KademliaProtocolAppend(KademliaProtocol):
                            " {} not present in store".format(node))
                     return (False, None)
                 try:
-                    self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                        cert_stored,
-                                                                        result[1]['signature'],
-                                                                        challenge,
-                                                                        certificate.TRUSTSTORE_TRANSPORT)
+                    self.verifySignature(cert_stored, result[1]['signature'], challenge, verified)
                     self.router.addContact(node)
                     newbucket = list()
                     for bucketnode in result[1]['bucket']:
@@ -445,20 +505,8 @@ class KademliaProtocolAppend(KademliaProtocol):
                 "RETFALSENONE: Certificate for sender of store confirmation: {}"
                 " not present in store".format(node))
                 return (False, None)
-            try: 
-                self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                    cert_stored,
-                                                                    result[1],
-                                                                    challenge,
-                                                                    certificate.TRUSTSTORE_TRANSPORT)
-                self.router.addContact(node)
-                logger(self.sourceNode, "handleSignedStoreResponse - finished OK")
-                return (True, True)
-            except:
-                logger(self.sourceNode,
-                      "RETFALSENONE: Bad signature for sender of store"
-                      " confirmation: {}".format(node))
-                return (False, None)
+            d = self.verifyRequest(cert_stored, result[1], challenge)
+            return d.addCallback(self._storeResponseVerified, node)
         else:
             logger(self.sourceNode,
                   "RETFALSENONE: No store confirmation from {},"
@@ -466,7 +514,17 @@ class KademliaProtocolAppend(KademliaProtocol):
             self.router.removeContact(node)
         return (False, None)
 
-    def handleSignedValueResponse(self, result, node, challenge):
+    def _storeResponseVerified(self, verified, node):
+        if not verified:
+            logger(self.sourceNode,
+                  "RETFALSENONE: Bad signature for sender of store"
+                  " confirmation: {}".format(node))
+            return (False, None)
+        self.router.addContact(node)
+        logger(self.sourceNode, "handleSignedStoreResponse - finished OK")
+        return (True, True)
+
+    def handleSignedValueResponse(self, result, node, challenge, verified=None):
         logger(self.sourceNode,"handleSignedValueResponse,result={}, node={}, challenge={}".format(result, node, challenge))
         logger(self.sourceNode, "handleSignedValueResponse {}".format(str(result)))
         if result[0]:
@@ -477,7 +535,8 @@ class KademliaProtocolAppend(KademliaProtocol):
             elif 'bucket' in result[1]:
                 return self.handleSignedBucketResponse(result,
                                                       node,
-                                                      challenge)
+                                                      challenge,
+                                                      verified)
             elif 'value' in result[1] and 'signature' in result[1]:
                 nodeIdHex = node.id.encode('hex').upper()
                 cert_stored = self.searchForCertificate(nodeIdHex)
@@ -487,11 +546,7 @@ class KademliaProtocolAppend(KademliaProtocol):
                           " not present in store".format(node))
                     return (False, None)
                 try: 
-                    self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                        cert_stored,
-                                                                        result[1]['signature'],
-                                                                        challenge,
-                                                                        certificate.TRUSTSTORE_TRANSPORT)
+                    self.verifySignature(cert_stored, result[1]['signature'], challenge, verified)
                     self.router.addContact(node)
                     return result
                 except:
@@ -561,32 +616,30 @@ class KademliaProtocolAppend(KademliaProtocol):
                   "found in store".format(source))
             return {'NACK' : None, "signature" : signature}
         else:
-            try:
-                sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
-                payload = "{}{}".format(sourceNodeIdHex, challenge)
-                self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                    cert_stored,
-                                                                    signature,
-                                                                    payload,
-                                                                    certificate.TRUSTSTORE_TRANSPORT)
-            except:
-                logger(self.sourceNode,
-                      "RETNONE: Bad signature for sender of "
-                      "store request: {}".format(source))
-                return None
-            try:
-                self.router.addContact(source)
-            except Exception as err:
-                _log.error("Failed to add contact to router, err={}".format(err))
-            self.storage[key] = value
-            try:
-                signature = self.runtime_credentials.sign_data(challenge)
-            except:
-                logger(self.sourceNode,
-                      "RETNONE: Signing of rpc_store failed")
-                return None
-            logger(self.sourceNode, "Signing of rpc_store success")
-            return signature
+            sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
+            payload = "{}{}".format(sourceNodeIdHex, challenge)
+            d = self.verifyRequest(cert_stored, signature, payload)
+            return d.addCallback(self._storeVerified, source, key, value, challenge)
+
+    def _storeVerified(self, verified, source, key, value, challenge):
+        if not verified:
+            logger(self.sourceNode,
+                  "RETNONE: Bad signature for sender of "
+                  "store request: {}".format(source))
+            return None
+        try:
+            self.router.addContact(source)
+        except Exception as err:
+            _log.error("Failed to add contact to router, err={}".format(err))
+        self.storage[key] = value
+        try:
+            signature = self.runtime_credentials.sign_data(challenge)
+        except:
+            logger(self.sourceNode,
+                  "RETNONE: Signing of rpc_store failed")
+            return None
+        logger(self.sourceNode, "Signing of rpc_store success")
+        return signature
 
     def rpc_append(self, sender, nodeid, key, value, challenge, signature):
         logger(self.sourceNode,"rpc_value:\n\tsender={}nodeid={}\n\tkey={}\n\tvalue={}".format(sender, nodeid, key, value))
@@ -605,44 +658,42 @@ class KademliaProtocolAppend(KademliaProtocol):
                   "found in store".format(source))
             return {'NACK' : None, "signature" : signature}
         else:
-            try:
-                sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
-                payload = "{}{}".format(sourceNodeIdHex, challenge)
-                self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                    cert_stored,
-                                                                    signature,
-                                                                    payload,
-                                                                    certificate.TRUSTSTORE_TRANSPORT)
-            except:
-                logger(self.sourceNode,
-                      "RETNONE: Bad signature for sender of "
-                      "append request: {}".format(source))
-                return None
-            self.router.addContact(source)
-            try:
-                pvalue = json.loads(value)
-                self.set_keys.add(key)
-                if key not in self.storage:
-                    logger(self.sourceNode, "append key: %s not in storage set value: %s" %
-                                            (base64.b64encode(key), pvalue))
-                    self.storage[key] = value
-                else:
-                    old_value_ = self.storage[key]
-                    old_value = json.loads(old_value_)
-                    new_value = list(set(old_value + pvalue))
-                    logger(self.sourceNode, "append key: %s old: %s add: %s new: %s" %
-                                            (base64.b64encode(key), old_value, pvalue, new_value))
-                    self.storage[key] = json.dumps(new_value)
-            except:
-                logger(self.sourceNode,"RETNONE: Trying to append something not a JSON coded list %s" % value, exc_info=True)
-                return None
-            try:
-                signature = self.runtime_credentials.sign_data(challenge)
-            except:
-                logger(self.sourceNode,
-                      "RETNONE: Signing of rpc_append failed")
-                return None
-            return signature
+            sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
+            payload = "{}{}".format(sourceNodeIdHex, challenge)
+            d = self.verifyRequest(cert_stored, signature, payload)
+            return d.addCallback(self._appendVerified, source, key, value, challenge)
+
+    def _appendVerified(self, verified, source, key, value, challenge):
+        if not verified:
+            logger(self.sourceNode,
+                  "RETNONE: Bad signature for sender of "
+                  "append request: {}".format(source))
+            return None
+        self.router.addContact(source)
+        try:
+            pvalue = json.loads(value)
+            self.set_keys.add(key)
+            if key not in self.storage:
+                logger(self.sourceNode, "append key: %s not in storage set value: %s" %
+                                        (base64.b64encode(key), pvalue))
+                self.storage[key] = value
+            else:
+                old_value_ = self.storage[key]
+                old_value = json.loads(old_value_)
+                new_value = list(set(old_value + pvalue))
+                logger(self.sourceNode, "append key: %s old: %s add: %s new: %s" %
+                                        (base64.b64encode(key), old_value, pvalue, new_value))
+                self.storage[key] = json.dumps(new_value)
+        except:
+            logger(self.sourceNode,"RETNONE: Trying to append something not a JSON coded list %s" % value, exc_info=True)
+            return None
+        try:
+            signature = self.runtime_credentials.sign_data(challenge)
+        except:
+            logger(self.sourceNode,
+                  "RETNONE: Signing of rpc_append failed")
+            return None
+        return signature
 
 
 
@@ -663,39 +714,37 @@ class KademliaProtocolAppend(KademliaProtocol):
                   "found in store".format(source))
             return {'NACK' : None, "signature" : signature}
         else:
-            try:
-                sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
-                payload = "{}{}".format(sourceNodeIdHex, challenge)
-                self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                    cert_stored,
-                                                                    signature,
-                                                                    payload,
-                                                                    certificate.TRUSTSTORE_TRANSPORT)
-            except:
-                logger(self.sourceNode,
-                      "RETNONE: Bad signature for sender of "
-                      "remove request: {}".format(source))
-                return None
-            self.router.addContact(source)
-            try:
-                pvalue = json.loads(value)
-                self.set_keys.add(key)
-                if key in self.storage:
-                    old_value = json.loads(self.storage[key])
-                    new_value = list(set(old_value) - set(pvalue))
-                    self.storage[key] = json.dumps(new_value)
-                    logger(self.sourceNode, "remove key: %s old: %s add: %s new: %s" %
-                                            (base64.b64encode(key), old_value, pvalue, new_value))
-            except:
-                logger(self.sourceNode,"RETNONE: Trying to remove somthing not a JSON coded list %s" % value, exc_info=True)
-                return None
-            try:
-                signature = self.runtime_credentials.sign_data(challenge)
-            except:
-                logger(self.sourceNode,
-                      "RETNONE: Signing of rpc_remove failed")
-                return None
-            return signature
+            sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
+            payload = "{}{}".format(sourceNodeIdHex, challenge)
+            d = self.verifyRequest(cert_stored, signature, payload)
+            return d.addCallback(self._removeVerified, source, key, value, challenge)
+
+    def _removeVerified(self, verified, source, key, value, challenge):
+        if not verified:
+            logger(self.sourceNode,
+                  "RETNONE: Bad signature for sender of "
+                  "remove request: {}".format(source))
+            return None
+        self.router.addContact(source)
+        try:
+            pvalue = json.loads(value)
+            self.set_keys.add(key)
+            if key in self.storage:
+                old_value = json.loads(self.storage[key])
+                new_value = list(set(old_value) - set(pvalue))
+                self.storage[key] = json.dumps(new_value)
+                logger(self.sourceNode, "remove key: %s old: %s add: %s new: %s" %
+                                        (base64.b64encode(key), old_value, pvalue, new_value))
+        except:
+            logger(self.sourceNode,"RETNONE: Trying to remove somthing not a JSON coded list %s" % value, exc_info=True)
+            return None
+        try:
+            signature = self.runtime_credentials.sign_data(challenge)
+        except:
+            logger(self.sourceNode,
+                  "RETNONE: Signing of rpc_remove failed")
+            return None
+        return signature
 
     def rpc_find_node(self, sender, nodeid, key, challenge, signature):
         logger(self.sourceNode,"rpc_find_node")
@@ -717,30 +766,28 @@ class KademliaProtocolAppend(KademliaProtocol):
                   "in store".format(source))
             return {'NACK' : None, "signature" : signature}
         else:
-            try:
-                sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
-                payload = "{}{}".format(sourceNodeIdHex, challenge)
-                self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                    cert_stored,
-                                                                    signature,
-                                                                    payload,
-                                                                    certificate.TRUSTSTORE_TRANSPORT)
-            except:
-                logger(self.sourceNode,
-                      "RETNONE: Bad signature for sender of "
-                      "find_node: {}".format(source))
-                return None
-            self.router.addContact(source)
-            node = Node(key)
-            bucket = map(list, self.router.findNeighbors(node, exclude=source))
-            try:
-                signature = self.runtime_credentials.sign_data(challenge)
-            except:
-                logger(self.sourceNode,
-                      "RETNONE: Signing of rpc_find_node failed")
-                return None
-            value = {'bucket': bucket, 'signature': signature}
-            return value
+            sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
+            payload = "{}{}".format(sourceNodeIdHex, challenge)
+            d = self.verifyRequest(cert_stored, signature, payload)
+            return d.addCallback(self._findNodeVerified, source, key, challenge)
+
+    def _findNodeVerified(self, verified, source, key, challenge):
+        if not verified:
+            logger(self.sourceNode,
+                  "RETNONE: Bad signature for sender of "
+                  "find_node: {}".format(source))
+            return None
+        self.router.addContact(source)
+        node = Node(key)
+        bucket = map(list, self.router.findNeighbors(node, exclude=source))
+        try:
+            signature = self.runtime_credentials.sign_data(challenge)
+        except:
+            logger(self.sourceNode,
+                  "RETNONE: Signing of rpc_find_node failed")
+            return None
+        value = {'bucket': bucket, 'signature': signature}
+        return value
 
     def rpc_find_value(self, sender, nodeid, key, challenge, signature, cert_str=None):
         """
@@ -781,6 +828,7 @@ class KademliaProtocolAppend(KademliaProtocol):
                           "RETNONE: Invalid certificate "
                           "request: {}".format(source))
                     return None
+                return self._findValueVerified(True, source, key, challenge)
             else:
                 try:
                     signature = self.runtime_credentials.sign_data(challenge)
@@ -792,31 +840,25 @@ class KademliaProtocolAppend(KademliaProtocol):
                       "found in store".format(source))
                 return { 'NACK' : None, 'signature': signature}
         else:
-            try:
-                sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
-                payload = "{}{}".format(sourceNodeIdHex, challenge)
-                # Verifying stored certificate with signature.
-                self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                    cert_stored,
-                                                                    signature,
-                                                                    payload,
-                                                                    certificate.TRUSTSTORE_TRANSPORT)
-            except:
-                logger(self.sourceNode,
-                      "RETNONE: Bad signature for sender of "
-                      "find_value: {}".format(source))
-                return None
-
+            sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
+            payload = "{}{}".format(sourceNodeIdHex, challenge)
+            # Verifying stored certificate with signature.
+            d = self.verifyRequest(cert_stored, signature, payload)
+            return d.addCallback(self._findValueVerified, source, key, challenge)
+
+    def _findValueVerified(self, verified, source, key, challenge):
+        if not verified:
+            logger(self.sourceNode,
+                  "RETNONE: Bad signature for sender of "
+                  "find_value: {}".format(source))
+            return None
         self.router.addContact(source)
         exists, value = self.storage.get(key, None)
         if not exists:
             logger(self.sourceNode,
                   "Key {} not in store, forwarding".format(key))
-            return self.rpc_find_node(sender,
-                                     nodeid,
-                                     key,
-                                     challenge,
-                                     signature)
+            # Same signature as for find_node, already verified
+            return self._findNodeVerified(True, source, key, challenge)
         else:
             try:
                 signature = self.runtime_credentials.sign_data(challenge)
@@ -880,19 +922,18 @@ class KademliaProtocolAppend(KademliaProtocol):
                       "in store".format(source))
                 return {'NACK' : None, "signature" : signature}
             else:
-                try:
-                    sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
-                    payload = "{}{}".format(sourceNodeIdHex, challenge)
-                    self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                        cert_stored,
-                                                                        signature,
-                                                                        payload,
-                                                                        certificate.TRUSTSTORE_TRANSPORT)
-                except:
-                    logger(self.sourceNode,
-                          "RETNONE: Bad signature for sender of "
-                          "ping: {}".format(source))
-                    return None
+                sourceNodeIdHex = self.sourceNode.id.encode('hex').upper()
+                payload = "{}{}".format(sourceNodeIdHex, challenge)
+                d = self.verifyRequest(cert_stored, signature, payload)
+                return d.addCallback(self._pingVerified, source, challenge)
+        return self._pingVerified(True, source, challenge)
+
+    def _pingVerified(self, verified, source, challenge):
+        if not verified:
+            logger(self.sourceNode,
+                  "RETNONE: Bad signature for sender of "
+                  "ping: {}".format(source))
+            return None
         try:
             signature = self.runtime_credentials.sign_data(challenge)
         except:
@@ -1039,6 +1080,7 @@ class AppendServer(Server):
         def initTable(results, challenge, id):
             _log.debug("initTable")
             nodes = []
+            signed = []
             for addr, result in results.items():
                 ip = addr[0]
                 port = addr[1]
@@ -1055,17 +1097,16 @@ class AppendServer(Server):
                                                        Node(identifier))
                     else:
                         cert_stored = self.protocol.searchForCertificate(resultIdHex)
-                        try:
-                            self.runtime_credentials.verify_signed_data_from_certstring(
-                                                                        cert_stored,
-                                                                        resultSign,
-                                                                        challenge,
-                                                                        certificate.TRUSTSTORE_TRANSPORT)
-                        except:
-                            logger(self.protocol.sourceNode, "Failed verification of challenge during bootstrap")
+                        signed.append((cert_stored, resultSign, challenge))
                         nodes.append(Node(resultId,
                                          ip,
                                          port))
+            # Verify all the challenges at once, each certificate is only verified once
+            return self.protocol.verifyBatch(signed).addCallback(crawl, nodes)
+
+        def crawl(verified, nodes):
+            if not all(verified):
+                logger(self.protocol.sourceNode, "Failed verification of challenge during bootstrap")
             spider = NodeSpiderCrawl(self.protocol,
                                     self.node,
                                     nodes,
@@ -1266,6 +1307,24 @@ class SpiderCrawl(crawling.SpiderCrawl):
         self.nearest.push(peers)
 
 
+    def _find(self, rpcmethod):
+        """
+        As crawling.SpiderCrawl._find, but the signed responses of a round
+        are verified together by the protocol's verifyCrawlResponses.
+        """
+        count = self.alpha
+        if self.nearest.getIDs() == self.lastIDsCrawled:
+            count = len(self.nearest)
+        self.lastIDsCrawled = self.nearest.getIDs()
+
+        ds = {}
+        for peer in self.nearest.getUncontacted()[:count]:
+            ds[peer.id] = rpcmethod(peer, self.node, verify=False)
+            self.nearest.markContacted(peer)
+        d = deferredDict(ds).addCallback(self.protocol.verifyCrawlResponses)
+        return d.addCallback(self._nodesFound)
+
+
 class NodeSpiderCrawl(SpiderCrawl, crawling.NodeSpiderCrawl):
     # Make sure that our SpiderCrawl __init__ gets called (crawling.NodeSpiderCrawl don't have __init__)
     pass
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from mock import Mock, patch
+from kademlia.node import Node
+
+from calvin.runtime.south.plugins.storage.twistedimpl.securedht import append_server
+
+pytestmark = pytest.mark.unittest
+
+
+def protocol():
+    credentials = Mock()
+    credentials.get_verified_certificates.side_effect = lambda signed, type: [("cert", s, d) for c, s, d in signed]
+    credentials.store_verified_certificates.side_effect = lambda signed, results: results
+    p = append_server.KademliaProtocolAppend(Node("a" * 20), {}, 20, runtime_credentials=credentials)
+    p.router = Mock()
+    p.searchForCertificate = Mock(return_value="certstring")
+    return p
+
+
+@patch('calvin.utilities.runtime_credentials.verify_signatures')
+@patch.object(append_server, 'reactor')
+def test_requests_verified_together(reactor_mock, verify_mock):
+    p = protocol()
+    verify_mock.side_effect = lambda checks: [s == "good" for c, s, d in checks]
+    results = []
+    p.verifyRequest("certstring", "good", "payload1").addCallback(results.append)
+    p.verifyRequest("certstring", "bad", "payload2").addCallback(results.append)
+    assert reactor_mock.callLater.call_count == 1
+    assert results == []
+    reactor_mock.callLater.call_args[0][1]()
+    assert verify_mock.call_count == 1
+    assert results == [True, False]
+    assert p.pending_requests == []
+
+
+@patch('calvin.utilities.runtime_credentials.verify_signatures')
+def test_crawl_responses_verified_together(verify_mock):
+    p = protocol()
+    verify_mock.side_effect = lambda checks: [s == "good" for c, s, d in checks]
+    nodes = [Node(c * 20) for c in "bcd"]
+    responses = {nodes[0].id: (nodes[0], (True, {'value': "v", 'signature': "good"}), "challenge"),
+                 nodes[1].id: (nodes[1], (True, {'value': "v", 'signature': "bad"}), "challenge"),
+                 nodes[2].id: (nodes[2], (False, None), "challenge")}
+    results = []
+    p.verifyCrawlResponses(responses).addCallback(results.append)
+    assert verify_mock.call_count == 1
+    assert len(verify_mock.call_args[0][0]) == 2
+    assert results == [{nodes[0].id: responses[nodes[0].id][1],
+                        nodes[1].id: (False, None),
+                        nodes[2].id: (False, None)}]
+    p.router.addContact.assert_called_once_with(nodes[0])
+    p.router.removeContact.assert_called_once_with(nodes[2])
+    assert not p.runtime_credentials.verify_signed_data_from_certstring.called
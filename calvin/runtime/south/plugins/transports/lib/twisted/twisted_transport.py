@@ -19,6 +19,7 @@ import time
 from calvin.utilities.calvin_callback import CalvinCB
 from calvin.utilities import calvinlogger
 from calvin.utilities import calvinuuid
+from calvin.utilities import metrics
 from calvin.runtime.south.plugins.transports import base_transport
 
 _log = calvinlogger.get_logger(__name__)
@@ -27,6 +28,10 @@ _join_request_reply = {'cmd': 'JOIN_REPLY', 'id': None, 'sid': None, 'serializer
 _join_request = {'cmd': 'JOIN_REQUEST', 'id': None, 'sid': None, 'serializers': []}
 
 
+def _coder_name(coder):
+    return coder.__module__.rsplit('.', 1)[-1]
+
+
 class CalvinTransport(base_transport.BaseTransport):
     def __init__(self, rt_id, remote_uri, callbacks, transport, proto=None, node_name=None, server_node_name=None, client_validator=None):
         """docstring for __init__"""
@@ -88,7 +93,9 @@ class CalvinTransport(base_transport.BaseTransport):
             _log.debug('send_message %s => %s "%s"' % (self._rt_id, self._remote_rt_id, payload))
             self._callback_execute('send_message', self, payload)
             # Send
+            start = time.time()
             raw_payload = tcoder.encode(payload)
+            metrics.get().record_time('coder_seconds', start, time.time(), coder=_coder_name(tcoder), op='encode')
 
             # _log.debug('raw_send_message %s => %s "%s"' % (self._rt_id, self._remote_rt_id, raw_payload))
             self._callback_execute('raw_send_message', self, raw_payload)
@@ -231,7 +238,9 @@ class CalvinTransport(base_transport.BaseTransport):
         data_obj = None
         # decode
         try:
+            start = time.time()
             data_obj = self._coder.decode(data)
+            metrics.get().record_time('coder_seconds', start, time.time(), coder=_coder_name(self._coder), op='decode')
         except:
             _log.exception("Message decode failed")
         self._callback_execute('data_received', self, data_obj)
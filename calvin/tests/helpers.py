@@ -8,6 +8,7 @@ import time
 import multiprocessing
 import copy
 import numbers
+from functools import partial
 
 _log = calvinlogger.get_logger(__name__)
 _conf = calvinconfig.get()
@@ -64,14 +65,12 @@ def multi_report(request_handler, rt, actor_ids):
     """
     Helper uses 'request_handler' to fetch the report from actors in 'actor_ids' list on runtime(s) 'rt'.
     """
-    result = []
     if isinstance(rt, (list, tuple, set)):
         args = zip(rt, actor_ids)
     else:
         args = zip([rt]*len(actor_ids), actor_ids)
-    for runtime, actor_id in args:
-        result.append(request_handler.report(runtime, actor_id))
-    return result
+    return request_handler.pipeline_results([partial(request_handler.report, runtime, actor_id)
+                                             for runtime, actor_id in args])
 
 def actual_tokens_multiple(request_handler, rt, actor_ids, size=5, retries=10):
     """
@@ -97,12 +96,13 @@ def deploy_app(request_handler, deployer, runtimes, retries=10):
     deployer.deploy()
     
     def check_application():
-        for rt in runtimes:
-            try:
-                if request_handler.get_application(rt, deployer.app_id) is None:
-                    return False
-            except:
-                return False
+        try:
+            applications = request_handler.pipeline_results([partial(request_handler.get_application, rt, deployer.app_id)
+                                                             for rt in runtimes])
+        except:
+            return False
+        if None in applications:
+            return False
         _log.info("Application found on all peers, continuing")
         return True
 
@@ -123,18 +123,11 @@ def delete_app(request_handler, runtime, app_id, check_actor_ids=None, retries=1
             return True
 
     def verify_actors_gone(request_handler, runtime, actor_ids):
-        responses = []
-        for actor_id in actor_ids:
-            responses.append(request_handler.async_get_actor(runtime, actor_id))
-        gone = True
-        for r in responses:
-            try:
-                response = request_handler.async_response(r)
-                if response is not None:
-                    gone = False
-            except:
-                pass
-        return gone
+        try:
+            actors = request_handler.query_all(runtime, 'actors', ids=actor_ids, fields=['node_id'])
+        except:
+            return False
+        return all(actor is None for actor in actors.values())
 
     try:
         request_handler.delete_application(runtime, app_id)
@@ -131,11 +131,7 @@ def test_state(actor):
                                              'routing': 'default',
                                              'nbr_peers': 1},
                               'queue': {'N': 5,
-                                       'fifo': [{'data': 0, 'type': 'Token'},
-                                                {'data': 0, 'type': 'Token'},
-                                                {'data': 0, 'type': 'Token'},
-                                                {'data': 0, 'type': 'Token'},
-                                                {'data': 0, 'type': 'Token'}],
+                                       'fifo': [None, None, None, None, None],
                                        'queuetype': 'fanout_fifo',
                                        'read_pos': {inport.id: 0},
                                        'reader_offset': {inport.id: 0},
@@ -149,11 +145,7 @@ def test_state(actor):
                                               'routing': 'fanout',
                                               'nbr_peers': 1},
                                'queue': {'N': 5,
-                                        'fifo': [{'data': 0, 'type': 'Token'},
-                                                 {'data': 0, 'type': 'Token'},
-                                                 {'data': 0, 'type': 'Token'},
-                                                 {'data': 0, 'type': 'Token'},
-                                                 {'data': 0, 'type': 'Token'}],
+                                        'fifo': [None, None, None, None, None],
                                         'queuetype': 'fanout_fifo',
                                         'read_pos': {},
                                         'reader_offset': {},
@@ -21,6 +21,7 @@ from mock import Mock, patch
 from calvin.tests import DummyNode
 from calvin.runtime.north.actormanager import ActorManager
 from calvin.runtime.north.plugins.port import queue
+import calvin.requests.calvinresponse as response
 
 pytestmark = pytest.mark.unittest
 
@@ -148,6 +149,104 @@ class ActorManagerTests(unittest.TestCase):
         self.assertEqual(cb.kwargs['ports'], actor.connections(self.am.node.id))
         self.am.node.control.log_actor_migrate.assert_called_once_with(actor_id, peer_node.id)
 
+    @patch('calvin.runtime.north.actormanager.async')
+    def test_precopy_migrate(self, async_mock):
+        callback_mock = Mock()
+        self.am.node.proto = Mock()
+        actor, actor_id = self._new_actor('std.Constant', {'data': 42})
+        actor.outports['token'].set_queue(queue.fanout_fifo.FanoutFIFO({'queue_length': 4, 'direction': "out"}, {}))
+        peer_node = DummyNode()
+
+        self.am.migrate(actor_id, peer_node.id, callback_mock, precopy=True)
+        # Actor keeps running while the peer prepares
+        assert not self.am.node.pm.disconnect.called
+        args, kwargs = self.am.node.proto.actor_prepare.call_args
+        self.assertEqual(args[0], peer_node.id)
+        precopy = args[3]
+        actor.data = 43
+        args[1](response.CalvinResponse(True))
+
+        args, kwargs = self.am.node.pm.disconnect.call_args
+        kwargs['callback'](status=response.CalvinResponse(True))
+        assert actor_id not in self.am.actors
+        # Only the changes are sent
+        args, kwargs = self.am.node.proto.actor_new.call_args
+        delta = args[3]
+        self.assertEqual(delta['data'], 43)
+        self.assertTrue(delta['_precopy'])
+        self.assertFalse('_name' in delta)
+
+        # On the peer
+        prepared_mock = Mock()
+        self.am.prepare_migration('std.Constant', precopy, callback=prepared_mock)
+        assert prepared_mock.call_args[1]['status']
+        self.am.new_from_migration('std.Constant', delta, callback=callback_mock)
+        assert callback_mock.call_args[1]['status']
+        self.assertEqual(self.am.actors[actor_id].data, 43)
+        # Without a prepared state the peer asks for the full state
+        self.am.new_from_migration('std.Constant', {'_id': actor_id, '_precopy': True}, callback=callback_mock)
+        self.assertEqual(callback_mock.call_args[1]['status'].status, response.NOT_FOUND)
+
+    def test_migrate_group(self):
+        callback_mock = Mock()
+        self.am.node.proto = Mock()
+        a, a_id = self._new_actor('std.Constant', {'data': 42})
+        b, b_id = self._new_actor('std.Identity', {})
+        # a.token -> b.token inside the group, b.token -> external port
+        def _peer(port, direction, peer):
+            port.set_queue(queue.fanout_fifo.FanoutFIFO({'queue_length': 4, 'direction': direction}, {}))
+            port.endpoints = [Mock(get_peer=Mock(return_value=('local', peer)))]
+        _peer(a.outports['token'], "out", b.inports['token'].id)
+        _peer(b.inports['token'], "in", a.outports['token'].id)
+        _peer(b.outports['token'], "out", "external")
+        peer_node = DummyNode()
+
+        self.am.migrate_group([a_id, b_id], peer_node.id, callback_mock)
+        self.assertEqual(self.am.node.pm.disconnect.call_count, 2)
+        # Connections collected before the disconnects
+        for args, kwargs in self.am.node.pm.disconnect.call_args_list:
+            kwargs['callback'](status=response.CalvinResponse(True))
+        self.assertEqual(len(self.am.actors), 0)
+        args, kwargs = self.am.node.proto.actor_new_group.call_args
+        self.assertEqual(args[0], peer_node.id)
+        payload = {p['actor_state']['_id']: p['prev_connections'] for p in args[2]}
+        self.assertEqual(payload[a_id]['outports'][a.outports['token'].id], [])
+        self.assertEqual(payload[b_id]['inports'][b.inports['token'].id], [(peer_node.id, a.outports['token'].id)])
+        self.assertEqual(payload[b_id]['outports'][b.outports['token'].id], [(self.am.node.id, "external")])
+
+        # Peer fails to create b, it is handed back for another try
+        args[1](status=response.CalvinResponse(response.INTERNAL_ERROR, data={'failed': [b_id]}))
+        kwargs = callback_mock.call_args[1]
+        self.assertEqual(kwargs['migrated'], [a_id])
+        self.assertEqual(kwargs['failed'].keys(), [b_id])
+        self.assertEqual(kwargs['failed'][b_id][0], 'std.Identity')
+
+    def test_new_group_from_migration(self):
+        callback_mock = Mock()
+        a, a_id = self._new_actor('std.Constant', {'data': 42})
+        b, b_id = self._new_actor('std.Identity', {})
+        actors = [{'actor_type': 'std.Constant', 'actor_state': a.state(),
+                   'prev_connections': {'inports': {}, 'outports': {}}},
+                  {'actor_type': 'std.Identity', 'actor_state': b.state(),
+                   'prev_connections': {'inports': {b.inports['token'].id: [(self.am.node.id, a.outports['token'].id)]},
+                                        'outports': {}}},
+                  {'actor_type': 'std.NoSuchActor', 'actor_state': {'_id': "missing"},
+                   'prev_connections': {'inports': {}, 'outports': {}}}]
+        self.am.destroy(a_id, temporary=True)
+        self.am.destroy(b_id, temporary=True)
+
+        self.am.new_group_from_migration(actors, callback=callback_mock)
+        assert a_id in self.am.actors and b_id in self.am.actors
+        # Connected once all are created
+        self.assertEqual(self.am.node.pm.connect.call_count, 1)
+        assert not callback_mock.called
+        kwargs = self.am.node.pm.connect.call_args[1]
+        kwargs['callback'](status=response.CalvinResponse(True), actor_id=b_id, port_name='token',
+                           port_id=b.inports['token'].id, peer_port_id=a.outports['token'].id)
+        status = callback_mock.call_args[1]['status']
+        self.assertEqual(status.status, response.INTERNAL_ERROR)
+        self.assertEqual(status.data['failed'], ["missing"])
+
     def test_connect(self):
         actor, actor_id = self._new_actor('std.Constant', {'data': 42})
         connection_list = [['1', '2', '3', '4'], ['5', '6', '7', '8']]
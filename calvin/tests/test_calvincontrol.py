@@ -14,10 +14,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import pytest
 from mock import Mock, patch
 
-from calvin.runtime.north.calvincontrol import get_calvincontrol, CalvinControl
+from calvin.runtime.north.calvincontrol import get_calvincontrol, CalvinControl, Logger, re_post_query
 from calvin.utilities import calvinuuid
 
 pytestmark = pytest.mark.unittest
@@ -73,11 +74,22 @@ def test_get_calvincontrol_returns_xxx():
     ("GET /meter/METERING_" + uuid + "/timed HTTP/1", "METERING_" + uuid, "handle_get_timed_meter"),
     ("GET /meter/METERING_" + uuid + "/aggregated HTTP/1", "METERING_" + uuid, "handle_get_aggregated_meter"),
     ("GET /meter/METERING_" + uuid + "/metainfo HTTP/1", "METERING_" + uuid, "handle_get_metainfo_meter"),
+    ("POST /profiler HTTP/1", None, "handle_post_profiler"),
+    ("DELETE /profiler HTTP/1", None, "handle_delete_profiler"),
+    ("GET /profiler HTTP/1", None, "handle_get_profiler"),
+    ("GET /profiler/5 HTTP/1", "5", "handle_get_profiler"),
+    ("POST /query/actors HTTP/1", "actors", "handle_post_query"),
+    ("POST /query/nodes HTTP/1", "nodes", "handle_post_query"),
+    ("GET /runtime/snapshot HTTP/1", None, "handle_get_runtime_snapshot"),
+    ("GET /metrics HTTP/1", None, "handle_get_metrics"),
+    ("GET /metrics/summary HTTP/1", None, "handle_get_metrics_summary"),
+    ("POST /trace/dump HTTP/1", None, "handle_post_trace_dump"),
     ("POST /index/abc123 HTTP/1", "abc123", "handle_post_index"),
     ("DELETE /index/abc123 HTTP/1", "abc123", "handle_delete_index"),
     ("GET /index/abc123 HTTP/1", "abc123", "handle_get_index"),
     ("GET /storage/abc123 HTTP/1", "abc123", "handle_get_storage"),
     ("POST /storage/abc123 HTTP/1", "abc123", "handle_post_storage"),
+    ("GET /actor_doc/std.Constant HTTP/1", "/std.Constant", "handle_get_actor_doc"),
     ("OPTIONS /abc123 HTTP/1", None, "handle_options")
 ])
 def test_routes_correctly(url, match, handler):
@@ -108,16 +120,21 @@ def test_send_response():
     control.send_response(handle, None, data, status)
     assert control.tunnel_client.send.called
 
+    handle = (connection, 0)
     control.connections[handle] = connection
     connection.connection_lost = True
     control.send_response(handle, connection, data, status)
-    assert not connection.send.called
+    assert not connection.respond.called
 
     control.connections[handle] = connection
     connection.connection_lost = False
     control.send_response(handle, connection, data, status)
-    assert connection.send.called
-    connection.send.assert_called_with(data)
+    assert connection.respond.called
+    args, kwargs = connection.respond.call_args
+    assert args[0] == 0
+    assert args[1] == "200 OK"
+    assert "Content-Type: application/json" in args[2]
+    assert args[3] == data
 
     assert handle not in control.connections
 
@@ -142,3 +159,68 @@ def test_send_streamhader():
     connection.connection_lost = False
     control.send_streamheader(handle, connection)
     assert connection.send.called
+
+
+def test_query_pages():
+    control = calvincontrol()
+    control.security = Mock()
+    control.security.authenticate_subject = lambda credentials, callback: callback(authentication_decision=True)
+    control.security.check_security_policy = lambda callback, **kwargs: callback(access_decision=True)
+    control.node.am.list_actors.return_value = ["a3", "a1", "a2"]
+
+    def get_many(prefix, keys, cb):
+        assert prefix == "actor-"
+        cb(values={key: {'name': key, 'node_id': "node1"} if key != "a2" else False for key in keys})
+    control.node.storage.get_many = get_many
+
+    control.handle_post_query(1, 2, re_post_query.match("POST /query/actors HTTP/1"), {'limit': 2, 'fields': ['name']}, {})
+    args, kwargs = control.send_response.call_args
+    assert json.loads(args[2]) == {'items': {'a1': {'name': "a1"}, 'a2': None}, 'cursor': "a2"}
+
+    control.handle_post_query(1, 2, re_post_query.match("POST /query/actors HTTP/1"), {'limit': 2, 'cursor': "a2"}, {})
+    args, kwargs = control.send_response.call_args
+    assert json.loads(args[2]) == {'items': {'a3': {'name': "a3", 'node_id': "node1"}}, 'cursor': None}
+
+
+def test_log_fanout():
+    control = calvincontrol()
+    control.node.id = "node1"
+    control.loggers.add("all", Logger(actors=[], events=[]))
+    control.loggers.add("actor1", Logger(actors=["actor1"], events=[CalvinControl.LOG_ACTOR_NEW,
+                                                                   CalvinControl.LOG_APPLICATION_NEW]))
+    connections = {}
+    for user_id in ["all", "actor1"]:
+        connections[user_id] = Mock(connection_lost=False, writable=True)
+        control.loggers[user_id].set_connection(user_id, connections[user_id])
+
+    with patch('calvin.runtime.north.calvincontrol.json.dumps', wraps=json.dumps) as dumps:
+        control.log_actor_new("actor1", "src", "std.Counter", False)
+        assert dumps.call_count == 1
+    for connection in connections.values():
+        event = connection.send.call_args[0][0]
+        assert json.loads(event[len("data: "):])['actor_id'] == "actor1"
+    control.log_actor_new("actor2", "snk", "io.Print", False)
+    control.log_actor_destroy("actor1")
+    control.log_application_new("app1", "app")
+    assert connections["all"].send.call_count == 4
+    assert connections["actor1"].send.call_count == 2
+
+    # Slow subscriber buffers at most buffer size events, dropping the oldest
+    logger = control.loggers["all"]
+    logger.buffer_size = 2
+    connections["all"].writable = False
+    for i in range(5):
+        control.log_log_message("msg%d" % i)
+    assert logger.dropped == 3
+    assert connections["all"].send.call_count == 4
+    connections["all"].writable = True
+    logger.flush()
+    sent = [args[0][0] for args in connections["all"].send.call_args_list[4:]]
+    assert sent[0] == ": dropped 3 events\n\n"
+    assert [json.loads(e[len("data: "):])['msg'] for e in sent[1:]] == ["msg3", "msg4"]
+
+    # Lost connection removes the subscriber from the index
+    connections["actor1"].connection_lost = True
+    control.log_actor_new("actor1", "src", "std.Counter", False)
+    assert "actor1" not in control.loggers
+    assert control.loggers.subscribers(CalvinControl.LOG_ACTOR_NEW, "actor1") == set(["all"])
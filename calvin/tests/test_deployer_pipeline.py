@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from mock import Mock
+
+from calvin.runtime.north.appmanager import Deployer
+
+pytestmark = pytest.mark.unittest
+
+
+def deployable(n):
+    actors = {"app:src%d" % i: {'actor_type': 'std.Counter', 'args': {}, 'signature': 's1'} for i in range(n)}
+    actors["app:snk"] = {'actor_type': 'io.Print', 'args': {}, 'signature': 's2'}
+    connections = {"app:src%d.integer" % i: ["app:snk.token"] for i in range(n)}
+    return {'valid': True, 'actors': actors, 'connections': connections}
+
+
+def make_node():
+    node = Mock(id="node1")
+    node.app_manager.new.return_value = "app_id"
+    node.am.lookup_and_verify.return_value = (Mock(requires=[]), None)
+    node.am.check_requirements_and_sec_policy.side_effect = lambda *args, **kwargs: kwargs['callback'](access_decision=True)
+    node.am.new.side_effect = lambda **kwargs: kwargs['args']['name'] + "_id"
+    node.pm.get_port_properties.return_value = {}
+    node.pending = []
+    node.connect.side_effect = lambda **kwargs: node.pending.append(kwargs['cb'])
+    return node
+
+
+def test_deploy_once_per_type():
+    node = make_node()
+    d = Deployer(deployable(10), node, name="app")
+    d.connect_window = 4
+    d.deploy()
+    assert node.am.lookup_and_verify.call_count == 2
+    assert node.am.check_requirements_and_sec_policy.call_count == 2
+    assert node.am.new.call_count == 11
+    # At most connect_window connections ongoing, finalize when all done
+    connected = 0
+    while node.pending:
+        assert len(node.pending) <= 4
+        assert not node.app_manager.finalize.called
+        node.pending.pop(0)(status=True)
+        connected += 1
+    assert connected == 10
+    assert node.app_manager.finalize.call_count == 1
+
+
+def test_deploy_synchronous_connect():
+    node = make_node()
+    node.connect.side_effect = lambda **kwargs: kwargs['cb'](status=True)
+    d = Deployer(deployable(3), node, name="app")
+    d.connect_window = 1
+    d.deploy()
+    assert node.connect.call_count == 3
+    assert node.app_manager.finalize.call_count == 1
@@ -70,6 +70,20 @@ class TestLocalEndpoint(unittest.TestCase):
         assert self.local_in.get_peer() == ('local', self.peer_port.id)
         assert self.local_out.get_peer() == ('local', self.port.id)
 
+    def test_pressure(self):
+        self.port.owner.pressure_count = 0
+        for i in range(4):
+            self.peer_port.queue.write(i, None)
+        self.local_out.communicate()
+        assert self.local_in.pressure_count == 0
+        self.peer_port.queue.write(4, None)
+        # Repeated NACKs of the same token count once
+        self.local_out.communicate()
+        self.local_out.communicate()
+        assert self.local_in.pressure_count == 1
+        assert self.local_in.pressure_last == 4
+        assert self.port.owner.pressure_count == 1
+
 
 class TestTunnelEndpoint(unittest.TestCase):
 
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import pytest
+from mock import Mock
+
+from calvin.tests import DummyNode
+from calvin.runtime.north.actormanager import ActorManager
+from calvin.runtime.north.metering import Metering
+from calvin.runtime.north.plugins.port import queue
+
+pytestmark = pytest.mark.unittest
+
+
+def test_collect_firings():
+    node = DummyNode()
+    node.am = ActorManager(node=node)
+    node.pm.remove_ports_of_actor = Mock(return_value=[])
+    metering = Metering(node)
+    metering.aggregated_timeout = 10.0
+    node.metering = metering
+    actor_id = node.am.new('std.Constant', {'data': 42})
+    actor = node.am.actors[actor_id]
+    outport = actor.outports['token']
+    outport.set_queue(queue.fanout_fifo.FanoutFIFO({'queue_length': 4, 'direction': "out"}, {}))
+    outport.queue.add_reader("reader", {})
+    actor.enable()
+
+    # Fires until the queue is full, only counted in the actor
+    assert actor.fire()
+    assert actor.fire_counts == [4]
+    assert actor_id not in metering.actors_aggregated
+
+    metering.collect()
+    assert metering.actors_aggregated[actor_id] == {'send_it': 4}
+    assert metering.actors_tokens[actor_id] == [0, 4]
+    assert metering.actors_action_time[actor_id]['send_it'] >= 0.0
+    assert metering.actors_meta[actor_id]['send_it'] == {'inports': {}, 'outports': {'token': 1}}
+
+    # Only new firings are added, also those not yet collected when destroyed
+    outport.queue.peek("reader")
+    outport.queue.commit("reader")
+    actor.fire()
+    node.am.destroy(actor_id)
+    assert metering.actors_aggregated[actor_id] == {'send_it': 5}
+    assert metering.actors_tokens[actor_id] == [0, 5]
+
+
+def test_timed_log_incremental():
+    node = DummyNode()
+    metering = Metering(node)
+    metering.timeout = 10.0
+    metering.log_size = 4
+    metering.actors_meta['actor1'] = {'a': {}, 'b': {}}
+    user_id = metering.register()
+    t = time.time()
+    metering.fired('actor1', 'a', 1, t)
+    metering.fired('actor1', 'b', 2, t + 1.0)
+    assert metering.get_timed_meter(user_id) == {'actor1': [(t, 'a'), (t + 1.0, 'b'), (t + 1.0, 'b')]}
+    # Only new firings, and at most the log size of them
+    metering.fired('actor1', 'a', 10, t + 2.0)
+    assert metering.get_timed_meter(user_id) == {'actor1': [(t + 2.0, 'a')] * 4}
+    assert metering.get_timed_meter(user_id) == {'actor1': []}
+    # Another user sees only what happened after it registered
+    other_id = metering.register()
+    assert metering.get_timed_meter(other_id) == {'actor1': []}
+
+
+def test_profiling():
+    node = DummyNode()
+    node.am = ActorManager(node=node)
+    node.pm.remove_ports_of_actor = Mock(return_value=[])
+    metering = Metering(node)
+    node.metering = metering
+    assert metering.get_profile() is None
+    actor_id = node.am.new('std.Constant', {'data': 42})
+    actor = node.am.actors[actor_id]
+    outport = actor.outports['token']
+    outport.set_queue(queue.fanout_fifo.FanoutFIFO({'queue_length': 4, 'direction': "out"}, {}))
+    outport.queue.add_reader("reader", {})
+    actor.enable()
+
+    # Firings before profiling started are not included
+    outport.queue.write("token", None)
+    actor.fire()
+    metering.start_profiling()
+    outport.queue.peek("reader")
+    outport.queue.commit("reader")
+    actor.fire()
+    profile = metering.get_profile(top=1)
+    assert profile['active']
+    assert profile['actor_types'][0]['actor_type'] == 'std.Constant'
+    assert profile['actor_types'][0]['count'] == 1
+    assert profile['actors'][0]['actor_id'] == actor_id
+    assert profile['actions'][0]['action'] == 'send_it'
+
+    metering.stop_profiling()
+    outport.queue.peek("reader")
+    outport.queue.commit("reader")
+    actor.fire()
+    profile = metering.get_profile()
+    assert not profile['active']
+    assert profile['actions'][0]['count'] == 1
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from mock import Mock, patch
+
+from calvin.runtime.north.replicationmanager import ReplicationData
+from calvin.runtime.north.plugins.requirements import performance_scaling
+from calvin.utilities.replication_defs import PRE_CHECK
+
+pytestmark = pytest.mark.unittest
+
+KWARGS = {'max': 3, 'interval': 1.0, 'smoothing': 1.0, 'horizon': 1.0, 'target': 0.5,
+          'hysteresis': 0.2, 'scale_in_checks': 2, 'cooldown': 3.0}
+
+
+class Load(object):
+    """ A queue of 10 slots, tokens arrive and are processed at rates per second """
+
+    def __init__(self):
+        self.written = 0
+        self.read = 0
+
+    def step(self, arrival, processing):
+        self.written += arrival
+        self.read = min(self.written, self.read + processing)
+        return {'port1': (self.written, self.read, 10)}
+
+
+def setup():
+    actor = Mock(id="actor1")
+    actor._replication_data = ReplicationData(actor_id="actor1")
+    performance_scaling.init(actor._replication_data)
+    node = Mock()
+    node.am.actors = {"actor1": actor}
+    return node, actor
+
+
+@patch('calvin.runtime.north.plugins.requirements.performance_scaling.time')
+def test_scale_out_before_full(time_mock):
+    node, actor = setup()
+    load = Load()
+    results = []
+    for t in range(6):
+        time_mock.time.return_value = float(t)
+        actor.get_queue_load.return_value = load.step(5, 3)
+        results.append(performance_scaling.pre_check(node, actor_id="actor1", **KWARGS))
+        # Called several times per interval only evaluates once
+        assert performance_scaling.pre_check(node, actor_id="actor1", **KWARGS) == PRE_CHECK.NO_OPERATION
+    # Queue fills 2 tokens per second, scaled out while still below 60% and then cooldown
+    assert results[:4] == [PRE_CHECK.NO_OPERATION, PRE_CHECK.NO_OPERATION,
+                           PRE_CHECK.SCALE_OUT, PRE_CHECK.NO_OPERATION]
+
+
+@patch('calvin.runtime.north.plugins.requirements.performance_scaling.time')
+def test_scale_in(time_mock):
+    node, actor = setup()
+    actor._replication_data.instances.append("actor2")
+    load = Load()
+    results = []
+    for t in range(4):
+        time_mock.time.return_value = float(t)
+        actor.get_queue_load.return_value = load.step(1, 3)
+        results.append(performance_scaling.pre_check(node, actor_id="actor1", **KWARGS))
+    assert results == [PRE_CHECK.NO_OPERATION, PRE_CHECK.NO_OPERATION,
+                       PRE_CHECK.SCALE_IN, PRE_CHECK.NO_OPERATION]
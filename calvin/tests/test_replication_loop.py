@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from mock import Mock, patch
+
+from calvin.runtime.north.replicationmanager import ReplicationManager
+
+pytestmark = pytest.mark.unittest
+
+
+@patch('calvin.runtime.north.replicationmanager.time')
+@patch('calvin.runtime.north.replicationmanager.async')
+def test_replication_loop_timer(async_mock, time_mock):
+    node = Mock(quitting=False)
+    node.am.actors = {}
+    rm = ReplicationManager(node)
+    rm.loop_period = 1.0
+    rm.loop_min_period = 0.1
+    time_mock.time.return_value = 10.0
+    rm.start()
+    assert async_mock.DelayedCall.call_args[0][0] == 1.0
+    # Wakeup reschedules sooner, more wakeups keep it
+    rm.trigger_replication_loop()
+    assert async_mock.DelayedCall.call_args[0][0] == 0.0
+    rm.trigger_replication_loop()
+    assert async_mock.DelayedCall.call_count == 2
+    # Run it, next periodic run scheduled and wakeups limited by minimum period
+    rm._replication_loop_timeout()
+    assert node.metering.add_cost.call_args[0][0] == "replication_loop"
+    assert async_mock.DelayedCall.call_args[0][0] == 1.0
+    rm.trigger_replication_loop()
+    assert async_mock.DelayedCall.call_args[0][0] == pytest.approx(0.1)
+    # Stops when quitting
+    node.quitting = True
+    rm._replication_loop_timeout()
+    assert async_mock.DelayedCall.call_count == 4
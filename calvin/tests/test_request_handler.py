@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import threading
+import pytest
+from functools import partial
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from calvin.requests.request_handler import RequestHandler
+
+pytestmark = pytest.mark.unittest
+
+
+class ControlAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        if self.path.startswith("/actor/"):
+            actor_id = self.path.split("/")[2]
+            status = 404 if actor_id == "missing" else 200
+            data = json.dumps({'actor_id': actor_id})
+        else:
+            status, data = 200, json.dumps({'id': "node1"})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    server = Server(("127.0.0.1", 0), ControlAPI)
+    server.clients = set()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_reused(server):
+    uri = "http://127.0.0.1:%d" % server.server_address[1]
+    request_handler = RequestHandler()
+    for _ in range(5):
+        assert request_handler.get_node_id(uri) == "node1"
+    assert len(server.clients) == 1
+    future = request_handler.async_get_node_id(uri)
+    assert request_handler.async_response(future) == "node1"
+    assert not request_handler.future_responses
+    request_handler.close()
+
+
+def test_pipeline(server):
+    uri = "http://127.0.0.1:%d" % server.server_address[1]
+    request_handler = RequestHandler()
+    operations = [partial(request_handler.get_actor, uri, str(i)) for i in range(20)]
+    operations.append(partial(request_handler.get_actor, uri, "missing"))
+    results = list(request_handler.pipeline(operations, max_concurrent=4))
+    assert len(results) == 21
+    assert sorted(index for index, _, _ in results) == range(21)
+    for index, result, exception in results:
+        if index == 20:
+            assert result is None and str(exception).startswith("404")
+        else:
+            assert result == {'actor_id': str(index)} and exception is None
+    # At most one connection per concurrent request
+    assert len(server.clients) <= 4
+
+    assert request_handler.pipeline_results(operations[:20]) == [{'actor_id': str(i)} for i in range(20)]
+    with pytest.raises(Exception):
+        request_handler.pipeline_results(operations)
+    request_handler.close()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import pytest
+
+from calvin.runtime.north.state_codec import StateCodec, MissingState, is_encoded
+
+pytestmark = pytest.mark.unittest
+
+
+def make_state():
+    return {'_id': "actor1", '_name': "src", '_managed': ['data', 'buffer'],
+            'data': 42, 'buffer': range(1000),
+            'inports': {}, 'outports': {'port1': {'queue': {'fifo': [None, {'type': 'Token', 'data': 1}]}}}}
+
+
+def test_roundtrip():
+    sender = StateCodec()
+    receiver = StateCodec()
+    state = make_state()
+    encoded = sender.encode(state)
+    assert is_encoded(encoded)
+    assert not is_encoded(state)
+    assert encoded['compressed']
+    # Goes with any message coder
+    encoded = json.loads(json.dumps(encoded))
+    assert len(json.dumps(encoded)) < len(json.dumps(state))
+    assert receiver.decode(encoded) == state
+
+
+def test_unchanged_values_referenced():
+    sender = StateCodec()
+    receiver = StateCodec()
+    state = make_state()
+    first = sender.encode(state, "node1")
+    receiver.decode(first)
+    state['data'] = 43
+    encoded = sender.encode(state, "node1")
+    assert len(encoded['data']) < len(first['data']) / 4
+    assert receiver.decode(encoded) == state
+
+    # A new peer misses the buffer
+    with pytest.raises(MissingState) as excinfo:
+        StateCodec().decode(encoded)
+    assert len(excinfo.value.refs) == 1
+
+    # Everything sent again after forget
+    sender.forget("node1")
+    assert StateCodec().decode(sender.encode(state, "node1")) == state
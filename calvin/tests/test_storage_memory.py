@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+import pytest
+from mock import Mock, patch
+
+from calvin.tests import DummyNode
+from calvin.runtime.north import storage
+from calvin.runtime.north.plugins.storage.storage_memory import StorageMemory
+
+pytestmark = pytest.mark.unittest
+
+
+@patch('calvin.runtime.north.plugins.storage.storage_memory.async')
+class StorageMemoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = StorageMemory()
+
+    def test_deferred_callbacks(self, async_mock):
+        cb = Mock()
+        self.backend.set("key", "value", cb=cb)
+        self.backend.get("key", cb=cb)
+        self.backend.set("key", None)
+        self.backend.get("key", cb=cb)
+        # Called later, all from one delayed call
+        self.assertFalse(cb.called)
+        self.assertEqual(async_mock.DelayedCall.call_count, 1)
+        self.backend._call_callbacks()
+        self.assertEqual([c[0] for c in cb.call_args_list], [("key", True), ("key", "value"), ("key", None)])
+
+    def test_sets(self, async_mock):
+        cb = Mock()
+        self.backend.append("set", json.dumps(["a", "b"]))
+        self.backend.append("set", json.dumps(["b", "c"]))
+        self.backend.remove("set", json.dumps(["a"]))
+        self.backend.get_concat("set", cb=cb)
+        self.backend._call_callbacks()
+        self.assertEqual(sorted(json.loads(cb.call_args[0][1])), ["b", "c"])
+        self.backend.append("set", "not a list", cb=cb)
+        self.backend._call_callbacks()
+        cb.assert_called_with("set", False)
+
+
+class StorageMemoryStorageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = StorageMemory()
+        self.storage = storage.Storage(DummyNode(), override_storage=self.backend)
+        self.storage.starting = True
+        with patch('calvin.runtime.north.plugins.storage.storage_memory.async') as async_mock:
+            self.storage.start()
+            _, started_cb, status = async_mock.DelayedCall.call_args[0]
+            started_cb(status)
+
+    @patch('calvin.runtime.north.plugins.storage.storage_memory.async')
+    @patch('calvin.runtime.north.storage.async')
+    def test_get_many(self, async_mock, backend_async_mock):
+        self.storage.set("actor_type-", "a", {'name': "a"}, None)
+        self.storage.set("actor_type-", "b", {'name': "b"}, None)
+        self.backend._call_callbacks()
+        cb = Mock()
+        self.storage.get_many("actor_type-", ["a", "b", "c", "a"], cb=cb)
+        self.backend._call_callbacks()
+        cb.assert_called_once_with(values={"a": {'name': "a"}, "b": {'name': "b"}, "c": None})
+
+    @patch('calvin.runtime.north.plugins.storage.storage_memory.async')
+    @patch('calvin.runtime.north.storage.async')
+    def test_flush_localdata(self, async_mock, backend_async_mock):
+        self.storage.localstore = {"k1": "v1", "k2": "v2"}
+        self.storage.flush_localdata()
+        self.backend._call_callbacks()
+        self.assertEqual(self.storage.localstore, {})
+        self.assertEqual(self.backend._values, {"k1": "v1", "k2": "v2"})
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import pytest
+from mock import Mock, patch
+
+from calvin.tests import DummyNode
+from calvin.runtime.north import storage
+from calvin.runtime.north.plugins.storage.proxy import StorageProxy
+
+pytestmark = pytest.mark.unittest
+
+
+class StorageProxyClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = StorageProxy(DummyNode())
+        self.proxy.tunnel = Mock()
+        self.proxy.window = 2
+
+    @patch('calvin.runtime.north.plugins.storage.proxy.async')
+    def test_pipelined_batch(self, async_mock):
+        self.proxy.set(key="a", value="1")
+        self.proxy.set(key="b", value="2")
+        self.proxy.set(key="c", value="3")
+        self.assertEqual(async_mock.DelayedCall.call_count, 1)
+        self.proxy._flush()
+        frame = self.proxy.tunnel.send.call_args[0][0]
+        self.assertEqual(frame['cmd'], 'BATCH')
+        self.assertEqual([m['key'] for m in frame['msgs']], ["a", "b"])
+        # Window is full, nothing more is sent until replies arrive
+        self.proxy._flush()
+        self.assertEqual(self.proxy.tunnel.send.call_count, 1)
+        self.proxy.tunnel_recv_handler({'cmd': 'BATCH', 'msgs': [
+            {'cmd': 'REPLY', 'msg_uuid': m['msg_uuid'], 'key': m['key'], 'value': True} for m in frame['msgs']]})
+        self.proxy._flush()
+        frame = self.proxy.tunnel.send.call_args[0][0]
+        self.assertEqual(frame['cmd'], 'SET')
+        self.assertEqual(frame['key'], "c")
+
+    @patch('calvin.runtime.north.plugins.storage.proxy.async')
+    def test_coalesced_get(self, async_mock):
+        cb1 = Mock()
+        cb2 = Mock()
+        self.proxy.get(key="actor_type-x", cb=cb1)
+        self.proxy.get(key="actor_type-x", cb=cb2)
+        self.proxy._flush()
+        frame = self.proxy.tunnel.send.call_args[0][0]
+        self.assertEqual(frame['cmd'], 'GET')
+        self.proxy.tunnel_recv_handler({'cmd': 'REPLY', 'msg_uuid': frame['msg_uuid'], 'key': "actor_type-x", 'value': "v"})
+        cb1.assert_called_once_with(key="actor_type-x", value="v")
+        cb2.assert_called_once_with(key="actor_type-x", value="v")
+        self.assertEqual(self.proxy.pending_gets, {})
+
+    @patch('calvin.runtime.north.plugins.storage.proxy.async')
+    def test_tunnel_down_fails_requests(self, async_mock):
+        cb1 = Mock()
+        cb2 = Mock()
+        self.proxy.get(key="actor_type-x", cb=cb1)
+        self.proxy._flush()
+        self.proxy.set(key="a", value="1", cb=cb2)
+        self.proxy.tunnel_down(org_cb=None)
+        cb1.assert_called_once_with(key="actor_type-x", value=None)
+        cb2.assert_called_once_with(key="a", value=None)
+        self.assertEqual((self.proxy.replies, self.proxy.pending_gets, self.proxy.queued, self.proxy.inflight),
+                         ({}, {}, [], 0))
+        # The key is not blocked by the lost get
+        cb3 = Mock()
+        self.proxy.tunnel = Mock()
+        self.proxy.get(key="actor_type-x", cb=cb3)
+        self.proxy._flush()
+        frame = self.proxy.tunnel.send.call_args[0][0]
+        self.proxy.tunnel_recv_handler({'cmd': 'REPLY', 'msg_uuid': frame['msg_uuid'], 'key': "actor_type-x", 'value': "v"})
+        cb3.assert_called_once_with(key="actor_type-x", value="v")
+
+
+class StorageProxyServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = Mock()
+        self.storage = storage.Storage(DummyNode(), override_storage=self.backend)
+        self.storage.node.proto = Mock()
+        self.storage._init_proxy()
+
+    @patch('calvin.runtime.north.storage.async')
+    def test_fanin_get(self, async_mock):
+        tunnels = [Mock(id="T%d" % i) for i in range(3)]
+        for i, t in enumerate(tunnels):
+            self.storage.tunnel_recv_handler(t, {'cmd': 'GET', 'key': "actor_type-x", 'msg_uuid': "M%d" % i})
+        self.assertEqual(self.backend.get.call_count, 1)
+        backend_cb = self.backend.get.call_args[1]['cb']
+        backend_cb("actor_type-x", self.storage.coder.encode({'a': 1}))
+        self.storage._proxy_flush_replies()
+        for i, t in enumerate(tunnels):
+            reply = t.send.call_args[0][0]
+            self.assertEqual(reply['msg_uuid'], "M%d" % i)
+            self.assertEqual(self.storage.coder.decode(reply['value']), {'a': 1})
+        # The reply cancels the timeout
+        async_mock.DelayedCall.return_value.cancel.assert_called_once_with()
+        self.assertEqual(self.storage._proxy_gets, {})
+
+    @patch('calvin.runtime.north.storage.async')
+    def test_fanin_get_timeout(self, async_mock):
+        tunnel = Mock(id="T")
+        self.storage.tunnel_recv_handler(tunnel, {'cmd': 'GET', 'key': "k", 'msg_uuid': "M1"})
+        timeout = async_mock.DelayedCall.call_args_list[0][0]
+        timeout[1](*timeout[2:])
+        self.storage._proxy_flush_replies()
+        self.assertEqual(tunnel.send.call_args[0][0]['msg_uuid'], "M1")
+        self.assertEqual(self.storage._proxy_gets, {})
+        # A late backend reply is not sent again
+        self.backend.get.call_args[1]['cb']("k", None)
+        self.storage._proxy_flush_replies()
+        self.assertEqual(tunnel.send.call_count, 1)
+
+    @patch('calvin.runtime.north.storage.async')
+    def test_batch_replies(self, async_mock):
+        tunnel = Mock(id="T")
+        self.storage.tunnel_recv_handler(tunnel, {'cmd': 'BATCH', 'msgs': [
+            {'cmd': 'GET', 'key': "k1", 'msg_uuid': "M1"},
+            {'cmd': 'GET', 'key': "k2", 'msg_uuid': "M2"}]})
+        self.assertEqual(self.backend.get.call_count, 2)
+        for call in self.backend.get.call_args_list:
+            call[1]['cb'](call[1]['key'], None)
+        self.storage._proxy_flush_replies()
+        self.assertEqual(tunnel.send.call_count, 1)
+        frame = tunnel.send.call_args[0][0]
+        self.assertEqual(frame['cmd'], 'BATCH')
+        self.assertEqual([m['msg_uuid'] for m in frame['msgs']], ["M1", "M2"])
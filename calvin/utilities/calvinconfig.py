@@ -91,7 +91,7 @@ class CalvinConfig(object):
                 'comment': 'User definable section',
                 'actor_paths': ['systemactors'],
                 'framework': 'twistedimpl',
-                'storage_type': 'dht', # supports dht, securedht, local, and proxy
+                'storage_type': 'dht', # supports dht, securedht, local, memory, and proxy
                 'storage_proxy': None,
                 'capabilities_blacklist': [],
                 'remote_coder_negotiator': 'static',
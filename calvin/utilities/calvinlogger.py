@@ -72,7 +72,20 @@ def analyze(self, node_id, func, param, peer_node_id=None, tb=False, mute=False,
         self._log(5, "[[ANALYZE]]" + json_str, args, **kws)
 
 
+_set_level = logging.Logger.setLevel
+
+
+def set_level(self, level):
+    _set_level(self, level)
+    if 0 < logging._checkLevel(level) <= 5:
+        # Once any logger analyzes, call sites guarded by the analyzing flag build their parameters
+        logging.Logger.analyzing = True
+
+
 logging.Logger.analyze = analyze
+# Hot paths guard analyze calls with "if _log.analyzing:" to skip building the parameters
+logging.Logger.analyzing = False
+logging.Logger.setLevel = set_level
 logging.addLevelName(5, "ANALYZE")
 
 
@@ -15,6 +15,7 @@
 # limitations under the License.
 
 import random
+from collections import deque
 
 from calvin.utilities.calvinlogger import get_logger
 _log = get_logger(__name__)
@@ -51,6 +52,11 @@ class InfiniteElement(Exception):
         return "InfiniteElement"
 
 
+def is_infinite(elem):
+    """ True when elem indicates an infinite set, either the class or an instance """
+    return elem is InfiniteElement or isinstance(elem, InfiniteElement)
+
+
 class DynOps(object):
     """
     Dynamic operations built around hiraki of iterables.
@@ -111,9 +117,7 @@ class DynOps(object):
             else:
                 _log.debug("%s INFINITE SEND" % self.__str__())
                 self.infinite_sent = True
-                # FIXME Need to trig?
-                #self.trig()
-                return InfiniteElement
+                return InfiniteElement()
         return self.op()
 
     def __next__(self):
@@ -125,213 +129,269 @@ class DynOps(object):
         return self.__str__()
 
 
-class Union(DynOps):
-    """ A Dynamic Operations Union set operation
-        The union between all supplied iterables
+class SetOp(DynOps):
+    """ Base for the incremental set operations
+        The elements are drawn from the iterables when any of them trigger,
+        the set operation is kept as hash set state updated with only the
+        new elements (deltas). The own callback is only triggered when new
+        elements are available or the set became final, the elements are
+        buffered until iterated.
     """
 
-    def __init__(self, *iters):
-        super(Union, self).__init__()
+    def __init__(self, iters):
+        super(SetOp, self).__init__()
         # To allow lists etc to be arguments directly always take the iter
         self.iters = [iter(v) for v in iters]
-        # If any iterators are infinite the union will be infinite
-        self.infinite_set = any([True for v in self.iters if getattr(v, 'infinite_set', False)])
-        self.set = []
-        self.trigger_add(self.iters)
-        self.final = False
-        if self.infinite_set:
-            self.trig()
-            self.final = True
+        self.final = {id(k): False for k in self.iters}
+        # Elements produced, and the ones not yet iterated
+        self.set = set([])
+        self.out = deque([])
+        self._final = False
+        self._news = False
+        self._pulling = False
+        self._dirty = False
+
+    def emit(self, elem):
+        self.set.add(elem)
+        self.out.append(elem)
+        self._news = True
+
+    def add(self, it, elem):
+        """ Needs to be overriden in subclasses, handle new elem drawn from iterable it """
+        raise NotImplementedError
+
+    def iter_final(self, it):
+        """ Iterable it has no more elements, override in subclasses when needed """
+        pass
+
+    def is_final(self):
+        """ Needs to be overriden in subclasses, True when no more elements can be produced """
+        raise NotImplementedError
+
+    def pull_order(self):
+        return self.iters
+
+    def pull(self):
+        """ Draw all available elements from the iterables """
+        if self._pulling:
+            # Triggered by an iterable while drawing, take another round
+            self._dirty = True
+            return
+        self._pulling = True
+        try:
+            while True:
+                self._dirty = False
+                for v in self.pull_order():
+                    try:
+                        while not self.final[id(v)]:
+                            self.add(v, v.next())
+                    except PauseIteration:
+                        pass
+                    except StopIteration:
+                        self.final[id(v)] = True
+                        self.iter_final(v)
+                if not self._dirty:
+                    break
+        finally:
+            self._pulling = False
+        if not self._final and (self.infinite_set or self.is_final()):
+            self._final = True
+            self._news = True
+
+    def trig(self):
+        if self._final:
             return
+        self.pull()
+        if self._news and not self._pulling:
+            self._news = False
+            if self._trigger:
+                self._trigger(*self.cb_args, **self.cb_kwargs)
 
     def op(self):
-        paused = False
-        for v in self.iters:
-            try:
-                while True:
-                    _log.debug("%s:next TRY iter:%s" % (self.__str__(), str(v)))
-                    n = v.next()
-                    if n not in self.set:
-                        _log.debug("%s:next GOT NEW value:%s iter:%s" % (self.__str__(), str(n), str(v)))
-                        self.set.append(n)
-                        return n
-            except PauseIteration:
-                _log.debug("%s:next GOT PAUSE iter:%s" % (self.__str__(), str(v)))
-                paused = True
-            except StopIteration:
-                _log.debug("%s:next GOT STOP iter:%s" % (self.__str__(), str(v)))
-                pass
-        if paused:
-            _log.debug("%s:next RAISE PAUSE" % (self.__str__(), ))
-            raise PauseIteration
-        else:
-            _log.debug("%s:next RAISE STOP" % (self.__str__(), ))
-            self.final = True
+        if not self.out and not self._final:
+            self.pull()
+        if self.infinite_set:
+            return self.next()
+        if self.out:
+            return self.out.popleft()
+        if self._final:
             raise StopIteration
+        raise PauseIteration
 
-    def __str__(self):
+    def _iters_str(self, iters):
         s = ""
-        for i in self.iters:
+        for i in iters:
             sub = i.__str__()
             for line in sub.splitlines():
                 s += "\n\t" + line
             s += ", "
-        return "Union%s%s%s%s(%s\n)" % (("<" + self.name + ">") if self.name else "",
-                                    "<Inf>" if self.infinite_set else "",
-                                    "#" if self.final else "-", self.miss_cb_str(), s[:-2])
+        return s[:-2]
+
+    def _header_str(self, kind):
+        return "%s%s%s%s%s" % (kind, ("<" + self.name + ">") if self.name else "",
+                               "<Inf>" if self.infinite_set else "",
+                               "#" if self._final else "-", self.miss_cb_str())
+
+
+class Union(SetOp):
+    """ A Dynamic Operations Union set operation
+        The union between all supplied iterables
+    """
+
+    def __init__(self, *iters):
+        super(Union, self).__init__(iters)
+        # If any iterators are infinite the union will be infinite
+        self.infinite_set = any([True for v in self.iters if getattr(v, 'infinite_set', False)])
+        if self.infinite_set:
+            self._final = True
+            return
+        self.trigger_add(self.iters)
+
+    def add(self, it, elem):
+        if elem not in self.set:
+            self.emit(elem)
+
+    def is_final(self):
+        return all(self.final.values())
 
-class Intersection(DynOps):
+    def __str__(self):
+        return "%s(%s\n)" % (self._header_str("Union"), self._iters_str(self.iters))
+
+
+class Intersection(SetOp):
     """ A Dynamic Operations Intersection set operation
-        The intersection between all supplied iterables
+        The intersection between all supplied iterables.
+        Counts in how many iterables each element have been seen, hence an
+        element is produced as soon as it is seen in all of them.
     """
 
     def __init__(self, *iters):
-        super(Intersection, self).__init__()
-        # To allow lists etc to be arguments directly always take the iter
         # Drop iterators which are infinite since not limiting
-        self.iters = [iter(v) for v in iters if not getattr(v, 'infinite_set', False)]
-        self.set = set([])
-        self.candidates = set([])
+        super(Intersection, self).__init__([v for v in iters if not getattr(v, 'infinite_set', False)])
         self.drawn = {id(k): set([]) for k in self.iters}
-        self.final = {id(k): False for k in self.iters}
         self.infs = {id(k): False for k in self.iters}
-        self.trigger_add(self.iters)
-        self._final = False
-        if len(self.iters) == 0 and len(iters) > 0:
-            # We only had infinite iters we are infinite
+        self.counts = {}
+        # Size of the smallest drawn set of a final iterable, we can never produce more
+        self.limit = None
+        if not self.iters:
+            # We only had infinite iters (or none) we are infinite
             self.infinite_set = True
-            self.trig()
+            self._final = True
+            return
+        self.trigger_add(self.iters)
 
-    def op(self):
-        if self.candidates:
-            e = self.candidates.pop()
-            self.set.add(e)
-            return e
-        while True:
-            active = False
-            for v in self.iters:
-                if not self.final[id(v)]:
-                    try:
-                        n = v.next()
-                        if isinstance(n, InfiniteElement):
-                            self.infs[id(v)] = True
-                            self.final[id(v)] = True
-                        self.drawn[id(v)].add(n)
-                        active = True
-                    except PauseIteration:
-                        pass
-                    except StopIteration:
-                        self.final[id(v)] = True
+    def _needed(self):
+        return len(self.iters) - sum(self.infs.values())
+
+    def add(self, it, elem):
+        if is_infinite(elem):
+            self.infs[id(it)] = True
+            self.final[id(it)] = True
             if all(self.infs.values()):
                 self.infinite_set = True
-                if self.infinite_sent:
-                    _log.debug("%s INFINITE STOP" % self.__str__())
-                    raise StopIteration
-                else:
-                    _log.debug("%s INFINITE SEND" % self.__str__())
-                    self.infinite_sent = True
-                    # FIXME Need to trig?
-                    #self.trig()
-                    return InfiniteElement
-                
-            # Current seen intersection
-            self.candidates.update(set.intersection(*[self.drawn[id(v)] for v in self.iters if not self.infs[id(v)]]))
-            _log.debug("Intersection%s%s%s candidates: %s drawn: %s infs: %s"  % (("<" + self.name + ">") if self.name else "",
-                                           "<Inf>" if self.infinite_set else "",
-                                           "#" if self._final else "-", self.candidates, self.drawn.values(), self.infs.values()))
-            # remove from individual iterables
-            for v in self.drawn.values():
-                v.difference_update(self.candidates)
-            # Remove previously seen
-            self.candidates.difference_update(self.set)
-            if self.candidates:
-                e = self.candidates.pop()
-                self.set.add(e)
-                return e
-            if not active or all(self.final.values()):
-                break
-        if all([self.final[id(v)] for v in self.iters]):
-            self._final = True
-            raise StopIteration
-        else:
-            raise PauseIteration
+                return
+            # Not limiting anymore, recount without it
+            self.counts = {}
+            for v in self.iters:
+                if not self.infs[id(v)]:
+                    for e in self.drawn[id(v)]:
+                        self.counts[e] = self.counts.get(e, 0) + 1
+            needed = self._needed()
+            for e, c in self.counts.iteritems():
+                if c == needed and e not in self.set:
+                    self.emit(e)
+            return
+        drawn = self.drawn[id(it)]
+        if elem in drawn:
+            return
+        drawn.add(elem)
+        c = self.counts.get(elem, 0) + 1
+        self.counts[elem] = c
+        if c == self._needed():
+            self.emit(elem)
+
+    def iter_final(self, it):
+        if not self.infs[id(it)]:
+            size = len(self.drawn[id(it)])
+            self.limit = size if self.limit is None else min(self.limit, size)
+
+    def is_final(self):
+        # All elements of a finished iterable produced, then nothing more can be produced
+        return all(self.final.values()) or (self.limit is not None and len(self.set) >= self.limit)
 
     def __str__(self):
-        s = ""
-        for i in self.iters:
-            sub = i.__str__()
-            for line in sub.splitlines():
-                s += "\n\t" + line
-            s += ", "
-        return "Intersection%s%s%s%s(%s\n) out=%s, candidates=%s" % (("<" + self.name + ">") if self.name else "",
-                                           "<Inf>" if self.infinite_set else "",
-                                           "#" if self._final else "-", self.miss_cb_str(), s[:-2], self.set, self.candidates)
+        return "%s(%s\n) out=%s" % (self._header_str("Intersection"), self._iters_str(self.iters), self.set)
 
 
-class Difference(DynOps):
+class Difference(SetOp):
     """ A Dynamic Operations Difference set operation
-        The first iterable is the main set which the following iterables are removed from
+        The first iterable is the main set which the following iterables are removed from.
+        The elements of the first are produced when all the removed iterables are final.
+        An infinite first is still infinite after the removal (there is no negative set),
+        unless removing an infinite set.
     """
 
     def __init__(self, first, *iters):
-        super(Difference, self).__init__()
-        # To allow lists etc to be arguments directly always take the iter
-        self.first = iter(first)
-        if getattr(self.first.infinite_set, 'infinite_set', False):
-            # TODO implementation of infinite set that we remove from. Negative set???
-            raise NotImplemented
-        self.iters = [iter(v) for v in iters]
-        self.zero_set = any([True for v in self.iters if getattr(v, 'infinite_set', False)])
-        self.trigger_add([self.first] + self.iters)
-        self.set = []
+        super(Difference, self).__init__((first,) + iters)
+        self.first = self.iters[0]
+        self.removes = self.iters[1:]
         self.remove = set([])
-        self.final = {id(k): False for k in self.iters}
-
-    def op(self):
-        _log.debug("%s.next()" % self.__str__())
+        self.pending = set([])
+        # The first produced the infinite element, infinite when the removes are final
+        self.pending_infinite = False
+        self.zero_set = any([True for v in self.removes if getattr(v, 'infinite_set', False)])
         if self.zero_set:
-            _log.debug("%s.next() REMOVE INFINITE" % self.__str__())
-            raise StopIteration
-        if all(self.final.values()):
-            _log.debug("%s.next() REMOVE THESE %s" % (self.__str__(), str(self.remove)))
-            # All remove values obtained just filter first
-            # The first's exception are exposed
-            while True:
-                n = self.first.next()
-                _log.debug("%s.next() = %s" % (self.__str__(), str(n)))
-                if n not in self.remove:
-                    self.remove.add(n)  # Enforce set behaviour 
-                    _log.debug("%s.next() ACTUAL = %s" % (self.__str__(), str(n)))
-                    return n
-        paused = False
-        for v in self.iters:
-            try:
-                while True:
-                    self.remove.add(v.next())
-            except PauseIteration:
-                paused = True
-            except StopIteration:
-                self.final[id(v)] = True
-        if paused:
-            raise PauseIteration
+            self._final = True
+            return
+        self.trigger_add(self.iters)
+
+    def pull_order(self):
+        # Get the elements to remove first
+        return self.removes + [self.first]
+
+    def _removes_final(self):
+        return all([self.final[id(v)] for v in self.removes])
+
+    def add(self, it, elem):
+        if it is self.first:
+            if is_infinite(elem):
+                if not self.zero_set:
+                    self.pending_infinite = True
+                    self._check_infinite()
+                return
+            if self.zero_set or elem in self.set or elem in self.remove:
+                return
+            if self._removes_final():
+                self.emit(elem)
+            else:
+                self.pending.add(elem)
+        elif is_infinite(elem):
+            self.zero_set = True
+            self.pending.clear()
+            self.pending_infinite = False
         else:
-            # Need to call ourself since while collecting removes can only raise PauseIteration
-            return self.op()
+            self.remove.add(elem)
+            self.pending.discard(elem)
+
+    def _check_infinite(self):
+        if self.pending_infinite and self._removes_final():
+            self.pending_infinite = False
+            self.infinite_set = True
+
+    def iter_final(self, it):
+        if it is not self.first and self._removes_final() and not self.zero_set:
+            for e in self.pending:
+                self.emit(e)
+            self.pending.clear()
+            self._check_infinite()
+
+    def is_final(self):
+        return self.zero_set or all(self.final.values())
 
     def __str__(self):
-        s = ""
-        for i in self.iters:
-            sub = i.__str__()
-            for line in sub.splitlines():
-                s += "\n\t" + line
-            s += ", "
-        f = ""
-        sub = self.first.__str__()
-        for line in sub.splitlines():
-            f += "\n\t" + line
-        return "Difference%s%s%s(first=%s, %s\n)" % (("<" + self.name + ">") if self.name else "", "<Inf>" if self.infinite_set else "", 
-                                               f, self.miss_cb_str(), s[:-2])
-        
+        return "%s(first=%s, %s\n)" % (self._header_str("Difference"), self._iters_str([self.first]),
+                                       self._iters_str(self.removes))
+
 
 class Map(DynOps):
     """ A Dynamic Operations Map operation
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class Histogram(object):
+    """
+    Fixed memory histogram of non-negative integer values (HDR style).
+    Each power of two range is split into SUB_BUCKETS linear buckets, hence the
+    relative error of a reported value is below 1/SUB_BUCKETS. Values above
+    2**max_exponent end up in the last bucket.
+    """
+
+    SUB_BUCKETS = 8
+
+    def __init__(self, max_exponent=40):
+        super(Histogram, self).__init__()
+        self.counts = [0] * ((max_exponent + 1) * Histogram.SUB_BUCKETS)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < 2 * Histogram.SUB_BUCKETS:
+            return value
+        # Keep the 4 most significant bits, the leading one selects the power of two
+        shift = value.bit_length() - 4
+        index = (shift + 1) * Histogram.SUB_BUCKETS + (value >> shift) - Histogram.SUB_BUCKETS
+        return min(index, len(self.counts) - 1)
+
+    @staticmethod
+    def bucket_range(index):
+        """ Lowest value and width of bucket at index """
+        if index < 2 * Histogram.SUB_BUCKETS:
+            return index, 1
+        shift = index // Histogram.SUB_BUCKETS - 1
+        return (index % Histogram.SUB_BUCKETS + Histogram.SUB_BUCKETS) << shift, 1 << shift
+
+    def record(self, value, count=1):
+        value = max(int(value), 0)
+        self.counts[self._index(value)] += count
+        self.count += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """ Value at percentile p (0-100), approximated by its bucket """
+        if not self.count:
+            return 0
+        limit = max(self.count * p / 100.0, 1)
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= limit:
+                low, width = Histogram.bucket_range(i)
+                return min(low + (width - 1) // 2, self.max)
+        return self.max
+
+    def buckets(self):
+        """ List of (upper bound, cumulative count) of the non-empty buckets """
+        cumulative = []
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                low, width = Histogram.bucket_range(i)
+                cumulative.append((low + width - 1, seen))
+        return cumulative
+
+    def mean(self):
+        return float(self.sum) / self.count if self.count else 0.0
+
+    def summary(self):
+        return {'count': self.count, 'sum': self.sum, 'min': self.min or 0, 'max': self.max,
+                'mean': self.mean(), 'p50': self.percentile(50), 'p90': self.percentile(90),
+                'p99': self.percentile(99)}
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from calvin.utilities.histogram import Histogram
+
+# Durations are recorded in microseconds and exported in seconds
+MICROSECONDS = 0.000001
+
+# Name: (help, scale from recorded value to exported value)
+METRICS = {
+    'scheduler_loop_seconds': ("Time to fire the enabled actors once", MICROSECONDS),
+    'scheduler_actors_fired': ("Actors that fired per scheduler loop", 1),
+    'queue_occupancy_tokens': ("Tokens in an inport queue, sampled when metering collects", 1),
+    'link_rtt_seconds': ("Round trip time of runtime to runtime requests", MICROSECONDS),
+    'token_ack_seconds': ("Time from sending a token over a tunnel until it is acknowledged", MICROSECONDS),
+    'storage_op_seconds': ("Latency of storage operations", MICROSECONDS),
+    'coder_seconds': ("Time to encode or decode a message", MICROSECONDS),
+}
+
+PREFIX = "calvin_"
+
+_metrics = None
+
+
+def get():
+    """ Returns the Metrics singleton """
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+class Metrics(object):
+    """
+    Registry of fixed memory histograms for runtime hot paths, by name and labels.
+    Hot paths should keep the histogram from histogram() and record on it directly.
+    """
+
+    def __init__(self):
+        super(Metrics, self).__init__()
+        # (name, sorted label items): Histogram
+        self._histograms = {}
+
+    def histogram(self, name, **labels):
+        """ The histogram of name with labels, created when needed """
+        key = (name, tuple(sorted(labels.items())))
+        h = self._histograms.get(key)
+        if h is None:
+            if name not in METRICS:
+                raise KeyError("Unknown metric %s" % name)
+            h = self._histograms[key] = Histogram()
+        return h
+
+    def record(self, name, value, **labels):
+        self.histogram(name, **labels).record(value)
+
+    def record_time(self, name, start, end, **labels):
+        """ Record the duration between start and end in seconds (as given by time.time()) """
+        self.histogram(name, **labels).record((end - start) * 1000000)
+
+    def remove(self, **labels):
+        """ Remove all histograms having these labels, e.g. of a destroyed actor """
+        items = set(labels.items())
+        for key in [k for k in self._histograms if items.issubset(k[1])]:
+            del self._histograms[key]
+
+    def summary(self):
+        """ Summaries of all histograms as list of dicts with name, labels and the summary """
+        return [{'name': name, 'labels': dict(labels), 'summary': h.summary()}
+                for (name, labels), h in sorted(self._histograms.iteritems())]
+
+    def prometheus(self):
+        """ All histograms in the Prometheus text exposition format """
+        lines = []
+        last_name = None
+        for (name, labels), h in sorted(self._histograms.iteritems()):
+            help_text, scale = METRICS[name]
+            full_name = PREFIX + name
+            if name != last_name:
+                lines.append("# HELP %s %s" % (full_name, help_text))
+                lines.append("# TYPE %s histogram" % full_name)
+                last_name = name
+            label_text = ",".join(['%s="%s"' % (k, _escape(v)) for k, v in labels])
+            sep = "," if label_text else ""
+            for upper, count in h.buckets():
+                lines.append('%s_bucket{%s%sle="%s"} %d' % (full_name, label_text, sep, _number(upper * scale), count))
+            lines.append('%s_bucket{%s%sle="+Inf"} %d' % (full_name, label_text, sep, h.count))
+            braces = "{%s}" % label_text if label_text else ""
+            lines.append("%s_sum%s %s" % (full_name, braces, _number(h.sum * scale)))
+            lines.append("%s_count%s %d" % (full_name, braces, h.count))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+def add_edge(edges, a, b, weight):
+    """ Add weight to the undirected edge a - b in the sparse adjacency dict of dicts """
+    if a == b:
+        return
+    edges.setdefault(a, {})
+    edges.setdefault(b, {})
+    edges[a][b] = edges[a].get(b, 0.0) + weight
+    edges[b][a] = edges[b].get(a, 0.0) + weight
+
+
+def greedy_placement(actor_ids, possible_placements, edges, anchors=None, capacity=None):
+    """ Place actors on nodes keeping heavily connected actors together.
+
+        actor_ids: the actors to place
+        possible_placements: dict actor_id -> iterable of possible node ids
+        edges: sparse adjacency, dict actor_id -> {peer actor_id: weight}
+        anchors: dict actor_id -> {node_id: weight}, affinity to fixed nodes
+                 e.g. for connections to actors not placed here
+        capacity: dict node_id -> max number of actors, nodes not in it are unlimited
+
+        The actors with fewest possible nodes are placed first and among them
+        the most heavily connected. Each actor goes to the possible node, with
+        capacity left, having the highest sum of edge weights to the actors
+        already placed there, then least loaded. The cost is linear in the
+        number of edges and possible nodes.
+
+        Returns dict actor_id -> list of its possible node ids in preference order,
+        the first is the selected node.
+    """
+    anchors = anchors or {}
+    capacity = capacity or {}
+    load = {}
+    placed = {}
+    preference = {}
+
+    def order(actor_id):
+        return (len(possible_placements.get(actor_id, ())),
+                -sum(edges.get(actor_id, {}).itervalues()), actor_id)
+
+    for actor_id in sorted(actor_ids, key=order):
+        affinity = dict(anchors.get(actor_id, {}))
+        for peer_id, weight in edges.get(actor_id, {}).iteritems():
+            if peer_id in placed:
+                node_id = placed[peer_id]
+                affinity[node_id] = affinity.get(node_id, 0.0) + weight
+
+        def score(node_id):
+            full = node_id in capacity and load.get(node_id, 0) >= capacity[node_id]
+            return (full, -affinity.get(node_id, 0.0), load.get(node_id, 0), node_id)
+
+        nodes = sorted(possible_placements.get(actor_id, ()), key=score)
+        preference[actor_id] = nodes
+        if nodes:
+            placed[actor_id] = nodes[0]
+            load[nodes[0]] = load.get(nodes[0], 0) + 1
+    return preference
@@ -14,13 +14,86 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import time
+
 from calvin.utilities import dynops
 from calvin.utilities import calvinlogger
+from calvin.utilities import calvinconfig
 from calvin.runtime.north.plugins.requirements import req_operations
 import calvin.requests.calvinresponse as response
-from calvin.runtime.south.plugins.async import async
 
 _log = calvinlogger.get_logger(__name__)
+_conf = calvinconfig.get()
+
+
+class PlacementCache(object):
+    """ Memoization of requirement matching results, keyed by the normalized requirements.
+        Matches of identical requirements while one is ongoing wait for its result.
+        Entries live 'placement_cache_ttl' seconds and the whole cache is invalidated
+        on node join/leave and local index changes.
+    """
+    def __init__(self, ttl=None):
+        super(PlacementCache, self).__init__()
+        if ttl is None:
+            ttl = _conf.get(None, 'placement_cache_ttl')
+        self.ttl = 5.0 if ttl is None else ttl
+        # key -> (timestamp, possible placements)
+        self.placements = {}
+        # key -> list of callbacks waiting for an ongoing match
+        self.ongoing = {}
+        self.generation = 0
+
+    def key(self, requirements, actor_id=None):
+        """ Normalized requirements, None when not cacheable """
+        if self.ttl <= 0:
+            return None
+        actor_specific = False
+        try:
+            for req in requirements:
+                reqs = req['requirements'] if req['op'] == 'union_group' else [req]
+                for r in reqs:
+                    actor_specific |= getattr(req_operations[r['op']], 'req_actor_specific', False)
+            key = json.dumps(requirements, sort_keys=True)
+        except:
+            # Unknown or malformed requirements are handled by the matching
+            return None
+        return (key, actor_id) if actor_specific else (key, None)
+
+    def lookup(self, key, cb):
+        """ Returns True when cb(possible_placements) is called with a cached result or will
+            be called when the ongoing match with same key is done, otherwise the caller is
+            responsible for the match and should call done.
+        """
+        if key in self.placements:
+            timestamp, placements = self.placements[key]
+            if timestamp + self.ttl > time.time():
+                cb(set(placements))
+                return True
+            del self.placements[key]
+        if key in self.ongoing:
+            self.ongoing[key].append(cb)
+            return True
+        self.ongoing[key] = []
+        return False
+
+    def done(self, key, placements, generation):
+        """ Store the result of a match started during generation, call any waiting callbacks """
+        cbs = self.ongoing.pop(key, [])
+        if generation == self.generation:
+            self.placements[key] = (time.time(), set(placements))
+        for cb in cbs:
+            cb(set(placements))
+
+    def abort(self, key):
+        """ The match failed, waiting callbacks get no possible placements, nothing is stored """
+        for cb in self.ongoing.pop(key, []):
+            cb(set([]))
+
+    def invalidate(self, *args, **kwargs):
+        self.placements = {}
+        self.generation += 1
+
 
 class ReqMatch(object):
     """ ReqMatch Do requirement matching for an actor.
@@ -36,7 +109,8 @@ class ReqMatch(object):
         """ Helper function for matching locally found actors """
         if actor_id not in self.node.am.actors:
             # Can only migrate actors from our node
-            _log.analyze(self.node.id, "+ NO ACTOR", {'actor_id': actor_id})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ NO ACTOR", {'actor_id': actor_id})
             if callable(self.callback):
                 self.callback(status=response.CalvinResponse(False), possible_placements=set([]))
             return
@@ -58,24 +132,34 @@ class ReqMatch(object):
         """
         if not isinstance(requirements, (list, tuple)):
             # Requirements need to be list
-            _log.analyze(self.node.id, "+ NO REQ LIST", {'reqs': requirements})
+            if _log.analyzing:
+                _log.analyze(self.node.id, "+ NO REQ LIST", {'reqs': requirements})
             if callable(self.callback):
                 self.callback(status=response.CalvinResponse(response.BAD_REQUEST), possible_placements=set([]))
             return
         self.requirements = requirements
         self.actor_id = actor_id
         self.component_ids = component_ids
-        self._collect_placement_counter = 0
-        self._collect_placement_last_value = 0
-        self._collect_placement_cb = None
+        self.done = False
+        self.cache = getattr(self.node, 'placement_cache', None)
+        self.cache_key = None if self.cache is None else self.cache.key(requirements, actor_id)
+        if self.cache_key is not None:
+            self.cache_generation = self.cache.generation
+            if self.cache.lookup(self.cache_key, self._cached_placements):
+                if _log.analyzing:
+                    _log.analyze(self.node.id, "+ CACHED", {'actor_id': self.actor_id})
+                return
+        self._collecting = False
+        self._collect_again = False
         self.node_iter = self._build_match()
         self.possible_placements = set([])
-        self.done = False
         self.node_iter.set_cb(self._collect_placements)
-        _log.analyze(self.node.id, "+ CALL CB", {'actor_id': self.actor_id, 'node_iter': str(self.node_iter)})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ CALL CB", {'actor_id': self.actor_id, 'node_iter': str(self.node_iter)})
         # Must call it since the triggers might already have released before cb set
         self._collect_placements()
-        _log.analyze(self.node.id, "+ END", {'actor_id': self.actor_id, 'node_iter': str(self.node_iter)})
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ END", {'actor_id': self.actor_id, 'node_iter': str(self.node_iter)})
         
     def _build_match(self):
         intersection_iters = []
@@ -87,7 +171,8 @@ class ReqMatch(object):
                 intersection_iters.append(self._build_union_match(req=req).set_name("SActor" + self.actor_id))
             else:
                 try:
-                    _log.analyze(self.node.id, "+ REQ OP", {'op': req['op'], 'kwargs': req['kwargs']})
+                    if _log.analyzing:
+                        _log.analyze(self.node.id, "+ REQ OP", {'op': req['op'], 'kwargs': req['kwargs']})
                     it = req_operations[req['op']].req_op(self.node,
                                             actor_id=self.actor_id,
                                             component=self.component_ids,
@@ -119,38 +204,57 @@ class ReqMatch(object):
                 _log.error("union_requirements one req failed for %s!!!" % self.actor_id, exc_info=True)
         return dynops.Union(*union_iters)
 
+    def _cached_placements(self, possible_placements):
+        self.done = True
+        self.possible_placements = possible_placements
+        if callable(self.callback):
+            status = response.CalvinResponse(True if possible_placements else False)
+            self.callback(possible_placements=possible_placements, status=status)
+
     def _collect_placements(self):
-        _log.analyze(self.node.id, "+ BEGIN", {}, tb=True)
-        if self._collect_placement_cb:
-            self._collect_placement_cb.cancel()
-            self._collect_placement_cb = None
+        """ Triggered by the node iterable when it has new elements or is final """
+        if _log.analyzing:
+            _log.analyze(self.node.id, "+ BEGIN", {}, tb=True)
         if self.done:
             return
+        if self._collecting:
+            # Triggered while iterating, take another round when done
+            self._collect_again = True
+            return
+        self._collecting = True
         try:
             while True:
-                _log.analyze(self.node.id, "+ ITER", {})
-                node_id = self.node_iter.next()
-                self.possible_placements.add(node_id)
-        except dynops.PauseIteration:
-            _log.analyze(self.node.id, "+ PAUSED",
-                    {'counter': self._collect_placement_counter,
-                     'last_value': self._collect_placement_last_value,
-                     'diff': self._collect_placement_counter - self._collect_placement_last_value})
-            # FIXME the dynops should be self triggering, but is not...
-            # This is a temporary fix by keep trying
-            delay = 0.0 if self._collect_placement_counter > self._collect_placement_last_value + 100 else 0.2
-            self._collect_placement_counter += 1
-            self._collect_placement_cb = async.DelayedCall(delay, self._collect_placements)
-            return
-        except StopIteration:
-            # All possible actor placements derived
-            _log.analyze(self.node.id, "+ ALL", {})
-            self.done = True
-            if callable(self.callback):
-                status = response.CalvinResponse(True if self.possible_placements else False)
-                self.callback(possible_placements=self.possible_placements, status=status)
-                return
-            _log.analyze(self.node.id, "+ END", {})
+                self._collect_again = False
+                try:
+                    while True:
+                        if _log.analyzing:
+                            _log.analyze(self.node.id, "+ ITER", {})
+                        node_id = self.node_iter.next()
+                        self.possible_placements.add(node_id)
+                except dynops.PauseIteration:
+                    # The node iterable will trigger us when it has more
+                    if _log.analyzing:
+                        _log.analyze(self.node.id, "+ PAUSED", {})
+                    if self._collect_again:
+                        continue
+                    return
+                except StopIteration:
+                    # All possible actor placements derived
+                    if _log.analyzing:
+                        _log.analyze(self.node.id, "+ ALL", {})
+                    self.done = True
+                    if self.cache_key is not None:
+                        self.cache.done(self.cache_key, self.possible_placements, self.cache_generation)
+                    if callable(self.callback):
+                        status = response.CalvinResponse(True if self.possible_placements else False)
+                        self.callback(possible_placements=self.possible_placements, status=status)
+                        return
+                    if _log.analyzing:
+                        _log.analyze(self.node.id, "+ END", {})
+                    return
         except:
             _log.exception("ReqMatch:_collect_placements")
-
+            if self.cache_key is not None:
+                self.cache.abort(self.cache_key)
+        finally:
+            self._collecting = False
@@ -27,6 +27,8 @@ import time
 import random
 import shutil
 import socket
+import hashlib
+from collections import OrderedDict
 from calvin.utilities import confsort
 import OpenSSL
 from cryptography.x509 import load_pem_x509_certificate
@@ -54,6 +56,25 @@ TRUSTSTORE_TRANSPORT ="truststore_for_transport"
 TRUSTSTORE_SIGN ="truststore_for_signing"
 
 
+def verify_signatures(checks):
+    """
+    Verify a list of (cert_OpenSSL, signature, data), a missing certificate
+    fails the check. Returns a list of True/False in the same order. Only
+    OpenSSL is used, hence it can be run in another thread.
+    """
+    results = []
+    for cert_OpenSSL, signature, data in checks:
+        try:
+            if cert_OpenSSL is None:
+                raise Exception("No verified certificate")
+            OpenSSL.crypto.verify(cert_OpenSSL, signature, data, "sha256")
+            results.append(True)
+        except Exception as err:
+            _log.debug("Batch signature verification failed, err={}".format(err))
+            results.append(False)
+    return results
+
+
 class RuntimeCredentials():
     """
     Create new runtime certificate.
@@ -361,6 +382,11 @@ class RuntimeCredentials():
                 _log.error("creation of new runtime credentials failed")
                 raise
         self.cert_name = self.get_own_cert_name()
+        # Loaded private key, and verified certificates keyed by (type, fingerprint)
+        self._signing_key = None
+        self._verified_certs = OrderedDict()
+        self._verified_certs_size = _conf.get(None, 'cert_cache_size') or 256
+        self._stored_certs = set()
         if enrollment_password:
             self.cert_enrollment_encrypt_csr()
 
@@ -806,29 +832,33 @@ class RuntimeCredentials():
             raise
         return encrypted_csr
 
+    def _get_signing_key(self):
+        """
+        Return the private key as OpenSSL object, loaded once. The first
+        time the key is checked against the own certificate.
+        """
+        if self._signing_key is None:
+            private_key = OpenSSL.crypto.load_privatekey(OpenSSL.crypto.FILETYPE_PEM,
+                                                        self.get_private_key(), '')
+            try:
+                cert = self.get_own_cert_as_openssl_object()
+                check = OpenSSL.crypto.sign(private_key, "check", "sha256")
+                OpenSSL.crypto.verify(cert, check, "check", "sha256")
+            except Exception as err:
+                _log.error("Failed to verify signature, err={}".format(err))
+                raise
+            self._signing_key = private_key
+        return self._signing_key
+
     def sign_data(self, data):
         _log.debug("sign_data, data={}".format(data))
-        from OpenSSL import crypto
-        private_key_str = self.get_private_key()
         try:
-            private_key = OpenSSL.crypto.load_privatekey(OpenSSL.crypto.FILETYPE_PEM,
-                                                        private_key_str, '')
-            signature = OpenSSL.crypto.sign(private_key,
+            signature = OpenSSL.crypto.sign(self._get_signing_key(),
                                             data,
                                             "sha256")
         except Exception as err:
             _log.error("Failed to sign data, err={}".format(err))
             raise
-        try:
-            certstr =  self.get_own_cert_as_string()
-            cert =  self.get_own_cert_as_openssl_object()
-            OpenSSL.crypto.verify(cert,
-                                 signature,
-                                 data,
-                                 "sha256")
-        except Exception as err:
-            _log.error("Failed to verify signature, err={}".format(err))
-            raise
         return signature
 
     def verify_signed_data_from_certname(self,  signature, data, type, certname):
@@ -850,11 +880,51 @@ class RuntimeCredentials():
                                               data,
                                               type))
 
+    def get_verified_certificate(self, certstring, type):
+        """
+        Return the certificate as OpenSSL object, verified against the truststore
+        of type. Verified certificates are cached on fingerprint, a cache hit
+        only checks that the certificate has not expired. The certificate is
+        not stored, see store_verified_certificate.
+        """
+        fingerprint = (type, hashlib.sha256(certstring).digest())
+        cert_OpenSSL = self._verified_certs.get(fingerprint)
+        if cert_OpenSSL is not None:
+            if not cert_OpenSSL.has_expired():
+                return cert_OpenSSL
+            self._verified_certs.pop(fingerprint, None)
+        cert_OpenSSL = self.verify_certificate(certstring, type)
+        if len(self._verified_certs) >= self._verified_certs_size:
+            self._verified_certs.popitem(last=False)
+        self._verified_certs[fingerprint] = cert_OpenSSL
+        return cert_OpenSSL
+
+    def store_verified_certificate(self, certstring):
+        """
+        Store a certificate in the others folder after a signature made with it
+        has been verified, only once for each certificate.
+        """
+        fingerprint = hashlib.sha256(certstring).digest()
+        if fingerprint in self._stored_certs:
+            return
+        try:
+            self.store_others_cert(certstring=certstring)
+        except Exception as err:
+            _log.error("Failed to store certificate, err={}".format(err))
+            raise
+        if len(self._stored_certs) >= self._verified_certs_size:
+            self._stored_certs.clear()
+        self._stored_certs.add(fingerprint)
+
+    def clear_verified_certificates(self):
+        """Forget verified certificates, e.g. after a truststore update"""
+        self._verified_certs.clear()
+        self._stored_certs.clear()
+
     def verify_signed_data_from_certstring(self, certstring, signature, data, type, callback=None):
-        from OpenSSL import crypto
         _log.debug("verify_signed_data_from_certstring:\n\tcertstring={}\n\tdata={}\n\tsignature={}\n\ttype={}".format(certstring, data, signature, type))
         try:
-            cert_OpenSSL = self.verify_certificate(certstring, type)
+            cert_OpenSSL = self.get_verified_certificate(certstring, type)
         except Exception as err:
             _log.error("Certificate verification failed, err={}".format(err))
             raise
@@ -867,12 +937,48 @@ class RuntimeCredentials():
             _log.error("Signature verification failed, err={}\n\tcertstring={}\n\tdata={}\n\tsignature={}".format(err,certstring, data, signature))
             raise
         _log.debug("verify_signed_data_from_certstring: signature is ok")
-        try:
-            path = self.store_others_cert(certstring=certstring)
-        except Exception as err:
-            _log.error("Failed to store certificate, err={}".format(err))
-            raise
+        self.store_verified_certificate(certstring)
         if callback:
             callback()
 
+    def get_verified_certificates(self, signed, type):
+        """
+        Replace the certificate strings in a list of (certstring, signature, data)
+        with the verified certificates as OpenSSL objects, or None when not valid,
+        each certificate is verified once. Used with verify_signatures.
+        """
+        certs = {}
+        checks = []
+        for certstring, signature, data in signed:
+            if certstring not in certs:
+                try:
+                    certs[certstring] = self.get_verified_certificate(certstring, type)
+                except Exception as err:
+                    _log.debug("Batch certificate verification failed, err={}".format(err))
+                    certs[certstring] = None
+            checks.append((certs[certstring], signature, data))
+        return checks
+
+    def store_verified_certificates(self, signed, results):
+        """
+        Store the certificates of the verified signatures, results as returned
+        by verify_signatures. A certificate that can't be stored fails the check.
+        """
+        results = list(results)
+        for i, (certstring, signature, data) in enumerate(signed):
+            if results[i]:
+                try:
+                    self.store_verified_certificate(certstring)
+                except Exception:
+                    results[i] = False
+        return results
+
+    def verify_signed_data_batch(self, signed, type):
+        """
+        Verify a list of (certstring, signature, data), each certificate is
+        verified once. Returns a list of True/False in the same order.
+        """
+        results = verify_signatures(self.get_verified_certificates(signed, type))
+        return self.store_verified_certificates(signed, results)
+
 
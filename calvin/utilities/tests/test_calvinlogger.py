@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import pytest
+
+from calvin.utilities.calvinlogger import get_logger
+
+pytestmark = pytest.mark.unittest
+
+
+def test_analyzing_flag():
+    analyzing = logging.Logger.analyzing
+    log = get_logger("test_analyzing_flag")
+    try:
+        logging.Logger.analyzing = False
+        log.setLevel(logging.DEBUG)
+        assert not log.analyzing
+        log.setLevel(logging.NOTSET)
+        assert not log.analyzing
+        log.setLevel("ANALYZE")
+        assert log.level == 5
+        assert log.analyzing
+        assert get_logger("another").analyzing
+    finally:
+        log.setLevel(logging.NOTSET)
+        logging.Logger.analyzing = analyzing
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from calvin.utilities import dynops
+
+pytestmark = pytest.mark.unittest
+
+
+class Collector(object):
+    """ Iterates the dynops when triggered, like ReqMatch does """
+
+    def __init__(self, it):
+        self.it = it
+        self.elems = set([])
+        self.done = False
+        self.triggers = 0
+        it.set_cb(self.trigger)
+
+    def trigger(self):
+        self.triggers += 1
+        try:
+            while True:
+                self.elems.add(self.it.next())
+        except dynops.PauseIteration:
+            pass
+        except StopIteration:
+            self.done = True
+
+
+def test_union():
+    l1 = dynops.List()
+    l2 = dynops.List()
+    c = Collector(dynops.Union(l1, [1, 2], l2))
+    l1.extend([2, 3])
+    assert c.elems == set([1, 2, 3])
+    l2.append(4)
+    l1.final()
+    assert not c.done
+    l2.final()
+    assert c.done
+    assert c.elems == set([1, 2, 3, 4])
+
+
+def test_intersection():
+    l1 = dynops.List()
+    l2 = dynops.List()
+    c = Collector(dynops.Intersection(l1, l2, dynops.Infinite()))
+    l1.extend([1, 2, 3])
+    assert c.triggers == 0
+    l2.extend([3, 4])
+    assert c.elems == set([3])
+    l2.append(1)
+    assert c.elems == set([1, 3])
+    l2.final()
+    assert not c.done
+    # All of l2 produced, no need to wait for l1 to be final
+    l1.append(4)
+    assert c.done
+    assert c.elems == set([1, 3, 4])
+
+
+def test_intersection_infinite():
+    c = Collector(dynops.Intersection(dynops.Infinite()))
+    c.trigger()
+    assert c.done
+    assert len(c.elems) == 1 and dynops.is_infinite(c.elems.pop())
+    l1 = dynops.List()
+    l2 = dynops.List([5])
+    c = Collector(dynops.Intersection(l1, l2))
+    l1.append(dynops.InfiniteElement())
+    assert c.elems == set([5])
+
+
+def test_difference():
+    l1 = dynops.List()
+    l2 = dynops.List()
+    c = Collector(dynops.Difference(dynops.Intersection(l1, [1, 2, 3, 4]), l2))
+    l1.extend([1, 2, 3])
+    l2.append(2)
+    # Nothing until the removes are final
+    assert c.elems == set([])
+    l2.final()
+    assert c.elems == set([1, 3])
+    l1.append(4)
+    l1.final()
+    assert c.done
+    assert c.elems == set([1, 3, 4])
+
+
+def test_difference_infinite_first():
+    # Only '-' requirements, the intersection of nothing is infinite
+    l2 = dynops.List()
+    c = Collector(dynops.Difference(dynops.Intersection(), l2))
+    c.trigger()
+    assert not c.elems
+    l2.extend([1, 2])
+    l2.final()
+    assert c.done
+    assert len(c.elems) == 1 and dynops.is_infinite(c.elems.pop())
+    # Removing an infinite set leaves nothing
+    c = Collector(dynops.Difference(dynops.Intersection(), dynops.Infinite()))
+    c.trigger()
+    assert c.done
+    assert not c.elems
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from calvin.utilities.histogram import Histogram
+
+pytestmark = pytest.mark.unittest
+
+
+def test_bucket_precision():
+    h = Histogram()
+    for v in [0, 1, 15, 16, 17, 1000, 123456789]:
+        low, width = Histogram.bucket_range(h._index(v))
+        assert low <= v < low + width
+        assert width == 1 or float(width) / low <= 1.0 / Histogram.SUB_BUCKETS
+
+
+def test_percentiles():
+    h = Histogram()
+    for v in range(1, 10001):
+        h.record(v)
+    s = h.summary()
+    assert s['count'] == 10000
+    assert s['min'] == 1
+    assert s['max'] == 10000
+    assert abs(s['p50'] - 5000) <= 5000 / Histogram.SUB_BUCKETS
+    assert abs(s['p99'] - 9900) <= 9900 / Histogram.SUB_BUCKETS
+    assert h.buckets()[-1][1] == 10000
+
+
+def test_merge_reset():
+    a = Histogram()
+    b = Histogram()
+    a.record(10)
+    b.record(1000, count=3)
+    a.merge(b)
+    assert a.count == 4
+    assert a.sum == 3010
+    assert a.min == 10
+    assert a.max == 1000
+    a.reset()
+    assert a.count == 0
+    assert a.percentile(50) == 0
+    # Out of range values end up in the last bucket
+    a.record(1 << 60)
+    assert a.counts[-1] == 1
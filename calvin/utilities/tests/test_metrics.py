@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from calvin.utilities.metrics import Metrics
+
+pytestmark = pytest.mark.unittest
+
+
+def test_record_and_summary():
+    m = Metrics()
+    m.record('scheduler_actors_fired', 3)
+    m.record('scheduler_actors_fired', 5)
+    m.record_time('storage_op_seconds', 1.0, 1.5, op="get")
+    assert m.histogram('scheduler_actors_fired') is m.histogram('scheduler_actors_fired')
+    summary = {(s['name'], tuple(s['labels'].items())): s['summary'] for s in m.summary()}
+    assert summary[('scheduler_actors_fired', ())]['count'] == 2
+    assert summary[('storage_op_seconds', (('op', "get"),))]['sum'] == 500000
+
+
+def test_unknown_metric():
+    with pytest.raises(KeyError):
+        Metrics().record('no_such_metric', 1)
+
+
+def test_prometheus():
+    m = Metrics()
+    m.record('queue_occupancy_tokens', 2, actor_id="a1", port_id="p1")
+    m.record('queue_occupancy_tokens', 4, actor_id="a1", port_id="p1")
+    m.record_time('link_rtt_seconds', 0.0, 0.002, peer_node_id="n1")
+    lines = m.prometheus().splitlines()
+    assert "# TYPE calvin_queue_occupancy_tokens histogram" in lines
+    assert 'calvin_queue_occupancy_tokens_bucket{actor_id="a1",port_id="p1",le="2"} 1' in lines
+    assert 'calvin_queue_occupancy_tokens_bucket{actor_id="a1",port_id="p1",le="+Inf"} 2' in lines
+    assert 'calvin_queue_occupancy_tokens_sum{actor_id="a1",port_id="p1"} 6' in lines
+    assert 'calvin_link_rtt_seconds_count{peer_node_id="n1"} 1' in lines
+    assert len([l for l in lines if l.startswith("# HELP")]) == 2
+
+
+def test_remove_by_label():
+    m = Metrics()
+    m.record('queue_occupancy_tokens', 1, actor_id="a1", port_id="p1")
+    m.record('queue_occupancy_tokens', 1, actor_id="a2", port_id="p1")
+    m.remove(actor_id="a1")
+    assert [s['labels']['actor_id'] for s in m.summary()] == ["a2"]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from calvin.utilities.placement import add_edge, greedy_placement
+
+pytestmark = pytest.mark.unittest
+
+
+def test_connected_together():
+    edges = {}
+    add_edge(edges, "a", "b", 1.0)
+    add_edge(edges, "b", "c", 0.5)
+    possible = {"a": set(["n1"]), "b": set(["n1", "n2"]), "c": set(["n1", "n2"]), "d": set(["n1", "n2"])}
+    placement = greedy_placement(["a", "b", "c", "d"], possible, edges)
+    assert placement["a"] == ["n1"]
+    assert placement["b"][0] == "n1"
+    assert placement["c"][0] == "n1"
+    # Unconnected goes to least loaded
+    assert placement["d"][0] == "n2"
+    assert sorted(placement["d"]) == ["n1", "n2"]
+
+
+def test_capacity_and_anchors():
+    edges = {}
+    for i in range(3):
+        add_edge(edges, "a%d" % i, "a%d" % (i + 1), 1.0)
+    possible = {"a%d" % i: set(["n1", "n2", "n3"]) for i in range(4)}
+    possible["e"] = set(["n1", "n2", "n3"])
+    placement = greedy_placement(possible.keys(), possible, edges,
+                                 anchors={"e": {"n3": 0.5}}, capacity={"n1": 2})
+    assert [placement["a%d" % i][0] for i in range(4)].count("n1") == 2
+    assert placement["e"][0] == "n3"
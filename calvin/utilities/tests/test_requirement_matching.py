@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from mock import Mock
+
+from calvin.utilities import dynops
+from calvin.utilities.requirement_matching import ReqMatch, PlacementCache
+
+pytestmark = pytest.mark.unittest
+
+REQS = [{'op': 'node_attr_match', 'kwargs': {'index': ['node_name', {'organization': 'org'}]}, 'type': '+'},
+        {'op': 'actor_reqs_match', 'kwargs': {'requires': ['io.stdout']}, 'type': '+'},
+        {'op': 'current_node', 'kwargs': {}, 'type': '-'}]
+
+
+def make_node():
+    node = Mock(id="node1")
+    node.placement_cache = PlacementCache(ttl=10)
+    node.lists = []
+
+    def get_index_iter(index, include_key=False):
+        it = dynops.List()
+        node.lists.append(it)
+        return it
+    node.storage.get_index_iter = get_index_iter
+    return node
+
+
+def test_match():
+    node = make_node()
+    cb = Mock()
+    ReqMatch(node, callback=cb).match(REQS, actor_id="actor1")
+    for it in node.lists:
+        it.extend(["node1", "node2", "node3"])
+        it.final()
+    assert cb.call_args[1]['possible_placements'] == set(["node2", "node3"])
+
+
+def test_cached_match():
+    node = make_node()
+    cb1 = Mock()
+    cb2 = Mock()
+    ReqMatch(node, callback=cb1).match(REQS, actor_id="actor1")
+    # Same requirements while ongoing waits for the first
+    ReqMatch(node, callback=cb2).match(REQS, actor_id="actor2")
+    assert len(node.lists) == 2
+    for it in node.lists:
+        it.extend(["node2"])
+        it.final()
+    assert cb1.call_args[1]['possible_placements'] == set(["node2"])
+    assert cb2.call_args[1]['possible_placements'] == set(["node2"])
+    # Later a cached result
+    cb3 = Mock()
+    ReqMatch(node, callback=cb3).match(REQS, actor_id="actor3")
+    assert cb3.call_args[1]['possible_placements'] == set(["node2"])
+    assert len(node.lists) == 2
+    # Not after invalidation
+    node.placement_cache.invalidate()
+    ReqMatch(node, callback=Mock()).match(REQS, actor_id="actor3")
+    assert len(node.lists) == 4
+
+
+def test_cache_key():
+    cache = PlacementCache(ttl=10)
+    assert cache.key(REQS, "actor1") == cache.key(REQS, "actor2")
+    reqs = REQS + [{'op': 'replica_nodes', 'kwargs': {}, 'type': '-'}]
+    assert cache.key(reqs, "actor1") != cache.key(reqs, "actor2")
+    assert cache.key([{'op': 'no_such_op', 'kwargs': {}, 'type': '+'}]) is None
+    assert PlacementCache(ttl=0).key(REQS) is None
+
+
+def test_cached_match_abort():
+    node = make_node()
+    cb1 = Mock()
+    cb2 = Mock()
+    first = ReqMatch(node, callback=cb1)
+    first.match(REQS, actor_id="actor1")
+    ReqMatch(node, callback=cb2).match(REQS, actor_id="actor2")
+    # The first match fails, the waiting one is not left hanging
+    first.node_iter = Mock()
+    first.node_iter.next.side_effect = ValueError
+    first._collect_placements()
+    assert not cb1.called
+    assert cb2.call_args[1]['possible_placements'] == set([])
+    assert not cb2.call_args[1]['status']
+    assert not node.placement_cache.ongoing and not node.placement_cache.placements
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+import pytest
+from mock import Mock, patch
+
+from calvin.utilities.runtime_credentials import RuntimeCredentials
+
+pytestmark = pytest.mark.unittest
+
+
+def credentials(cache_size=2):
+    # Skip the __init__, it creates keys and certificates on disk
+    with patch.object(RuntimeCredentials, '__init__', return_value=None):
+        rc = RuntimeCredentials("test")
+    rc._signing_key = None
+    rc._verified_certs = OrderedDict()
+    rc._verified_certs_size = cache_size
+    rc._stored_certs = set()
+    rc.verify_certificate = Mock(side_effect=lambda certstring, type: Mock(name=certstring, **{'has_expired.return_value': False}))
+    rc.store_others_cert = Mock()
+    return rc
+
+
+def test_verified_certificate_cache():
+    rc = credentials()
+    cert = rc.get_verified_certificate("cert1", "truststore_for_transport")
+    assert rc.get_verified_certificate("cert1", "truststore_for_transport") is cert
+    assert rc.verify_certificate.call_count == 1
+    # Only stored when a signature has been verified
+    assert not rc.store_others_cert.called
+    # Expired certificates are verified again
+    cert.has_expired.return_value = True
+    assert rc.get_verified_certificate("cert1", "truststore_for_transport") is not cert
+    assert rc.verify_certificate.call_count == 2
+    # Oldest is evicted when full
+    rc.get_verified_certificate("cert2", "truststore_for_transport")
+    rc.get_verified_certificate("cert3", "truststore_for_transport")
+    assert len(rc._verified_certs) == 2
+    rc.get_verified_certificate("cert1", "truststore_for_transport")
+    assert rc.verify_certificate.call_count == 5
+
+
+@patch('calvin.utilities.runtime_credentials.OpenSSL.crypto.verify')
+def test_verify_signed_data_batch(verify_mock):
+    rc = credentials()
+
+    def verify(cert, signature, data, digest):
+        if signature == "bad":
+            raise Exception("Bad signature")
+    verify_mock.side_effect = verify
+    results = rc.verify_signed_data_batch([("cert1", "sig", "data"), ("cert1", "bad", "data"),
+                                           ("cert2", "sig", "data")], "truststore_for_transport")
+    assert results == [True, False, True]
+    assert rc.verify_certificate.call_count == 2
+    assert rc.store_others_cert.call_count == 2
+
+
+@patch('calvin.utilities.runtime_credentials.OpenSSL.crypto.verify')
+def test_bad_signature_not_stored(verify_mock):
+    rc = credentials()
+    verify_mock.side_effect = Exception("Bad signature")
+    with pytest.raises(Exception):
+        rc.verify_signed_data_from_certstring("cert1", "bad", "data", "truststore_for_transport")
+    assert not rc.store_others_cert.called
+    verify_mock.side_effect = None
+    rc.verify_signed_data_from_certstring("cert1", "sig", "data", "truststore_for_transport")
+    rc.verify_signed_data_from_certstring("cert1", "sig", "data", "truststore_for_transport")
+    rc.store_others_cert.assert_called_once_with(certstring="cert1")
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import pytest
+
+from calvin.utilities import trace_recorder
+from calvin.utilities.trace_recorder import TraceRecorder, FIRING, TOKEN_SEND, STORAGE_OP
+
+pytestmark = pytest.mark.unittest
+
+
+def test_ring_keeps_latest():
+    trace = TraceRecorder()
+    trace.start("node1", size=3)
+    assert trace.enabled
+    for i in range(5):
+        trace.record(TOKEN_SEND, "port1", "peer1", 100.0 + i, 0.0, i)
+    records = trace.records()
+    assert [r[5] for r in records] == [2, 3, 4]
+    assert records[0] == (102.0, TOKEN_SEND, "port1", "peer1", 0.0, 2)
+
+
+def test_disabled_by_default():
+    trace = TraceRecorder()
+    trace.start("node1", size=0)
+    assert not trace.enabled
+    assert trace.records() == []
+
+
+def test_name_table_bounded():
+    trace = TraceRecorder()
+    trace.start("node1", size=10, max_names=4)
+    trace.record(FIRING, "actor1", "action1", 1.0, 0.5)
+    trace.record(FIRING, "actor2", "action1", 2.0, 0.5)
+    trace.record(FIRING, "actor3", "action1", 3.0, 0.5)
+    assert trace.records() == [(3.0, FIRING, "actor3", "action1", 0.5, 0)]
+
+
+def test_dump_and_convert(tmpdir):
+    trace = TraceRecorder()
+    trace.start("node1", size=10)
+    trace.record(FIRING, "actor1", "action1", 1.0, 0.5)
+    trace.record(STORAGE_OP, "get", "actor-", 2.0, 0.25)
+    filename = trace.dump(str(tmpdir.join("trace.bin")))
+    node_id, records = trace_recorder.load(filename)
+    assert node_id == "node1"
+    assert records == trace.records()
+    chrome = json.loads(json.dumps(trace_recorder.chrome_trace([(node_id, records)])))
+    durations = [e for e in chrome['traceEvents'] if e['ph'] == "X"]
+    assert durations[0]['name'] == "action1"
+    assert durations[0]['ts'] == 1000000.0
+    assert durations[0]['dur'] == 500000.0
+    assert durations[1]['name'] == "get actor-"
+
+
+def test_large_sequence_numbers(tmpdir):
+    trace = TraceRecorder()
+    trace.start("node1", size=10)
+    trace.record(TOKEN_SEND, "port1", "peer1", 1.0, 0.0, 2**31)
+    trace.record(TOKEN_SEND, "port1", "peer1", 2.0, 0.0, 2**40)
+    assert [r[5] for r in trace.records()] == [2**31, 2**40]
+    node_id, records = trace_recorder.load(trace.dump(str(tmpdir.join("trace.bin"))))
+    assert records == trace.records()
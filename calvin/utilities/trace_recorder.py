@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 Ericsson AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import struct
+import tempfile
+import time
+
+from calvin.utilities import calvinconfig
+from calvin.utilities import calvinlogger
+
+_conf = calvinconfig.get()
+_log = calvinlogger.get_logger(__name__)
+
+# Event types
+FIRING = 0          # subject: actor id, detail: action name
+TOKEN_SEND = 1      # subject: port id, detail: peer port id, value: sequence number
+TOKEN_ACK = 2       # subject: port id, detail: peer port id, value: sequence number
+MIGRATE = 3         # subject: actor id, detail: destination node id
+STORAGE_OP = 4      # subject: operation, detail: key prefix
+
+EVENT_NAMES = ["firing", "token_send", "token_ack", "migrate", "storage_op"]
+
+# start time, event type, subject name index, detail name index, duration, value (unsigned 64 bit)
+RECORD = struct.Struct("<dBIIdQ")
+MAGIC = "CALVINTR"
+VERSION = 2
+HEADER = struct.Struct("<8sBI")
+LENGTH = struct.Struct("<I")
+
+_trace = None
+
+
+def get():
+    """ Returns the TraceRecorder singleton, not recording until started """
+    global _trace
+    if _trace is None:
+        _trace = TraceRecorder()
+    return _trace
+
+
+class TraceRecorder(object):
+    """
+    In memory trace of runtime events as fixed size binary records in a ring buffer,
+    the oldest records are overwritten. Strings (ids, names) are stored once in a
+    name table and referenced by index.
+    Call sites check the enabled attribute before recording.
+    """
+
+    def __init__(self):
+        super(TraceRecorder, self).__init__()
+        self.enabled = False
+        self.node_id = ""
+        self.size = 0
+        self.max_names = 0
+        self._buffer = None
+        self._next = 0
+        self._names = []
+        self._name_index = {}
+
+    def start(self, node_id, size=None, max_names=None):
+        """ Start recording, size records from trace_recorder_size (0 disables) """
+        self.node_id = node_id
+        self.size = size if size is not None else (_conf.get(None, 'trace_recorder_size') or 0)
+        self.max_names = max_names or _conf.get(None, 'trace_recorder_max_names') or 65536
+        self.clear()
+        self.enabled = self.size > 0
+
+    def stop(self):
+        self.enabled = False
+        self._buffer = None
+
+    def clear(self):
+        self._buffer = bytearray(self.size * RECORD.size) if self.size > 0 else None
+        self._next = 0
+        self._names = []
+        self._name_index = {}
+
+    def _name(self, name):
+        index = self._name_index.get(name)
+        if index is None:
+            index = self._name_index[name] = len(self._names)
+            self._names.append(name)
+        return index
+
+    def record(self, event, subject, detail="", start=None, duration=0.0, value=0):
+        """ Record event at start (time.time()) with duration in seconds """
+        if start is None:
+            start = time.time()
+        if len(self._names) + 2 > self.max_names:
+            # Keep the memory bounded, old records would refer to dropped names
+            self.clear()
+        subject = self._name(subject)
+        detail = self._name(detail)
+        RECORD.pack_into(self._buffer, (self._next % self.size) * RECORD.size,
+                         start, event, subject, detail, duration, value)
+        self._next += 1
+
+    def _raw(self):
+        """ The recorded records in order, oldest first """
+        if not self._buffer:
+            return []
+        first = max(self._next - self.size, 0)
+        return [RECORD.unpack_from(self._buffer, (i % self.size) * RECORD.size) for i in xrange(first, self._next)]
+
+    def records(self):
+        """ The recorded events, oldest first, as (start, event, subject, detail, duration, value) """
+        return resolve(self._raw(), self._names)
+
+    def dump(self, filename=None):
+        """ Write the records to filename, default a new file in trace_dump_dir, returns the filename """
+        if filename is None:
+            directory = _conf.get(None, 'trace_dump_dir') or tempfile.gettempdir()
+            fd, filename = tempfile.mkstemp(prefix="calvin_trace_", suffix=".bin", dir=directory)
+            os.close(fd)
+        raw = self._raw()
+        with open(filename, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self._names)))
+            _write_string(f, self.node_id)
+            for name in self._names:
+                _write_string(f, name)
+            f.write(LENGTH.pack(len(raw)))
+            for r in raw:
+                f.write(RECORD.pack(*r))
+        _log.info("Dumped %d trace records to %s" % (len(raw), filename))
+        return filename
+
+
+def _write_string(f, s):
+    s = s.encode('utf-8') if isinstance(s, unicode) else str(s)
+    f.write(LENGTH.pack(len(s)))
+    f.write(s)
+
+
+def _read_string(f):
+    length, = LENGTH.unpack(f.read(LENGTH.size))
+    return f.read(length).decode('utf-8')
+
+
+def resolve(raw, names):
+    return [(start, event, names[subject], names[detail], duration, value)
+            for start, event, subject, detail, duration, value in raw]
+
+
+def load(filename):
+    """ Read a dump, returns node id and list of (start, event, subject, detail, duration, value) """
+    with open(filename, 'rb') as f:
+        magic, version, nbr_names = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not a calvin trace dump" % filename)
+        if version != VERSION:
+            raise ValueError("%s is a version %d calvin trace dump, expected version %d" % (filename, version, VERSION))
+        node_id = _read_string(f)
+        names = [_read_string(f) for _ in xrange(nbr_names)]
+        nbr_records, = LENGTH.unpack(f.read(LENGTH.size))
+        raw = [RECORD.unpack(f.read(RECORD.size)) for _ in xrange(nbr_records)]
+    return node_id, resolve(raw, names)
+
+
+def chrome_trace(dumps):
+    """
+    Convert loaded dumps, list of (node id, records), to the Chrome trace event format (a dict to dump as JSON).
+    Each runtime is a process, with a thread per actor, port or storage operation.
+    """
+    events = []
+    for pid, (node_id, records) in enumerate(dumps):
+        events.append({'name': "process_name", 'ph': "M", 'pid': pid, 'args': {'name': node_id}})
+        tids = {}
+        for start, event, subject, detail, duration, value in records:
+            if subject not in tids:
+                tids[subject] = len(tids)
+                events.append({'name': "thread_name", 'ph': "M", 'pid': pid, 'tid': tids[subject],
+                               'args': {'name': subject}})
+            e = {'cat': EVENT_NAMES[event], 'pid': pid, 'tid': tids[subject], 'ts': start * 1000000}
+            if event == FIRING:
+                e.update({'name': detail, 'ph': "X", 'dur': duration * 1000000})
+            elif event == STORAGE_OP:
+                e.update({'name': "%s %s" % (subject, detail), 'ph': "X", 'dur': duration * 1000000})
+            elif event == MIGRATE:
+                e.update({'name': "migrate", 'ph': "i", 's': "t", 'args': {'to': detail}})
+            else:
+                e.update({'name': EVENT_NAMES[event], 'ph': "i", 's': "t",
+                          'args': {'peer_port_id': detail, 'sequencenbr': value}})
+                if event == TOKEN_ACK:
+                    e['args']['latency'] = duration
+            events.append(e)
+    return {'traceEvents': events, 'displayTimeUnit': "ms"}